@@ -0,0 +1,91 @@
+# Acquisition threads for the host scripts: every device queue is drained by its own thread so
+# that showing, printing or saving never decides how fast the device data is read.
+#
+# QueueReader blocks on one DepthAI output queue (the blocking get releases the GIL) and hands each
+# message to a handler. LatestSlot is what a handler usually writes to: it keeps only the newest
+# value, a reader (the render loop) takes whatever is newest when it gets to it and the count of
+# values it never saw is kept.
+import threading
+import time
+from datetime import timedelta
+
+
+class LatestSlot:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.seq = 0  # number of values put so far
+        self.time = None  # host time of the last put
+        self.read_seq = 0
+        self.skipped = 0  # values overwritten before anyone read them
+
+    def put(self, value):
+        with self.lock:
+            if self.seq > self.read_seq:
+                self.skipped += 1
+            self.value = value
+            self.seq += 1
+            self.time = time.perf_counter()
+
+    def get(self):
+        # (value, new) with new False when nothing was put since the last get
+        with self.lock:
+            new = self.seq > self.read_seq
+            self.read_seq = self.seq
+            return self.value, new
+
+    def peek(self):
+        with self.lock:
+            return self.value
+
+
+class QueueReader(threading.Thread):
+    def __init__(self, queue, handler, name=None, poll=0.1):
+        # handler(msg) runs on this thread; poll is how often (s) the stop flag is checked while idle
+        super().__init__(name=name, daemon=True)
+        self.queue = queue
+        self.handler = handler
+        self.timeout = timedelta(seconds=poll)
+        self.stopping = threading.Event()
+        self.received = 0
+        self.errors = 0
+        self.start_time = None
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        while not self.stopping.is_set():
+            try:
+                msg, timed_out = self.queue.get(self.timeout)
+            except RuntimeError:
+                break  # device closed
+            if timed_out or msg is None:
+                continue
+            self.received += 1
+            try:
+                self.handler(msg)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in {self.name}: {e}")
+
+    def rate(self):
+        if self.start_time is None:
+            return 0.0
+        return self.received / max(time.perf_counter() - self.start_time, 1e-9)
+
+    def stop(self):
+        self.stopping.set()
+
+
+def start_readers(queues):
+    # {name: (queue, handler)} -> {name: started QueueReader}
+    readers = {name: QueueReader(queue, handler, name) for name, (queue, handler) in queues.items()}
+    for reader in readers.values():
+        reader.start()
+    return readers
+
+
+def stop_readers(readers, timeout=1.0):
+    for reader in readers.values():
+        reader.stop()
+    for reader in readers.values():
+        reader.join(timeout)
@@ -1,43 +1,41 @@
-import PIL
-import os
-import shutil
+import argparse
+import time
 
-import PIL.Image
-import PIL.ImageEnhance
-import random
-
-import PIL.ImageFilter
+from augment_manifest import incremental_augment
 
 labelsPath = "./dataset/labels"
 imgPath = "./dataset/images"
 
 minbrigthness = 0.3
 maxBrightness = 1.7 # apply to dark as well
+minColorIntensity = 0.3 # 0 = grayscale, 1 = unchanged
 maxColorIntensity = 2.0
 maxBlur = 1.5 # radius
 runs = 2
+seed = 0 # same seed and settings => same augmented images
 
 newImgdir = "./dataset/imgAugmented"
 newLabeldir = "./dataset/labelsAugmented"
-os.makedirs(newImgdir, exist_ok=True)
-os.makedirs(newLabeldir, exist_ok=True)
-runsComplete = 0
-while runsComplete < runs:
-    for root, dirs, files in os.walk(imgPath):
-        for file in files:
-            img = PIL.Image.open(imgPath + "/" + file)
-            if maxBrightness is not None: # apply random brightening
-                filter = PIL.ImageEnhance.Brightness(img)
-                randFac = max(random.random()*maxBrightness,minbrigthness)
-                img = filter.enhance(randFac)
-            if maxBlur is not None: # apply random blurring to same image
-                randFac = random.random()*maxBlur
-                filter = PIL.ImageFilter.GaussianBlur(randFac)
-                img = img.filter(filter)
-            #if maxColorIntensity is not None: # TODO
-            # save image in new folder
-            filename = '.'.join(os.path.basename(file).split('.')[:-1])
-            img.save(newImgdir + "/" + filename + "_" + str(runsComplete) + "aug.jpg")
-            # copy label and rename to same as img
-            shutil.copy(labelsPath + "/" + filename + ".txt" ,newLabeldir + "/" + filename + "_" + str(runsComplete) + "aug.txt")
-    runsComplete += 1
+
+# Guarded because the worker processes import this file on Windows
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write brightness/blur/color augmented copies of the dataset")
+    parser.add_argument("--runs", type=int, default=runs, help="augmented copies per image")
+    parser.add_argument("--seed", type=int, default=seed)
+    parser.add_argument("--workers", type=int, default=None, help="processes, default all cores, 0 = no pool")
+    parser.add_argument("--full", action="store_true", help="augment every image again, ignore the manifest")
+    args = parser.parse_args()
+
+    params = {
+        'min_brightness': minbrigthness,
+        'max_brightness': maxBrightness,
+        'min_color': minColorIntensity,
+        'max_color': maxColorIntensity,
+        'max_blur': maxBlur,
+    }
+    start = time.perf_counter()
+    # Only new or changed images are augmented, see augment_manifest.py
+    augmented, relabelled, skipped, deleted = incremental_augment(
+        imgPath, labelsPath, newImgdir, newLabeldir, params, args.runs, args.seed, args.workers, full=args.full)
+    print(f"Augmented {augmented} images, relabelled {relabelled}, {skipped} unchanged, "
+          f"deleted {deleted} stale outputs in {time.perf_counter() - start:.1f} s")
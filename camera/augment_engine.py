@@ -0,0 +1,139 @@
+# Parallel augmentation engine used by augment_dataset.py.
+#
+# Each source image is decoded once and all `runs` variants are produced from memory: brightness
+# and color intensity are applied to all variants at once as NumPy ops on a (runs, h, w, 3) stack,
+# then every variant gets its own Gaussian blur. Images are spread over a process pool, the random
+# factors come from a seed derived from the base seed and the file name, so the output does not
+# depend on the number of workers or the order the images are processed in.
+#
+# Same operations as the old PIL version:
+#   brightness  factor in [min_brightness, max_brightness], blend with black (ImageEnhance.Brightness)
+#   blur        Gaussian with radius in [0, max_blur] (ImageFilter.GaussianBlur)
+#   color       factor in [min_color, max_color], blend with the grayscale image (ImageEnhance.Color)
+# A parameter set to None switches that operation off.
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+DEFAULT_PARAMS = {
+    'min_brightness': 0.3,
+    'max_brightness': 1.7,
+    'min_color': 0.3,
+    'max_color': 2.0,
+    'max_blur': 1.5,
+}
+
+# BGR weights of the ITU-R 601 luma used by PIL for "L" images
+_GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+
+def image_seed(seed, name):
+    # Per-image seed, stable across runs, machines and worker counts
+    return np.random.SeedSequence([seed, zlib.crc32(name.encode())])
+
+
+def variant_factors(rng, runs, params):
+    # (runs,) brightness, color and blur factors, 1/1/0 for operations that are switched off
+    def draw(low, high, neutral):
+        if high is None:
+            return np.full(runs, neutral, dtype=np.float32)
+        # Same draw as before: random * max, but never below min
+        return np.maximum(rng.random(runs) * high, low or 0.0).astype(np.float32)
+
+    brightness = draw(params.get('min_brightness'), params.get('max_brightness'), 1.0)
+    color = draw(params.get('min_color'), params.get('max_color'), 1.0)
+    blur = draw(0.0, params.get('max_blur'), 0.0)
+    return brightness, color, blur
+
+
+def augment_image(image, brightness, color, blur):
+    # image (h, w, 3) uint8 BGR -> (runs, h, w, 3) uint8, one variant per factor
+    stack = image[None].astype(np.float32) * brightness[:, None, None, None]
+    np.clip(stack, 0, 255, out=stack)
+    for i, radius in enumerate(blur):
+        if radius > 0.05:
+            stack[i] = cv2.GaussianBlur(stack[i], (0, 0), float(radius))
+    if not np.all(color == 1.0):
+        gray = stack @ _GRAY_WEIGHTS
+        stack = gray[..., None] + color[:, None, None, None] * (stack - gray[..., None])
+        np.clip(stack, 0, 255, out=stack)
+    return (stack + 0.5).astype(np.uint8)
+
+
+def output_names(name, runs):
+    # Same names as the old script: <name>_<run>aug
+    stem = os.path.splitext(name)[0]
+    return [f"{stem}_{run}aug" for run in range(runs)]
+
+
+def process_image(job):
+    # Worker: decode one image, write all of its variants and copy the label for each of them
+    img_path, label_path, out_img_dir, out_label_dir, params, runs, seed, quality = job
+    name = os.path.basename(img_path)
+    image = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return name, 0, f"could not read {img_path}"
+    rng = np.random.default_rng(image_seed(seed, name))
+    variants = augment_image(image, *variant_factors(rng, runs, params))
+    encode = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    for written, (out_name, variant) in enumerate(zip(output_names(name, runs), variants)):
+        ok, data = cv2.imencode(".jpg", variant, encode)
+        if not ok:
+            return name, written, f"could not encode {out_name}.jpg"
+        with open(os.path.join(out_img_dir, out_name + ".jpg"), "wb") as f:
+            f.write(data)
+        if label_path is not None:
+            shutil.copyfile(label_path, os.path.join(out_label_dir, out_name + ".txt"))
+    missing = None if label_path is not None else f"no label for {name}"
+    return name, runs, missing
+
+
+def list_images(img_dir, label_dir):
+    # [(image path, label path or None)] sorted by file name. Labels and outputs are named by the
+    # stem, so two images that differ only in the extension (a.png, a.jpg) are rejected.
+    pairs = []
+    stems = {}
+    for name in sorted(os.listdir(img_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        stems.setdefault(os.path.splitext(name)[0], []).append(name)
+        label = os.path.join(label_dir, os.path.splitext(name)[0] + ".txt")
+        pairs.append((os.path.join(img_dir, name), label if os.path.exists(label) else None))
+    clashes = [", ".join(names) for names in stems.values() if len(names) > 1]
+    if clashes:
+        raise ValueError(f"images with the same name in {img_dir}: {'; '.join(clashes)}")
+    return pairs
+
+
+def augment_dataset(img_dir, label_dir, out_img_dir, out_label_dir, params=None, runs=2, seed=0,
+                    workers=None, quality=75, images=None):
+    # Augments every image (or only `images`, a list from list_images), returns the number of
+    # variants written. workers=None uses all cores, 0 runs in this process.
+    params = dict(DEFAULT_PARAMS if params is None else params)
+    os.makedirs(out_img_dir, exist_ok=True)
+    os.makedirs(out_label_dir, exist_ok=True)
+    if images is None:
+        images = list_images(img_dir, label_dir)
+    jobs = [(img, label, out_img_dir, out_label_dir, params, runs, seed, quality) for img, label in images]
+    written = 0
+    if workers == 0:
+        results = map(process_image, jobs)
+    else:
+        workers = workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(process_image, jobs, chunksize=max(1, len(jobs) // (4 * workers)))
+    try:
+        for name, count, problem in results:
+            written += count
+            if problem:
+                print(f"Warning: {problem}")
+    finally:
+        if workers != 0:
+            pool.shutdown()
+    return written
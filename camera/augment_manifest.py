@@ -0,0 +1,124 @@
+# Incremental augmentation: only new or changed images (or changed settings) are augmented again.
+#
+# The manifest (JSON, next to the output folders) stores per source image the content hash of the
+# image and its label, the settings it was augmented with and the output files. On a rerun:
+#   - image, label and settings unchanged        -> skipped
+#   - only the label changed                      -> labels copied again, images kept
+#   - image or settings changed, or new image     -> augmented again
+#   - image deleted, or fewer runs than before    -> its outputs are deleted
+#   - label deleted                               -> its output labels are deleted
+# Hashes are cached with the file size and modification time, so unchanged files are not read.
+import hashlib
+import json
+import os
+import shutil
+
+from augment_engine import augment_dataset, list_images, output_names
+
+MANIFEST_VERSION = 1
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def settings_key(params, runs, seed, quality):
+    # Everything besides the source files that changes the output images
+    text = json.dumps({'params': params, 'runs': runs, 'seed': seed, 'quality': quality}, sort_keys=True)
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data['entries']
+
+    def cached_hash(self, path, previous):
+        # Reuse the stored hash while size and mtime match, previous = {'hash', 'size', 'mtime'}
+        st = os.stat(path)
+        if previous and previous.get('size') == st.st_size and previous.get('mtime') == st.st_mtime_ns:
+            return previous
+        return {'hash': file_hash(path), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def incremental_augment(img_dir, label_dir, out_img_dir, out_label_dir, params, runs=2, seed=0,
+                        workers=None, quality=75, manifest_path=None, full=False):
+    # Returns (augmented images, relabelled images, skipped images, deleted output files)
+    if manifest_path is None:
+        manifest_path = os.path.join(os.path.dirname(os.path.abspath(out_img_dir)), "augment_manifest.json")
+    manifest = Manifest(manifest_path)
+    settings = settings_key(params, runs, seed, quality)
+    os.makedirs(out_img_dir, exist_ok=True)
+    os.makedirs(out_label_dir, exist_ok=True)
+
+    images = list_images(img_dir, label_dir)
+    todo, relabel, stale = [], [], []
+    entries = {}
+    for img_path, label_path in images:
+        name = os.path.basename(img_path)
+        old = manifest.entries.get(name, {})
+        image = manifest.cached_hash(img_path, old.get('image'))
+        label = manifest.cached_hash(label_path, old.get('label')) if label_path else None
+        outputs = output_names(name, runs)
+        entry = {'image': image, 'label': label, 'settings': settings, 'outputs': outputs}
+        entries[name] = entry
+        # Outputs of earlier runs that this configuration no longer produces
+        stale += [o for o in old.get('outputs', []) if o not in outputs]
+        same_image = (not full and old.get('settings') == settings
+                      and (old.get('image') or {}).get('hash') == image['hash']
+                      and all(os.path.exists(os.path.join(out_img_dir, o + ".jpg")) for o in outputs))
+        same_label = (old.get('label') or {}).get('hash') == (label or {}).get('hash')
+        if not same_image:
+            todo.append((img_path, label_path))
+        elif not same_label:
+            relabel.append((label_path, outputs))
+
+    for name, old in manifest.entries.items():
+        if name not in entries:
+            stale += old.get('outputs', [])
+
+    deleted = [os.path.join(out_img_dir, o + ".jpg") for o in stale]
+    deleted += [os.path.join(out_label_dir, o + ".txt") for o in stale]
+    _remove(deleted)
+    # Augmented again without a label: augment_dataset writes no label, drop the old ones
+    _remove(os.path.join(out_label_dir, o + ".txt")
+            for img_path, label_path in todo if label_path is None
+            for o in entries[os.path.basename(img_path)]['outputs'])
+
+    for label_path, outputs in relabel:
+        if label_path is None:
+            _remove(os.path.join(out_label_dir, o + ".txt") for o in outputs)
+            continue
+        for o in outputs:
+            shutil.copyfile(label_path, os.path.join(out_label_dir, o + ".txt"))
+
+    if todo:
+        augment_dataset(img_dir, label_dir, out_img_dir, out_label_dir, params, runs, seed,
+                        workers, quality, images=todo)
+
+    manifest.entries = entries
+    manifest.save()
+    return len(todo), len(relabel), len(images) - len(todo) - len(relabel), len(stale)
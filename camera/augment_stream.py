@@ -0,0 +1,212 @@
+# On-the-fly augmentation for training: yields augmented images and their YOLO boxes without
+# writing anything to disk, so the number of variants is unlimited.
+#
+#   stream = AugmentStream("./dataset/images", "./dataset/labels", size=(416, 416), epochs=None)
+#   for name, image, labels in stream:   # image (h, w, 3) uint8 BGR, labels (n, 5) class cx cy w h
+#       ...
+#   stream.close()
+#
+# Geometric part: horizontal flip, scale, translate and crop to the output size, all done by one
+# cv2.warpAffine. There is no rotation so boxes stay axis aligned and are transformed exactly:
+# their corners go through the same affine map, are clipped to the image and dropped when less
+# than min_visibility of the box is left. The photometric part is augment_engine.augment_image.
+# Samples are produced by a process pool and `prefetch` of them are kept in flight, in order.
+# Every sample is seeded from (seed, file name, epoch), so the stream is reproducible and does not
+# depend on the number of workers.
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from augment_engine import DEFAULT_PARAMS, augment_image, list_images, variant_factors
+
+GEOMETRIC_PARAMS = {
+    'flip': 0.5,  # probability of a horizontal flip
+    'min_scale': 0.75,  # relative to fitting the image into the output size
+    'max_scale': 1.25,  # above 1 the image is cropped
+    'max_translate': 0.1,  # fraction of the output size
+    'min_visibility': 0.3,  # fraction of a box that must stay inside the image
+}
+FILL_VALUE = (114, 114, 114)  # padding, same gray as the YOLO letterbox
+
+
+def read_labels(path):
+    # YOLO label file -> (n, 5) float32 [class, cx, cy, w, h] normalized to 0..1
+    if path is None:
+        return np.zeros((0, 5), dtype=np.float32)
+    with open(path) as f:
+        return np.array(f.read().split(), dtype=np.float32).reshape(-1, 5)
+
+
+def format_labels(labels):
+    # Inverse of read_labels, for writing a label file
+    return "".join(f"{int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for c, x, y, w, h in labels)
+
+
+def random_affine(rng, image_size, out_size, params):
+    # 2x3 matrix mapping input pixels to output pixels: flip, scale about the center, translate
+    w, h = image_size
+    W, H = out_size
+    s = min(W / w, H / h) * rng.uniform(params['min_scale'], params['max_scale'])
+    a = -s if rng.random() < params['flip'] else s
+    tx, ty = rng.uniform(-1.0, 1.0, 2) * params['max_translate'] * np.array([W, H])
+    return np.array([[a, 0.0, W / 2 + tx - a * w / 2],
+                     [0.0, s, H / 2 + ty - s * h / 2]], dtype=np.float32)
+
+
+def transform_boxes(labels, M, image_size, out_size, min_visibility=0.3):
+    # Applies the affine M to normalized YOLO boxes of an image_size image, returns the boxes that
+    # are still visible in the out_size image, normalized to it
+    if len(labels) == 0:
+        return labels
+    w, h = image_size
+    W, H = out_size
+    cx, cy, bw, bh = labels[:, 1] * w, labels[:, 2] * h, labels[:, 3] * w, labels[:, 4] * h
+    xs = M[0, 0] * np.stack([cx - bw / 2, cx + bw / 2]) + M[0, 2]
+    ys = M[1, 1] * np.stack([cy - bh / 2, cy + bh / 2]) + M[1, 2]
+    x1, x2 = xs.min(axis=0), xs.max(axis=0)  # a flip swaps the corners
+    y1, y2 = ys.min(axis=0), ys.max(axis=0)
+    area = (x2 - x1) * (y2 - y1)
+    x1, x2 = np.clip(x1, 0, W), np.clip(x2, 0, W)
+    y1, y2 = np.clip(y1, 0, H), np.clip(y2, 0, H)
+    visible = (x2 - x1) * (y2 - y1)
+    keep = (visible >= min_visibility * area) & (x2 - x1 >= 2) & (y2 - y1 >= 2)
+    out = np.stack([labels[:, 0], (x1 + x2) / 2 / W, (y1 + y2) / 2 / H, (x2 - x1) / W, (y2 - y1) / H], axis=1)
+    return out[keep].astype(np.float32)
+
+
+def augment_sample(image, labels, rng, params, out_size=None):
+    # One augmented (image, labels) pair; params holds both the photometric and geometric keys
+    h, w = image.shape[:2]
+    out_size = out_size or (w, h)
+    M = random_affine(rng, (w, h), out_size, params)
+    warped = cv2.warpAffine(image, M, out_size, flags=cv2.INTER_LINEAR, borderValue=FILL_VALUE)
+    # Photometric after the warp: runs on the output size, which is usually the smaller one
+    warped = augment_image(warped, *variant_factors(rng, 1, params))[0]
+    return warped, transform_boxes(labels, M, (w, h), out_size, params['min_visibility'])
+
+
+def _sample_job(job):
+    # Worker: decode, augment and return (name, image, labels, problem)
+    img_path, label_path, params, out_size, seed, epoch = job
+    name = os.path.basename(img_path)
+    image = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return name, None, None, f"could not read {img_path}"
+    rng = np.random.default_rng(np.random.SeedSequence([seed, zlib.crc32(name.encode()), epoch]))
+    image, labels = augment_sample(image, read_labels(label_path), rng, params, out_size)
+    return name, image, labels, None
+
+
+class AugmentStream:
+    def __init__(self, img_dir, label_dir, params=None, size=None, seed=0, epochs=1, shuffle=True,
+                 workers=None, prefetch=32):
+        # size: (width, height) of the output images, None keeps each image's size.
+        # epochs=None streams forever, every epoch gives new variants of every image.
+        # workers=None uses all cores, 0 augments in the consuming process.
+        self.params = dict(DEFAULT_PARAMS, **GEOMETRIC_PARAMS)
+        self.params.update(params or {})
+        self.images = list_images(img_dir, label_dir)
+        self.size = tuple(size) if size else None
+        self.seed = seed
+        self.epochs = epochs
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self.workers = workers
+        self.pool = None
+        if workers != 0:
+            self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.problems = []
+
+    def jobs(self):
+        epoch = 0
+        while self.epochs is None or epoch < self.epochs:
+            order = np.arange(len(self.images))
+            if self.shuffle:
+                np.random.default_rng([self.seed, epoch]).shuffle(order)
+            for i in order:
+                img_path, label_path = self.images[i]
+                yield img_path, label_path, self.params, self.size, self.seed, epoch
+            epoch += 1
+
+    def __iter__(self):
+        if not self.images:
+            return
+        jobs = self.jobs()
+        if self.pool is None:
+            results = map(_sample_job, jobs)
+        else:
+            results = self._prefetched(jobs)
+        for name, image, labels, problem in results:
+            if problem:
+                self.problems.append(problem)
+                print(f"Warning: {problem}")
+                continue
+            yield name, image, labels
+
+    def _prefetched(self, jobs):
+        # Keeps `prefetch` samples in flight and hands them out in submission order
+        pending = deque()
+        for job in jobs:
+            pending.append(self.pool.submit(_sample_job, job))
+            if len(pending) >= self.prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def batches(self, batch_size):
+        # (images (b, h, w, 3), [labels per image], [names]), needs a fixed size
+        names, images, labels = [], [], []
+        for name, image, boxes in self:
+            names.append(name)
+            images.append(image)
+            labels.append(boxes)
+            if len(images) == batch_size:
+                yield np.stack(images), labels, names
+                names, images, labels = [], [], []
+        if images:
+            yield np.stack(images), labels, names
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Preview or time the on-the-fly augmentation")
+    parser.add_argument("--images", default="./dataset/images")
+    parser.add_argument("--labels", default="./dataset/labels")
+    parser.add_argument("--size", type=int, nargs=2, default=[416, 416], metavar=("W", "H"))
+    parser.add_argument("--count", type=int, default=200, help="samples to produce")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--show", action="store_true", help="draw the boxes and show every sample")
+    args = parser.parse_args()
+
+    with AugmentStream(args.images, args.labels, size=args.size, epochs=None, workers=args.workers) as stream:
+        start = time.perf_counter()
+        for count, (name, image, labels) in enumerate(stream, 1):
+            if args.show:
+                h, w = image.shape[:2]
+                for c, x, y, bw, bh in labels:
+                    cv2.rectangle(image, (int((x - bw / 2) * w), int((y - bh / 2) * h)),
+                                  (int((x + bw / 2) * w), int((y + bh / 2) * h)), (0, 255, 0), 2)
+                cv2.imshow("augmented", image)
+                if cv2.waitKey(0) == ord('q'):
+                    break
+            if count >= args.count:
+                break
+        elapsed = time.perf_counter() - start
+    print(f"{count} samples in {elapsed:.2f} s, {count / elapsed:.0f} samples/s")
@@ -0,0 +1,215 @@
+# Packed dataset: the images/labels folders (original and augmented) converted to a few
+# memory-mapped files, so training does not open and decode thousands of small files every epoch.
+#
+# Layout of a packed directory:
+#   images_00000.npy  (shard_size, 416, 416, 3) uint8 BGR, letterboxed, last shard may be shorter
+#   boxes.npy         (m, 5) float32 [class, cx, cy, w, h] of all images, YOLO format
+#   offsets.npy       (n + 1,) int64, boxes of image i are boxes[offsets[i]:offsets[i + 1]]
+#   index.json        version, size, shard_size, count and the source file names
+# Images that are not 416x416 are scaled to fit and padded (same as the YOLO letterbox), their
+# boxes are transformed along. The shards are plain .npy files so np.load(..., mmap_mode='r')
+# reads them without the reader.
+#
+#   python dataset_pack.py pack ./dataset/packed --src ./dataset/images ./dataset/labels \
+#                                                --src ./dataset/imgAugmented ./dataset/labelsAugmented
+#   python dataset_pack.py info ./dataset/packed
+#   python dataset_pack.py bench ./dataset/packed --src ./dataset/images ./dataset/labels
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from augment_engine import list_images
+from augment_stream import FILL_VALUE, read_labels, transform_boxes
+
+PACK_VERSION = 1
+SIZE = 416
+
+
+def letterbox(image, labels, size=SIZE):
+    # Scale to fit size x size keeping the aspect ratio, pad with FILL_VALUE, boxes follow
+    h, w = image.shape[:2]
+    if (w, h) == (size, size):
+        return image, labels
+    s = min(size / w, size / h)
+    M = np.array([[s, 0.0, (size - s * w) / 2], [0.0, s, (size - s * h) / 2]], dtype=np.float32)
+    image = cv2.warpAffine(image, M, (size, size), flags=cv2.INTER_AREA, borderValue=FILL_VALUE)
+    return image, transform_boxes(labels, M, (w, h), (size, size), min_visibility=0.0)
+
+
+def load_loose(img_path, label_path, size=SIZE):
+    # One image and its labels from the loose files, as stored in the pack (None if unreadable)
+    image = cv2.imread(img_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None, None
+    return letterbox(image, read_labels(label_path), size)
+
+
+def _load_job(job):
+    return load_loose(*job)
+
+
+def pack(out_dir, sources, size=SIZE, shard_size=1024, workers=None):
+    # sources: [(image folder, label folder)], returns the number of images packed
+    os.makedirs(out_dir, exist_ok=True)
+    files = [pair for img_dir, label_dir in sources for pair in list_images(img_dir, label_dir)]
+    names, boxes, offsets = [], [], [0]
+    shard, shard_id, fill = None, 0, 0
+    jobs = [(img, label, size) for img, label in files]
+    pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) if workers != 0 else None
+    results = pool.map(_load_job, jobs, chunksize=16) if pool else map(_load_job, jobs)
+    try:
+        for done, ((img_path, _), (image, labels)) in enumerate(zip(files, results)):
+            if image is None:
+                print(f"Warning: could not read {img_path}")
+                continue
+            if shard is None:
+                count = min(shard_size, len(files) - done)
+                shard = np.lib.format.open_memmap(os.path.join(out_dir, f"images_{shard_id:05d}.npy"), mode="w+",
+                                                  dtype=np.uint8, shape=(count, size, size, 3))
+                fill = 0
+            shard[fill] = image
+            fill += 1
+            names.append(os.path.relpath(img_path))
+            boxes.append(labels)
+            offsets.append(offsets[-1] + len(labels))
+            if fill == len(shard):
+                shard.flush()
+                shard, shard_id = None, shard_id + 1
+    finally:
+        if pool:
+            pool.shutdown()
+    if shard is not None:
+        # Unreadable images left the last shard short, rewrite it with its real length
+        path, data = shard.filename, np.array(shard[:fill])
+        del shard
+        np.save(path, data)
+        shard_id += 1
+
+    np.save(os.path.join(out_dir, "boxes.npy"),
+            np.concatenate(boxes) if boxes else np.zeros((0, 5), dtype=np.float32))
+    np.save(os.path.join(out_dir, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump({'version': PACK_VERSION, 'size': size, 'shard_size': shard_size, 'shards': shard_id,
+                   'count': len(names), 'names': names}, f, indent=1)
+    return len(names)
+
+
+class PackedDataset:
+    def __init__(self, path):
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        if self.index['version'] != PACK_VERSION:
+            raise ValueError(f"{path} is packed with version {self.index['version']}, expected {PACK_VERSION}")
+        self.shard_size = self.index['shard_size']
+        self.names = self.index['names']
+        self.shards = [np.load(os.path.join(path, f"images_{i:05d}.npy"), mmap_mode="r")
+                       for i in range(self.index['shards'])]
+        self.boxes = np.load(os.path.join(path, "boxes.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+
+    def __len__(self):
+        return len(self.names)
+
+    def image(self, i):
+        # Read-only view into the memory map, no copy
+        shard, row = divmod(i, self.shard_size)
+        return self.shards[shard][row]
+
+    def labels(self, i):
+        return self.boxes[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return self.image(i), self.labels(i)
+
+    def batch(self, start, stop):
+        # Images start..stop; a view when the range lies in one shard, otherwise one copy
+        first, last = divmod(start, self.shard_size), divmod(stop - 1, self.shard_size)
+        if first[0] == last[0]:
+            images = self.shards[first[0]][first[1]:last[1] + 1]
+        else:
+            images = np.concatenate([self.image_range(s, start, stop) for s in range(first[0], last[0] + 1)])
+        return images, [self.labels(i) for i in range(start, stop)]
+
+    def image_range(self, shard, start, stop):
+        base = shard * self.shard_size
+        return self.shards[shard][max(start - base, 0):min(stop - base, self.shard_size)]
+
+    def take(self, indices, out=None):
+        # Gathers arbitrary images (a shuffled batch) into out, (len(indices), size, size, 3)
+        indices = np.asarray(indices)
+        if out is None:
+            size = self.index['size']
+            out = np.empty((len(indices), size, size, 3), dtype=np.uint8)
+        shard, row = np.divmod(indices, self.shard_size)
+        for s in np.unique(shard):
+            sel = shard == s
+            out[sel] = self.shards[s][row[sel]]
+        return out, [self.labels(i) for i in indices]
+
+
+def benchmark(dataset, sources, count=500, batch_size=32, seed=0):
+    # Images/s of random access from the loose files, random access from the pack, and batches
+    rng = np.random.default_rng(seed)
+    files = [pair for img_dir, label_dir in sources for pair in list_images(img_dir, label_dir)]
+    result = {}
+    if files:
+        picks = rng.integers(0, len(files), min(count, len(files)))
+        start = time.perf_counter()
+        for i in picks:
+            load_loose(*files[i])
+        result['loose'] = len(picks) / (time.perf_counter() - start)
+
+    picks = rng.integers(0, len(dataset), count)
+    start = time.perf_counter()
+    for i in picks:
+        image, labels = dataset[i]
+        np.asarray(image).sum(dtype=np.uint64)  # touch the pixels, a view alone reads nothing
+    result['packed'] = count / (time.perf_counter() - start)
+
+    out = None
+    start = time.perf_counter()
+    n = 0
+    while n < count:
+        out, _ = dataset.take(rng.integers(0, len(dataset), batch_size), out)
+        n += batch_size
+    result['packed_batches'] = n / (time.perf_counter() - start)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the YOLO dataset into memory-mapped shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("pack", help="pack image/label folders")
+    p.add_argument("out")
+    p.add_argument("--src", nargs=2, action="append", metavar=("IMAGES", "LABELS"),
+                   help="image and label folder, can be repeated (default ./dataset/images ./dataset/labels)")
+    p.add_argument("--size", type=int, default=SIZE)
+    p.add_argument("--shard-size", type=int, default=1024, help="images per shard file")
+    p.add_argument("--workers", type=int, default=None, help="decoding processes, 0 = no pool")
+    p = sub.add_parser("info", help="print what a pack contains")
+    p.add_argument("path")
+    p = sub.add_parser("bench", help="compare load throughput with the loose files")
+    p.add_argument("path")
+    p.add_argument("--src", nargs=2, action="append", metavar=("IMAGES", "LABELS"))
+    p.add_argument("--count", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        start = time.perf_counter()
+        n = pack(args.out, args.src or [("./dataset/images", "./dataset/labels")], args.size,
+                 args.shard_size, args.workers)
+        print(f"Packed {n} images in {time.perf_counter() - start:.1f} s")
+    elif args.command == "info":
+        dataset = PackedDataset(args.path)
+        print(f"{len(dataset)} images of {dataset.index['size']}x{dataset.index['size']} in "
+              f"{len(dataset.shards)} shards, {len(dataset.boxes)} boxes")
+    else:
+        dataset = PackedDataset(args.path)
+        result = benchmark(dataset, args.src or [], args.count)
+        for name, rate in result.items():
+            print(f"{name:15s} {rate:8.0f} images/s")
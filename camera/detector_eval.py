@@ -0,0 +1,307 @@
+# Offline evaluation of the YOLO detector on the host CPU, so the model and its thresholds can be
+# judged on recorded frames instead of live on the camera with test.py.
+#
+# The network is run as an ONNX (ONNX Runtime) or OpenVINO IR (OpenVINO CPU) export of the same
+# model the .blob was compiled from, in batches. The raw YOLO heads are decoded with the anchors
+# and masks that main.py/base_cam.py give the camera, all grid cells and anchors of a batch at once.
+# NMS is class aware with one vectorized IoU row per kept box. Reports: mAP@0.5,
+# mAP@0.5:0.95, precision/recall at the chosen thresholds, model latency and throughput.
+#
+# With --sweep the network runs once, the candidates above a low confidence are kept and every
+# confidence/IoU threshold pair is evaluated from them, so a full sweep takes seconds.
+#
+#   python detector_eval.py best_aug.onnx --data ./dataset/packed --classes 2 --conf 0.8 --iou 0.8
+#   python detector_eval.py best_aug.xml --images ./dataset/images --labels ./dataset/labels --sweep
+import argparse
+import os
+import time
+
+import numpy as np
+
+from augment_engine import list_images
+from dataset_pack import SIZE, PackedDataset, load_loose
+
+# Same as setAnchors/setAnchorMasks in main.py and base_cam.py (pixels at 416x416, masks by stride)
+ANCHORS = np.array([10, 13, 16, 30, 33, 23, 30, 61, 62, 45, 59, 119, 116, 90, 156, 198, 373, 326],
+                   dtype=np.float32).reshape(-1, 2)
+ANCHOR_MASKS = {8: [0, 1, 2], 16: [3, 4, 5], 32: [6, 7, 8]}
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+_grids = {}
+
+
+def _grid(side):
+    # (side, side, 2) cell offsets x, y, cached per output size
+    if side not in _grids:
+        y, x = np.mgrid[0:side, 0:side].astype(np.float32)
+        _grids[side] = np.stack([x, y], axis=-1)
+    return _grids[side]
+
+
+def decode(outputs, num_classes, size=SIZE, conf_threshold=0.01, logits=False):
+    # Raw heads -> per image (boxes (n, 4) xyxy normalized, scores (n,), classes (n,)).
+    # Each output is (N, 3 * (5 + classes), S, S) or (N, 3, S, S, 5 + classes); with logits the
+    # sigmoid is not part of the exported model and is applied here.
+    boxes, scores, classes = [], [], []
+    for out in outputs:
+        out = np.asarray(out, dtype=np.float32)
+        if out.ndim == 4:
+            n, _, s, _ = out.shape
+            out = out.reshape(n, 3, 5 + num_classes, s, s).transpose(0, 1, 3, 4, 2)
+        n, _, s = out.shape[:3]
+        if logits:
+            out = 1.0 / (1.0 + np.exp(-out))
+        stride = size // s
+        anchors = ANCHORS[ANCHOR_MASKS[stride]][None, :, None, None, :]
+        xy = (out[..., 0:2] * 2.0 - 0.5 + _grid(s)) * stride
+        wh = (out[..., 2:4] * 2.0) ** 2 * anchors
+        cls_score = out[..., 5:]
+        cls = cls_score.argmax(axis=-1)
+        score = out[..., 4] * np.take_along_axis(cls_score, cls[..., None], axis=-1)[..., 0]
+        boxes.append(np.concatenate([xy - wh / 2, xy + wh / 2], axis=-1).reshape(n, -1, 4) / size)
+        scores.append(score.reshape(n, -1))
+        classes.append(cls.reshape(n, -1))
+    boxes, scores, classes = (np.concatenate(a, axis=1) for a in (boxes, scores, classes))
+    result = []
+    for b, s, c in zip(boxes, scores, classes):
+        keep = s >= conf_threshold
+        result.append((np.clip(b[keep], 0.0, 1.0), s[keep], c[keep]))
+    return result
+
+
+def box_iou(a, b):
+    # (n, 4) x (m, 4) xyxy -> (n, m)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=-1)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=-1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=-1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-12)
+
+
+def nms(boxes, scores, classes, iou_threshold=0.5, max_det=100, max_candidates=3000):
+    # Greedy class-aware NMS, returns the kept indices by falling score. Boxes of different classes
+    # are moved apart so they never overlap; each kept box costs one vectorized IoU row against the
+    # boxes still in play, at most max_det rows.
+    order = np.argsort(-scores)[:max_candidates]
+    shifted = boxes[order] + classes[order, None] * 4.0
+    remaining = np.arange(len(order))
+    keep = []
+    while len(remaining) and len(keep) < max_det:
+        i = remaining[0]
+        keep.append(i)
+        iou = box_iou(shifted[i:i + 1], shifted[remaining[1:]])[0]
+        remaining = remaining[1:][iou <= iou_threshold]
+    return order[keep]
+
+
+def postprocess(candidates, conf_threshold, iou_threshold):
+    # Decoded candidates -> detections at the given thresholds, same per image tuples
+    result = []
+    for boxes, scores, classes in candidates:
+        sel = scores >= conf_threshold
+        boxes, scores, classes = boxes[sel], scores[sel], classes[sel]
+        keep = nms(boxes, scores, classes, iou_threshold)
+        result.append((boxes[keep], scores[keep], classes[keep]))
+    return result
+
+
+def yolo_to_xyxy(labels):
+    # YOLO labels (n, 5) class cx cy w h -> (boxes xyxy, classes)
+    cxcy, wh = labels[:, 1:3], labels[:, 3:5]
+    return np.concatenate([cxcy - wh / 2, cxcy + wh / 2], axis=1), labels[:, 0].astype(np.int64)
+
+
+def match(boxes, scores, classes, gt_boxes, gt_classes, thresholds=IOU_THRESHOLDS):
+    # (n, len(thresholds)) true positive flags, detections matched by falling score to the unused
+    # ground truth box of the same class with the highest IoU
+    tp = np.zeros((len(boxes), len(thresholds)), dtype=bool)
+    if len(boxes) == 0 or len(gt_boxes) == 0:
+        return tp
+    iou = box_iou(boxes, gt_boxes)
+    iou[classes[:, None] != gt_classes[None, :]] = 0.0
+    taken = np.zeros((len(thresholds), len(gt_boxes)), dtype=bool)
+    rows = np.arange(len(thresholds))
+    for i in np.argsort(-scores):
+        candidate = np.where(~taken & (iou[i][None, :] >= thresholds[:, None]), iou[i][None, :], -1.0)
+        j = candidate.argmax(axis=1)
+        hit = candidate[rows, j] >= 0.0
+        tp[i, hit] = True
+        taken[rows[hit], j[hit]] = True
+    return tp
+
+
+def average_precision(tp, scores, n_gt):
+    # All-point interpolated AP per IoU threshold for one class, tp (n, T)
+    if n_gt == 0:
+        return np.full(tp.shape[1], np.nan)
+    if len(scores) == 0:
+        return np.zeros(tp.shape[1])
+    order = np.argsort(-scores, kind="stable")
+    ctp = np.cumsum(tp[order], axis=0)
+    recall = ctp / n_gt
+    precision = ctp / np.arange(1, len(order) + 1)[:, None]
+    envelope = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+    recall = np.vstack([np.zeros((1, tp.shape[1])), recall])
+    return np.sum(np.diff(recall, axis=0) * envelope, axis=0)
+
+
+def evaluate(detections, ground_truth, num_classes, thresholds=IOU_THRESHOLDS):
+    # detections: per image (boxes, scores, classes), ground_truth: per image YOLO labels (n, 5)
+    tps, scores, classes = [], [], []
+    n_gt = np.zeros(num_classes, dtype=np.int64)
+    for (boxes, score, cls), labels in zip(detections, ground_truth):
+        gt_boxes, gt_classes = yolo_to_xyxy(labels)
+        n_gt += np.bincount(gt_classes, minlength=num_classes)[:num_classes]
+        tps.append(match(boxes, score, cls, gt_boxes, gt_classes, thresholds))
+        scores.append(score)
+        classes.append(cls)
+    tp = np.concatenate(tps) if tps else np.zeros((0, len(thresholds)), dtype=bool)
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    classes = np.concatenate(classes) if classes else np.zeros(0, dtype=np.int64)
+    ap = np.array([average_precision(tp[classes == c], scores[classes == c], n_gt[c])
+                   for c in range(num_classes)])
+    hits = tp[:, 0].sum()
+    return {
+        'map50': float(np.nanmean(ap[:, 0])) if np.any(n_gt) else float('nan'),
+        'map': float(np.nanmean(ap)) if np.any(n_gt) else float('nan'),
+        'ap50': ap[:, 0],
+        'precision': float(hits / max(len(tp), 1)),
+        'recall': float(hits / max(n_gt.sum(), 1)),
+        'detections': len(tp),
+        'ground_truth': int(n_gt.sum()),
+    }
+
+
+class OnnxBackend:
+    def __init__(self, path, threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input: batch})
+
+
+class OpenVinoBackend:
+    def __init__(self, path, threads=None):
+        from openvino.runtime import Core
+
+        config = {"INFERENCE_NUM_THREADS": str(threads)} if threads else {}
+        core = Core()
+        model = core.read_model(path)
+        model.reshape([-1, 3, SIZE, SIZE])  # dynamic batch, the last batch may be smaller
+        self.compiled = core.compile_model(model, "CPU", config)
+
+    def __call__(self, batch):
+        result = self.compiled(batch)
+        return [result[out] for out in self.compiled.outputs]
+
+
+def load_backend(path, threads=None):
+    if os.path.splitext(path)[1].lower() == ".onnx":
+        return OnnxBackend(path, threads)
+    return OpenVinoBackend(path, threads)
+
+
+def preprocess(images, rgb=True, scale=1.0 / 255.0):
+    # (n, h, w, 3) uint8 BGR -> (n, 3, h, w) float32 network input. A blob exported for the camera
+    # takes BGR 0..255 (rgb=False, scale=1), a plain YOLO export RGB 0..1.
+    x = images[..., ::-1] if rgb else images
+    return np.ascontiguousarray(x.transpose(0, 3, 1, 2), dtype=np.float32) * np.float32(scale)
+
+
+def iterate_dataset(data=None, images=None, labels=None, batch_size=8):
+    # Batches of (images (b, 416, 416, 3) uint8, [labels]) from a pack or loose folders
+    if data:
+        dataset = PackedDataset(data)
+        for start in range(0, len(dataset), batch_size):
+            yield dataset.batch(start, min(start + batch_size, len(dataset)))
+        return
+    batch, batch_labels = [], []
+    for img_path, label_path in list_images(images, labels):
+        image, boxes = load_loose(img_path, label_path)
+        if image is None:
+            continue
+        batch.append(image)
+        batch_labels.append(boxes)
+        if len(batch) == batch_size:
+            yield np.stack(batch), batch_labels
+            batch, batch_labels = [], []
+    if batch:
+        yield np.stack(batch), batch_labels
+
+
+def run_model(backend, batches, num_classes, rgb=True, scale=1.0 / 255.0, logits=False, conf_floor=0.01):
+    # Runs every batch, returns (decoded candidates, ground truth, timing)
+    candidates, ground_truth, latencies = [], [], []
+    decode_time = 0.0
+    count = 0
+    for images, labels in batches:
+        x = preprocess(np.asarray(images), rgb, scale)
+        start = time.perf_counter()
+        outputs = backend(x)
+        latencies.append((time.perf_counter() - start) / len(x))
+        start = time.perf_counter()
+        candidates += decode(outputs, num_classes, conf_threshold=conf_floor, logits=logits)
+        decode_time += time.perf_counter() - start
+        ground_truth += labels
+        count += len(x)
+    latencies = np.array(latencies) * 1e3
+    timing = {
+        'images': count,
+        'latency_ms_p50': float(np.percentile(latencies, 50)) if count else float('nan'),
+        'latency_ms_p95': float(np.percentile(latencies, 95)) if count else float('nan'),
+        'throughput': count / max(latencies.sum() / 1e3, 1e-9),
+        'decode_ms': 1e3 * decode_time / max(count, 1),
+    }
+    return candidates, ground_truth, timing
+
+
+def sweep(candidates, ground_truth, num_classes, confs, ious):
+    # [(conf, iou, evaluate result)] for every threshold pair
+    return [(conf, iou, evaluate(postprocess(candidates, conf, iou), ground_truth, num_classes))
+            for conf in confs for iou in ious]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the YOLO detector on recorded frames on the CPU")
+    parser.add_argument("model", help="ONNX (.onnx) or OpenVINO IR (.xml) export of the network")
+    parser.add_argument("--data", help="packed dataset made with dataset_pack.py")
+    parser.add_argument("--images", default="./dataset/images")
+    parser.add_argument("--labels", default="./dataset/labels")
+    parser.add_argument("--classes", type=int, default=2, help="2 for base_cam.py, 3 for main.py")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--conf", type=float, default=0.8)
+    parser.add_argument("--iou", type=float, default=0.8)
+    parser.add_argument("--bgr", action="store_true", help="model takes BGR 0..255 (camera blob export)")
+    parser.add_argument("--logits", action="store_true", help="heads are not passed through a sigmoid")
+    parser.add_argument("--sweep", action="store_true", help="evaluate a grid of confidence and IoU thresholds")
+    args = parser.parse_args()
+
+    backend = load_backend(args.model, args.threads)
+    batches = iterate_dataset(args.data, args.images, args.labels, args.batch)
+    candidates, ground_truth, timing = run_model(backend, batches, args.classes, rgb=not args.bgr,
+                                                 scale=1.0 if args.bgr else 1.0 / 255.0, logits=args.logits)
+    print(f"{timing['images']} images, latency p50 {timing['latency_ms_p50']:.1f} ms "
+          f"p95 {timing['latency_ms_p95']:.1f} ms per image, {timing['throughput']:.1f} images/s, "
+          f"decode {timing['decode_ms']:.2f} ms per image")
+
+    result = evaluate(postprocess(candidates, args.conf, args.iou), ground_truth, args.classes)
+    print(f"conf {args.conf} iou {args.iou}: mAP@0.5 {result['map50']:.3f}  mAP@0.5:0.95 {result['map']:.3f}  "
+          f"precision {result['precision']:.3f}  recall {result['recall']:.3f}  "
+          f"AP@0.5 per class {np.round(result['ap50'], 3).tolist()}")
+
+    if args.sweep:
+        start = time.perf_counter()
+        rows = sweep(candidates, ground_truth, args.classes, np.arange(0.1, 0.95, 0.1), [0.3, 0.5, 0.7, 0.8])
+        print(f"\n conf   iou  mAP@0.5  precision  recall  ({time.perf_counter() - start:.1f} s)")
+        for conf, iou, r in rows:
+            print(f"{conf:5.2f} {iou:5.2f}  {r['map50']:7.3f}  {r['precision']:9.3f}  {r['recall']:6.3f}")
+        conf, iou, best = max(rows, key=lambda row: np.nan_to_num(row[2]['map50'], nan=-1.0))
+        print(f"Best mAP@0.5 {best['map50']:.3f} at conf {conf:.2f}, iou {iou:.2f}")
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Device discovery with a cached inventory, instead of one blocking scan in every tool (getIPs.py).
+#
+# A scan lists the devices with one discovery broadcast and then probes the bootloader of every
+# device that was not probed within probe_ttl for its versions. Opening a bootloader takes about a
+# second, so the probes run concurrently and a full scan costs one probe, not one per camera.
+# The inventory (MXID, IP/USB name, state, firmware and bootloader versions, last seen) is kept
+# in a JSON file next to this script: resolve() answers from it in about a millisecond while it
+# is younger than ttl and only scans when it is stale. `watch` keeps it fresh and reports devices
+# that drop out or come back. Devices that dropped out stay in the inventory as offline.
+# Tools that only need the list and connect right after (take_pics.py) pass probe=False: a probe
+# holds the bootloader connection, a timed out one until it finishes on its own, and the tool would
+# find the device in use. UNBOOTED USB devices are never probed, opening their bootloader reboots
+# them into it.
+#
+#   python discovery.py scan                 # one scan, prints the inventory
+#   python discovery.py watch --interval 2   # rescan every 2 s, print changes
+#   python discovery.py get base             # name (IP) of a camera by role or MXID
+#   python discovery.py scan --fake 4        # the same against FakeProvider, no camera needed
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+CACHE_VERSION = 1
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "devices.json")
+ROLES = {
+    'base': "14442C10515CF0D600",
+    'top': "14442C101102F4D600",
+}
+PROBED_FIELDS = ('firmware_version', 'bootloader_version', 'bootloader_type')
+
+
+class DaiProvider:
+    # The real devices: scan() is one discovery broadcast, probe() opens the device bootloader
+    def scan(self):
+        import depthai as dai
+
+        return [{'mxid': info.getMxId(), 'name': info.name, 'state': info.state.name,
+                 'protocol': info.protocol.name}
+                for info in dai.DeviceBootloader.getAllAvailableDevices()]
+
+    def probe(self, entry):
+        import depthai as dai
+
+        with dai.DeviceBootloader(dai.DeviceInfo(entry['name'])) as bootloader:
+            result = {'bootloader_version': str(bootloader.getVersion()),
+                      'bootloader_type': bootloader.getType().name,
+                      'firmware_version': None}
+            if hasattr(bootloader, "readApplicationDetails"):  # depthai >= 2.21
+                details = bootloader.readApplicationDetails()
+                if details.hasApplication:
+                    result['firmware_version'] = details.firmwareVersion
+        return result
+
+
+class FakeProvider:
+    # count fake PoE cameras with a scan and probe delay like the real ones, devices can be
+    # dropped and reconnected, probes of the MXIDs in `failing` raise RuntimeError
+    def __init__(self, count=2, scan_delay=0.05, probe_delay=1.0, seed=0):
+        rng = random.Random(seed)
+        self.devices = {}
+        for i in range(count):
+            mxid = "".join(rng.choice("0123456789ABCDEF") for _ in range(18))
+            self.devices[mxid] = {'mxid': mxid, 'name': f"192.168.80.{100 + i}",
+                                  'state': "BOOTLOADER", 'protocol': "TCP_IP"}
+        self.present = set(self.devices)
+        self.failing = set()
+        self.scan_delay = scan_delay
+        self.probe_delay = probe_delay
+        self.scans = 0
+        self.probes = 0
+        self.lock = threading.Lock()
+
+    def drop(self, mxid):
+        self.present.discard(mxid)
+
+    def reconnect(self, mxid):
+        self.present.add(mxid)
+
+    def scan(self):
+        self.scans += 1
+        time.sleep(self.scan_delay)
+        return [dict(self.devices[mxid]) for mxid in sorted(self.present)]
+
+    def probe(self, entry):
+        with self.lock:
+            self.probes += 1
+        time.sleep(self.probe_delay)
+        if entry['mxid'] in self.failing:
+            raise RuntimeError("Failed to connect to the bootloader")
+        return {'firmware_version': "0.0.26", 'bootloader_version': "0.0.28", 'bootloader_type': "NETWORK"}
+
+
+def probeable(entry):
+    # A booted device runs an application, its bootloader cannot be opened; an unbooted USB device
+    # would be rebooted into the bootloader
+    if entry['state'] == "BOOTED":
+        return False
+    return not (entry['state'] == "UNBOOTED" and "USB" in entry.get('protocol', ""))
+
+
+class Inventory:
+    def __init__(self, provider=None, path=DEFAULT_CACHE, ttl=10.0, probe_ttl=600.0, workers=8,
+                 probe_timeout=5.0, roles=ROLES):
+        # ttl: age (s) after which resolve() scans again, probe_ttl: age after which a device is
+        # probed again (versions only change when it is flashed)
+        self.provider = provider
+        self.path = path
+        self.ttl = ttl
+        self.probe_ttl = probe_ttl
+        self.workers = workers
+        self.probe_timeout = probe_timeout
+        self.roles = dict(roles)
+        self.cache = None
+        self.cache_mtime = None
+
+    def load(self):
+        # {'version', 'scanned_at', 'devices': {mxid: entry}}, re-read only when the file changed
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {'version': CACHE_VERSION, 'scanned_at': 0.0, 'devices': {}}
+        if mtime != self.cache_mtime:
+            try:
+                with open(self.path) as f:
+                    cache = json.load(f)
+            except ValueError:
+                cache = None
+            if not cache or cache.get('version') != CACHE_VERSION:
+                cache = {'version': CACHE_VERSION, 'scanned_at': 0.0, 'devices': {}}
+            self.cache, self.cache_mtime = cache, mtime
+        return self.cache
+
+    def save(self, cache):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp, self.path)
+        self.cache, self.cache_mtime = cache, os.stat(self.path).st_mtime_ns
+
+    def _probe_all(self, entries):
+        # Probes entries concurrently, fills in the versions or the error
+        if not entries:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, len(entries)))
+        futures = {executor.submit(self.provider.probe, entry): entry for entry in entries}
+        done, not_done = wait(futures, timeout=self.probe_timeout)
+        now = time.time()
+        for future, entry in futures.items():
+            if future in not_done:
+                entry['error'] = f"probe timed out after {self.probe_timeout} s"
+                continue
+            try:
+                entry.update(future.result())
+                entry['probed_at'] = now
+                entry['error'] = None
+            except Exception as e:
+                entry['error'] = str(e)
+        executor.shutdown(wait=False)  # a hung probe is left to finish on its own
+
+    def scan(self, probe=True):
+        # Scans and probes (unless probe is False), saves the inventory; returns (devices, events)
+        # with events a list of (mxid, 'found' | 'dropped' | 'reconnected')
+        cache = self.load()
+        previous = cache['devices']
+        now = time.time()
+        seen = {entry['mxid']: entry for entry in self.provider.scan()}
+        devices, events, to_probe = {}, [], []
+        for mxid, found in seen.items():
+            entry = dict(previous.get(mxid, {}))
+            changed = not entry.get('online')
+            if changed:
+                events.append((mxid, "reconnected" if entry else "found"))
+            stale = now - (entry.get('probed_at') or 0.0) > self.probe_ttl
+            entry.update(found, online=True, last_seen=now)
+            if probe and probeable(entry) and (stale or changed):
+                to_probe.append(entry)
+            devices[mxid] = entry
+        for mxid, entry in previous.items():
+            if mxid not in seen:
+                if entry.get('online'):
+                    events.append((mxid, "dropped"))
+                devices[mxid] = dict(entry, online=False)
+        self._probe_all(to_probe)
+        self.save({'version': CACHE_VERSION, 'scanned_at': now, 'devices': devices})
+        return devices, events
+
+    def devices(self, max_age=None, probe=True):
+        # Inventory no older than max_age (default ttl), scans if the cache is older
+        max_age = self.ttl if max_age is None else max_age
+        cache = self.load()
+        if time.time() - cache['scanned_at'] > max_age and self.provider is not None:
+            return self.scan(probe)[0]
+        return cache['devices']
+
+    def resolve(self, key, max_age=None, online=True):
+        # Entry of a device by role ('base'), MXID or name (IP); None if unknown (or offline)
+        mxid = self.roles.get(key, key)
+        devices = self.devices(max_age)
+        entry = devices.get(mxid)
+        if entry is None:
+            entry = next((e for e in devices.values() if e.get('name') == key), None)
+        if entry is None or (online and not entry.get('online')):
+            return None
+        return entry
+
+    def online(self, max_age=None, probe=True):
+        return [entry for entry in self.devices(max_age, probe).values() if entry.get('online')]
+
+    def watch(self, interval=2.0, callback=None, stop=None):
+        # Rescans every interval until stop (a threading.Event) is set, callback(events, devices)
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            start = time.perf_counter()
+            devices, events = self.scan()
+            if callback is not None:
+                callback(events, devices)
+            stop.wait(max(interval - (time.perf_counter() - start), 0.0))
+
+
+def describe(entry):
+    state = entry['state'] if entry.get('online') else "offline"
+    versions = ", ".join(f"{field.replace('_version', '')} {entry[field]}"
+                         for field in PROBED_FIELDS if entry.get(field))
+    error = f" ({entry['error']})" if entry.get('error') else ""
+    return f"{entry['mxid']} {entry['name']} {entry.get('protocol', '')} {state} {versions}{error}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cached OAK device discovery")
+    parser.add_argument("command", choices=["scan", "watch", "get"])
+    parser.add_argument("key", nargs="?", help="get: role (base/top), MXID or IP")
+    parser.add_argument("--cache", default=DEFAULT_CACHE)
+    parser.add_argument("--ttl", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--fake", type=int, default=0, help="use FakeProvider with this many devices")
+    args = parser.parse_args()
+
+    provider = FakeProvider(args.fake) if args.fake else DaiProvider()
+    inventory = Inventory(provider, args.cache, ttl=args.ttl, workers=args.workers)
+    if args.command == "scan":
+        start = time.perf_counter()
+        devices, events = inventory.scan()
+        print(f"Scanned {len(devices)} devices in {time.perf_counter() - start:.2f} s")
+        for entry in devices.values():
+            print(describe(entry))
+    elif args.command == "get":
+        start = time.perf_counter()
+        entry = inventory.resolve(args.key)
+        elapsed = (time.perf_counter() - start) * 1e3
+        if entry is None:
+            raise SystemExit(f"{args.key} not found")
+        print(f"{entry['name']}  ({describe(entry)}, {elapsed:.1f} ms)")
+    else:
+        def report(events, devices):
+            for mxid, event in events:
+                print(f"{time.strftime('%H:%M:%S')} {event}: {describe(devices[mxid])}")
+
+        try:
+            inventory.watch(args.interval, report)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,54 @@
+# Frame synchronizer for any number of devices.
+#
+# Every device gets a deque of (timestamp, msg) in arrival order, which for one device is also
+# timestamp order. A set is emitted when the oldest frame of every device lies within `tolerance`
+# of each other. Otherwise the heads that are too old to match the newest head are dropped, so
+# each frame is looked at a constant number of times (amortized O(1) per frame and device).
+# The deques are capped, a stalled device makes the others drop their oldest frames instead of
+# growing without bound.
+from collections import deque
+from datetime import timedelta
+
+
+def _seconds(timestamp):
+    return timestamp.total_seconds() if isinstance(timestamp, timedelta) else float(timestamp)
+
+
+class FrameSync:
+    def __init__(self, keys, tolerance, max_queue=8):
+        # keys: one per stream (e.g. MXID or (MXID, camera)), tolerance in seconds or a timedelta
+        self.tolerance = _seconds(tolerance)
+        self.queues = {key: deque() for key in keys}
+        self.max_queue = max_queue
+        self.matched = 0  # synced sets emitted
+        self.dropped = {key: 0 for key in keys}  # frames without a partner on every device
+        self.overflow = {key: 0 for key in keys}  # frames pushed out by max_queue
+
+    def add(self, key, timestamp, msg):
+        # Add a frame; returns {key: msg} when this completes a synced set, otherwise None
+        q = self.queues[key]
+        if len(q) >= self.max_queue:
+            q.popleft()
+            self.overflow[key] += 1
+        q.append((_seconds(timestamp), msg))
+        return self._match()
+
+    def _match(self):
+        queues = self.queues
+        while all(queues.values()):
+            newest = max(q[0][0] for q in queues.values())
+            stale = False
+            for key, q in queues.items():
+                # A head older than newest - tolerance can never be matched any more
+                while q and q[0][0] < newest - self.tolerance:
+                    q.popleft()
+                    self.dropped[key] += 1
+                    stale = True
+            if stale:
+                continue
+            self.matched += 1
+            return {key: q.popleft()[1] for key, q in queues.items()}
+        return None
+
+    def stats(self):
+        return {'matched': self.matched, 'dropped': dict(self.dropped), 'overflow': dict(self.overflow)}
@@ -0,0 +1,120 @@
+# Background frame writers so saving never stalls the loop that drains the device queues.
+#
+# FrameWriter encodes and writes on a small thread pool (cv2.imencode and file writes release the
+# GIL). The number of frames waiting is bounded: when the encoders cannot keep up a frame is
+# dropped and counted instead of blocking the capture loop. Output formats:
+#   png   lossless, slow to encode
+#   jpeg  with quality 0-100, fast
+#   raw   frames appended uncompressed to chunked .npy files (frames_00000.npy holds the first
+#         chunk_frames frames, shape (n, h, w, c)), with timestamps_00000.npy next to it.
+#         Fastest, read back with np.load(..., mmap_mode='r').
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class RawChunkWriter:
+    # Appends equally sized frames of one device to chunked .npy files
+    def __init__(self, directory, chunk_frames=256):
+        self.directory = directory
+        self.chunk_frames = chunk_frames
+        self.chunk = None
+        self.times = None
+        self.index = 0
+        self.fill = 0
+        self.lock = threading.Lock()
+        existing = [f for f in os.listdir(directory) if f.startswith("frames_") and f.endswith(".npy")]
+        self.chunk_id = len(existing)  # do not overwrite chunks of an earlier session
+
+    def _open(self, frame):
+        name = f"{self.chunk_id:05d}.npy"
+        self.chunk = np.lib.format.open_memmap(os.path.join(self.directory, "frames_" + name), mode="w+",
+                                               dtype=frame.dtype, shape=(self.chunk_frames,) + frame.shape)
+        self.times = np.lib.format.open_memmap(os.path.join(self.directory, "timestamps_" + name), mode="w+",
+                                               dtype=np.float64, shape=(self.chunk_frames,))
+        self.times[:] = np.nan
+        self.fill = 0
+
+    def write(self, frame, timestamp):
+        with self.lock:
+            if self.chunk is None:
+                self._open(frame)
+            self.chunk[self.fill] = frame
+            self.times[self.fill] = timestamp
+            self.fill += 1
+            if self.fill == self.chunk_frames:
+                self._close_chunk()
+
+    def _close_chunk(self):
+        self.chunk.flush()
+        self.times.flush()
+        self.chunk = self.times = None
+        self.chunk_id += 1
+
+    def close(self):
+        # The last chunk keeps its full size, unused slots have a NaN timestamp
+        with self.lock:
+            if self.chunk is not None:
+                self._close_chunk()
+
+
+class FrameWriter:
+    def __init__(self, fmt="png", quality=95, workers=2, max_pending=32, chunk_frames=256):
+        self.fmt = fmt
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality] if fmt == "jpeg" else []
+        self.ext = {"png": ".png", "jpeg": ".jpg"}.get(fmt)
+        self.chunk_frames = chunk_frames
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.raw = {}
+        self.lock = threading.Lock()
+        self.written = {}
+        self.dropped = {}
+        self.errors = 0
+        self.start = time.perf_counter()
+
+    def submit(self, directory, name, frame, timestamp=0.0):
+        # Queue one frame, returns False if it was dropped because too many are waiting
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.dropped[directory] = self.dropped.get(directory, 0) + 1
+            return False
+        self.pool.submit(self._write, directory, name, frame, timestamp)
+        return True
+
+    def _write(self, directory, name, frame, timestamp):
+        try:
+            if self.fmt == "raw":
+                writer = self.raw.get(directory)
+                if writer is None:
+                    with self.lock:
+                        writer = self.raw.setdefault(directory, RawChunkWriter(directory, self.chunk_frames))
+                writer.write(frame, timestamp)
+            else:
+                ok, encoded = cv2.imencode(self.ext, frame, self.params)
+                if not ok:
+                    raise RuntimeError(f"Could not encode {name}")
+                with open(os.path.join(directory, name + self.ext), "wb") as f:
+                    f.write(encoded)
+            with self.lock:
+                self.written[directory] = self.written.get(directory, 0) + 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Error writing {name}: {e}")
+        finally:
+            self.slots.release()
+
+    def rates(self):
+        # Sustained frames/s written per directory since the writer started
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            return {d: n / elapsed for d, n in self.written.items()}
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        for writer in self.raw.values():
+            writer.close()
@@ -2,8 +2,10 @@ import depthai as dai
 
 # Don't need to create a pipeline for extracting camera info
 
-# Extract calibration interface to read camera extrinsics/intrinsics
-calib = dai.CalibrationHandler()
+# Read the calibration stored on the device (a bare dai.CalibrationHandler() is empty).
+# machine_vision/calibration.py pull saves all of it per MXID for the host tools.
+with dai.Device() as device:
+    calib = device.readCalibration()
 
 # Get the extrinsics between IMU and RGB camera
 imu_T_rgb = calib.getCameraToImuExtrinsics(dai.CameraBoardSocket.CAM_A)
@@ -11,4 +13,4 @@ imu_T_rgb = calib.getCameraToImuExtrinsics(dai.CameraBoardSocket.CAM_A)
 # imu_T_rgb = calib.getCameraTranslationVector(dai.CameraBoardSocket.CAM_A)
 
 # Display results
-print(imu_T_rgb)  # 4x4 numpy array
\ No newline at end of file
+print(imu_T_rgb)  # 4x4 numpy array
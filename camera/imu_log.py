@@ -0,0 +1,177 @@
+# Batched IMU ingestion for the host scripts (test.py), replacing the three prints per packet.
+#
+# ImuIngest is the handler of the IMU queue reader (see acquisition.py). Every message is turned
+# into one array per sensor and appended to a preallocated ring buffer with the device timestamps.
+# An IMUPacket carries the latest report of every enabled sensor, so a 100 Hz magnetometer shows
+# up again in the 500 Hz accelerometer packets: reports are kept once, by sequence number, and
+# gaps in the sequence are counted as drops. With a log directory the samples are also written in
+# chunks of compressed .npz files (imu_00000.npz, ...) by a background thread.
+#
+#   python imu_log.py ./imu_logs   prints sample counts, rates and gaps of a log
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# sensor name -> IMUPacket attribute
+SENSORS = {
+    'accelerometer': 'acceleroMeter',
+    'gyroscope': 'gyroscope',
+    'magnetometer': 'magneticField',
+}
+SAMPLE_DTYPE = np.dtype([
+    ('t', np.float64),  # device time [s]
+    ('seq', np.int64),  # report sequence number
+    ('xyz', np.float32, 3),
+])
+
+
+class SensorRing:
+    def __init__(self, capacity=8192):
+        self.data = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.total = 0  # samples appended since start
+        self.last_seq = None
+        self.dropped = 0
+        self.repeated = 0
+
+    def append(self, samples):
+        # samples: SAMPLE_DTYPE array of one batch, in arrival order; repeats of the previous report
+        # are removed here and sequence gaps counted
+        if len(samples) == 0:
+            return samples
+        seq = samples['seq']
+        previous = np.concatenate([[seq[0] - 1 if self.last_seq is None else self.last_seq], seq[:-1]])
+        step = seq - previous
+        fresh = step > 0  # a step <= 0 is the same report again (or a restarted sequence)
+        self.repeated += int(np.count_nonzero(step == 0))
+        self.dropped += int(np.sum(step[step > 1] - 1))
+        samples = samples[fresh]
+        self.last_seq = int(seq[-1])
+        count = len(samples)
+        capacity = len(self.data)
+        tail = samples[-capacity:]  # a batch larger than the ring keeps its newest samples
+        n = len(tail)
+        start = (self.total + count - n) % capacity
+        first = min(n, capacity - start)
+        self.data[start:start + first] = tail[:first]
+        self.data[:n - first] = tail[first:]
+        self.total += count
+        return samples
+
+    def latest(self, n=1):
+        # The newest n samples, oldest first (a copy)
+        n = min(n, self.total, len(self.data))
+        idx = (self.total - n + np.arange(n)) % len(self.data)
+        return self.data[idx]
+
+    def rate(self, window=1.0):
+        # Effective sample rate [Hz] over the last `window` seconds of device time
+        recent = self.latest(len(self.data))
+        if len(recent) < 2:
+            return 0.0
+        recent = recent[recent['t'] >= recent['t'][-1] - window]
+        span = recent['t'][-1] - recent['t'][0]
+        return (len(recent) - 1) / span if span > 0 else 0.0
+
+
+class ImuIngest:
+    def __init__(self, sensors=tuple(SENSORS), capacity=8192, log_dir=None, chunk_samples=20000):
+        self.sensors = list(sensors)
+        self.rings = {name: SensorRing(capacity) for name in self.sensors}
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.log_dir = log_dir
+        self.chunk_samples = chunk_samples
+        self.pending = {name: [] for name in self.sensors}
+        self.pending_count = 0
+        self.chunk_id = 0
+        self.writer = None
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            existing = [f for f in os.listdir(log_dir) if f.startswith("imu_") and f.endswith(".npz")]
+            self.chunk_id = len(existing)  # do not overwrite logs of an earlier session
+            self.writer = ThreadPoolExecutor(max_workers=1)
+
+    @staticmethod
+    def batch(packets, attribute):
+        # One SAMPLE_DTYPE array of a sensor from a list of IMUPackets
+        out = np.empty(len(packets), dtype=SAMPLE_DTYPE)
+        for i, packet in enumerate(packets):
+            report = getattr(packet, attribute)
+            out[i] = (report.getTimestampDevice().total_seconds(), report.sequence,
+                      (report.x, report.y, report.z))
+        return out
+
+    def __call__(self, msg):
+        # Queue reader handler for one IMUData message
+        packets = msg.packets
+        with self.lock:
+            self.messages += 1
+            for name in self.sensors:
+                fresh = self.rings[name].append(self.batch(packets, SENSORS[name]))
+                if self.writer is not None and len(fresh):
+                    self.pending[name].append(fresh)
+                    self.pending_count += len(fresh)
+            if self.writer is not None and self.pending_count >= self.chunk_samples:
+                self._flush()
+
+    def _flush(self):
+        arrays = {name: np.concatenate(parts) if parts else np.zeros(0, dtype=SAMPLE_DTYPE)
+                  for name, parts in self.pending.items()}
+        path = os.path.join(self.log_dir, f"imu_{self.chunk_id:05d}.npz")
+        self.writer.submit(np.savez_compressed, path, **arrays)  # zlib releases the GIL
+        self.chunk_id += 1
+        self.pending = {name: [] for name in self.sensors}
+        self.pending_count = 0
+
+    def latest(self, name):
+        with self.lock:
+            ring = self.rings[name]
+            return ring.latest(1)[0] if ring.total else None
+
+    def report(self, window=1.0):
+        # {sensor: {'rate', 'samples', 'dropped', 'repeated'}}
+        with self.lock:
+            return {name: {'rate': ring.rate(window), 'samples': ring.total, 'dropped': ring.dropped,
+                           'repeated': ring.repeated}
+                    for name, ring in self.rings.items()}
+
+    def close(self):
+        if self.writer is not None:
+            with self.lock:
+                if self.pending_count:
+                    self._flush()
+            self.writer.shutdown(wait=True)
+            self.writer = None
+
+
+def load_log(log_dir):
+    # {sensor: SAMPLE_DTYPE array} of all chunks in a log directory, in order
+    parts = {}
+    for name in sorted(f for f in os.listdir(log_dir) if f.startswith("imu_") and f.endswith(".npz")):
+        with np.load(os.path.join(log_dir, name)) as chunk:
+            for sensor in chunk.files:
+                parts.setdefault(sensor, []).append(chunk[sensor])
+    return {sensor: np.concatenate(arrays) for sensor, arrays in parts.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize an IMU log written by test.py")
+    parser.add_argument("log_dir")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    log = load_log(args.log_dir)
+    print(f"Loaded in {time.perf_counter() - start:.2f} s")
+    for sensor, samples in log.items():
+        if len(samples) < 2:
+            print(f"{sensor}: {len(samples)} samples")
+            continue
+        span = samples['t'][-1] - samples['t'][0]
+        gaps = np.diff(samples['seq'])
+        print(f"{sensor}: {len(samples)} samples over {span:.1f} s, {(len(samples) - 1) / span:.1f} Hz, "
+              f"{int(np.sum(gaps[gaps > 1] - 1))} missing, largest time step {1e3 * np.diff(samples['t']).max():.1f} ms")
@@ -1,12 +1,33 @@
 from pathlib import Path
 
+import argparse
 import cv2
 import math
 import depthai as dai
 import os
 import contextlib
+import time
 from datetime import timedelta
 
+from discovery import DaiProvider, Inventory
+from frame_sync import FrameSync
+from frame_writer import FrameWriter
+
+# Interactive (default): preview windows, press "s" to save one synced set, "q" to quit
+# Headless: no windows, saves every --every synced set until Ctrl+C or --duration, e.g.
+#   python take_pics.py --headless --format jpeg --quality 90
+#   python take_pics.py --headless --preview --format raw
+parser = argparse.ArgumentParser(description="Capture synced frames from all connected OAK-D devices")
+parser.add_argument("--headless", action="store_true", help="no windows, save continuously")
+parser.add_argument("--preview", action="store_true", help="show preview windows in headless mode")
+parser.add_argument("--preview-fps", type=float, default=10.0, help="cap on the preview refresh rate")
+parser.add_argument("--every", type=int, default=1, help="headless: save every Nth synced set")
+parser.add_argument("--duration", type=float, default=None, help="headless: stop after this many seconds")
+parser.add_argument("--format", choices=["png", "jpeg", "raw"], default="png")
+parser.add_argument("--quality", type=int, default=95, help="JPEG quality")
+parser.add_argument("--workers", type=int, default=2, help="encoder threads")
+args = parser.parse_args()
+
 fps = 30
 cwd = Path.cwd()
 mindevices = 2 # set if connecting to both at once is annoying
@@ -27,7 +48,9 @@ def create_pipeline(cam_list):
 
 # https://docs.python.org/3/library/contextlib.html#contextlib.ExitStack
 with contextlib.ExitStack() as stack:
-    device_infos = dai.Device.getAllAvailableDevices()
+    # Cached inventory (discovery.py), scans only when it is older than its ttl. No bootloader
+    # probes: they would hold (or reboot) the devices opened right below
+    device_infos = [dai.DeviceInfo(entry['name']) for entry in Inventory(DaiProvider()).online(probe=False)]
 
     if len(device_infos) == 0: raise RuntimeError("No devices found!")
     if len(device_infos) < mindevices: raise RuntimeError("Did not connect to all devices")
@@ -44,7 +67,7 @@ with contextlib.ExitStack() as stack:
 
         cam_list = {'rgb'} # only interested in rgb camera
         # make folders for storing images
-        newdir = os.path.join(cwd, device_info.getMxId())
+        newdir = os.path.join(cwd, device.getMxId())
         os.makedirs(newdir, exist_ok=True)
 
         # Get a customized pipeline based on identified device type
@@ -54,51 +77,84 @@ with contextlib.ExitStack() as stack:
         for cam in cam_list:
             queues.append({
                 'queue': device.getOutputQueue(name=cam, maxSize=4, blocking=False),
-                'msgs': [], # Frame msgs
+                'key': (device.getMxId(), cam),
                 'mx': device.getMxId(),
                 'cam': cam,
+                'dir': newdir,
+                'received': 0,
                 'cnt' : len(os.listdir(newdir)) # for unique folder filename 
             })
         # enable same lighting conditions as expected in NN
         device.setIrLaserDotProjectorIntensity(0.5)
         device.setIrFloodLightIntensity(0.0)
 
-    def check_sync(queues, timestamp):
-        matching_frames = []
-        for q in queues:
-            for i, msg in enumerate(q['msgs']):
-                time_diff = abs(msg.getTimestamp() - timestamp)
-                # So below 17ms @ 30 FPS => frames are in sync
-                if time_diff <= timedelta(milliseconds=math.ceil(500 / fps)):
-                    matching_frames.append(i)
-                    break
+    # So below 17ms @ 30 FPS => frames are in sync
+    sync = FrameSync([q['key'] for q in queues], timedelta(milliseconds=math.ceil(500 / fps)))
+
+    writer = FrameWriter(args.format, args.quality, args.workers)
+    show_preview = args.preview or not args.headless
+    preview_period = 1.0 / args.preview_fps
+    last_preview = 0.0
+    start = last_report = time.perf_counter()
+    received_at_report = {q['key']: 0 for q in queues}
+    synced_sets = 0
+    save_frame = 0 # synced sets still to save in interactive mode
 
-        if len(matching_frames) == len(queues):
-            # We have all frames synced. Remove the excess ones
-            for i, q in enumerate(queues):
-                q['msgs'] = q['msgs'][matching_frames[i]:]
-            return True
-        else:
-            return False
-
-    save_frame = 0
-    while True:
-        for q in queues:
-            new_msg = q['queue'].tryGet()
-            if new_msg is not None:
-                q['msgs'].append(new_msg)
-                if check_sync(queues, new_msg.getTimestamp()):
-                    # frames are synchronised
-                    for q in queues:
-                        frame = q['msgs'].pop(0).getCvFrame()
-                        cv2.imshow(f"{q['cam']} - {q['mx']}", frame)
-                        if save_frame != 0:
-                            q['cnt'] += 1
-                            frame_file = os.path.join(cwd, str(q['mx']) + "/" + str(q['cnt']) + ".png")
-                            cv2.imwrite(frame_file,frame)
-                            save_frame -= 1
-                                
-        if cv2.waitKey(1) == ord('q'):
-            break
-        if cv2.waitKey(1) == ord("s"):
-            save_frame = len(device_infos)
\ No newline at end of file
+    try:
+        while True:
+            idle = True
+            for q in queues:
+                new_msg = q['queue'].tryGet()
+                if new_msg is None:
+                    continue
+                idle = False
+                q['received'] += 1
+                synced = sync.add(q['key'], new_msg.getTimestamp(), new_msg)
+                if synced is None:
+                    continue
+                # frames are synchronised
+                synced_sets += 1
+                save = synced_sets % args.every == 0 if args.headless else save_frame > 0
+                now = time.perf_counter()
+                preview = show_preview and now - last_preview >= preview_period
+                if preview:
+                    last_preview = now
+                if not (save or preview):
+                    continue
+                for dq in queues:
+                    msg = synced[dq['key']]
+                    frame = msg.getCvFrame()
+                    if preview:
+                        cv2.imshow(f"{dq['cam']} - {dq['mx']}", frame)
+                    if save:
+                        dq['cnt'] += 1
+                        writer.submit(dq['dir'], str(dq['cnt']), frame, msg.getTimestamp().total_seconds())
+                if save and save_frame > 0:
+                    save_frame -= 1
+
+            now = time.perf_counter()
+            if now - last_report >= 5.0:
+                # Sustained rates per device: frames from the device, frames written to disk
+                written = writer.rates()
+                for q in queues:
+                    rate = (q['received'] - received_at_report[q['key']]) / (now - last_report)
+                    received_at_report[q['key']] = q['received']
+                    print(f"{q['mx']} {q['cam']}: {rate:.1f} fps in, {written.get(q['dir'], 0.0):.1f} fps written, "
+                          f"{writer.dropped.get(q['dir'], 0)} not saved (encoders busy)")
+                print(f"Synced sets: {sync.matched}, dropped: {sync.dropped}, overflow: {sync.overflow}")
+                last_report = now
+            if args.headless and args.duration is not None and now - start >= args.duration:
+                break
+
+            if show_preview:
+                key = cv2.waitKey(1)
+                if key == ord('q'):
+                    break
+                if key == ord("s"):
+                    save_frame = 1
+            elif idle:
+                time.sleep(0.001)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
\ No newline at end of file
@@ -1,4 +1,5 @@
 # first, import all necessary modules
+import time
 from pathlib import Path
 
 import blobconverter
@@ -6,6 +7,9 @@ import cv2
 import depthai
 import numpy as np
 
+from acquisition import LatestSlot, start_readers, stop_readers
+from imu_log import ImuIngest
+
 
 pipeline = depthai.Pipeline()
 
@@ -119,126 +123,120 @@ imu.out.link(xout_imu.input)
 mxid = "14442C10515CF0D600" # MXID of base camera
 #mxid = "14442C101102F4D600" # MXID of top camera
 device_info = depthai.DeviceInfo(mxid)
+
+render_fps = 15 # display rate, the queues are drained at full rate regardless
+imu_print_interval = 0.2 # seconds between IMU prints
+imu_log_dir = None # e.g. "./imu_logs" to keep every IMU sample (compressed .npz chunks)
+
+imuf = "{:.06f}"
+numf = "{:.02f}"
+
+
+def detection_arrays(detections, width, height):
+    # All detections at once: pixel boxes (n, 4) x1 y1 x2 y2, centers (n, 2), labels, z [mm], confidence
+    raw = np.array([(d.xmin, d.ymin, d.xmax, d.ymax, d.label, d.spatialCoordinates.z, d.confidence)
+                    for d in detections], dtype=np.float32).reshape(-1, 7)
+    size = np.array([width, height], dtype=np.float32)
+    corners = np.clip(raw[:, :4], 0, 1).reshape(-1, 2, 2) * size
+    boxes = corners.reshape(-1, 4).astype(int)
+    # Center in pixels, clipped to the frame (x scales with the width, y with the height)
+    centers = np.clip(corners.mean(axis=1), 0, size - 1).astype(int)
+    return boxes, centers, raw[:, 4].astype(int), raw[:, 5], raw[:, 6]
+
+
+def draw_detections(frame, detections):
+    boxes, centers, labels, z, confidence = detection_arrays(detections, frame.shape[1], frame.shape[0])
+    for (x1, y1, x2, y2), (c_x, c_y), label, dist, conf in zip(boxes, centers, labels, z, confidence):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        cv2.putText(frame,labelMap[label],(x1,y1+40), cv2.FONT_HERSHEY_TRIPLEX,0.5,(255,255,255))
+        #center and get distance from map
+        color = (0,0,255) if label == 0 else (255,0,0)
+        cv2.circle(frame,(int(c_x),int(c_y)),radius=1,color=color)
+        cv2.putText(frame,("z [mm]: " + numf.format(dist)),(x1,y1+20), cv2.FONT_HERSHEY_TRIPLEX,0.5,(0,255,0))
+        cv2.putText(frame,("confidence: " + numf.format(conf*100) + "%"),(x1,y1+60), cv2.FONT_HERSHEY_TRIPLEX,0.5,(0,255,0))
+
+
+def print_imu(imu_ingest):
+    # Newest sample, effective rate and drops of every sensor
+    report = imu_ingest.report()
+    for name in ("accelerometer", "gyroscope", "magnetometer"):
+        sample = imu_ingest.latest(name)
+        if sample is None:
+            print(f"{name.capitalize():13s} waiting")
+            continue
+        x, y, z = sample['xyz']
+        stats = report[name]
+        print(f"{name.capitalize():13s} x:" + imuf.format(x) + " y:" + imuf.format(y) + " z:" + imuf.format(z)
+              + f"  {stats['rate']:6.1f} Hz  dropped {stats['dropped']}   ")
+    print('\033[4A') # move cursor up 3 lines (4-1 due to newline from print)
+
+
 with depthai.Device(pipeline, devInfo=device_info) as device:
     # From this point, the Device will be in "running" mode and will start sending data via XLink
 
-    # To consume the device results, we get two output queues from the device, with stream names we assigned earlier
     device.setIrLaserDotProjectorIntensity(0.5) # enable IR dot projector (visible with mono camera)
     device.setIrFloodLightIntensity(0.0)
-    q_rgb = device.getOutputQueue("rgb")
-    q_mono_r = device.getOutputQueue("mono_r")
-    #q_nn = device.getOutputQueue("nn")
-    #q_depth = device.getOutputQueue("disparity", maxSize=4, blocking=False)
-    q_spatial = device.getOutputQueue("spatial", maxSize=1, blocking=False)
-    q_imu = device.getOutputQueue("imu", maxSize=50, blocking=False)
-
-    # Here, some of the default values are defined. Frame will be an image from "rgb" stream, detections will contain nn results
-    frame = None
-    #frame_depth = None
-    detections = []
-    det_dists = []
-    # temp while testing depth
-    scale = 720
-
-    # Since the detections returned by nn have values from <0..1> range, they need to be multiplied by frame width/height to
-    # receive the actual position of the bounding box on the image
-    def frameNorm(frame, bbox,scale=None):
-        if scale is not None:
-            bbox = bbox*scale #TODO: fix
-        normVals = np.full(len(bbox), frame.shape[0])
-        normVals[::2] = frame.shape[1]
-        return (np.clip(np.array(bbox), 0, 1) * normVals).astype(int)
-
-    def detCenter(frame,det):
-        center_x = det.xmin + (det.xmax - det.xmin)/2
-        center_y = det.ymin + (det.ymax - det.ymin)/2
-        #normalize
-        center_x = np.clip(center_x * frame.shape[0]).astype(int)
-        center_y = np.clip(center_y * frame.shape[1]).astype(int)
-        return center_x,center_y
-    
-    imuf = "{:.06f}"
-    numf = "{:.02f}"
-
-
-    while True:
-        # we try to fetch the data from nn/rgb queues. tryGet will return either the data packet or None if there isn't any
-        in_rgb = q_rgb.tryGet()
-        #in_nn = q_nn.tryGet()
-        #in_disparity = q_depth.tryGet() # blocking call
-        in_spacial = q_spatial.tryGet()
-        in_mono_r = q_mono_r.tryGet()
-        in_imu = q_imu.tryGet()
-
-        if in_mono_r is not None:
-            # If the packet from RGB camera is present, we're retrieving the frame in OpenCV format using getCvFrame
-            frame_r = in_mono_r.getCvFrame()
-            cv2.imshow("Right", frame_r)
-
-        if in_rgb is not None:
-            # If the packet from RGB camera is present, we're retrieving the frame in OpenCV format using getCvFrame
-            frame = in_rgb.getCvFrame()
-
-        #if in_disparity is not None:
-        #    frame_depth = in_disparity.getCvFrame()
-
-        #if in_nn is not None:
-        #    # when data from nn is received, we take the detections array that contains mobilenet-ssd results
-        #    detections = in_nn.detections
-
-        if in_spacial is not None:
-            # If the packet from RGB camera is present, we're retrieving the frame in OpenCV format using getCvFrame
-            det_dists = in_spacial.detections
-
-        if frame is not None:
-            for detection in det_dists:
-                # for each bounding box, we first normalize it to match the frame size
-                bbox = frameNorm(frame, (detection.xmin, detection.ymin, detection.xmax, detection.ymax))
-                # and then draw a rectangle on the frame to show the actual result
-                cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (255, 0, 0), 2)
-                cv2.putText(frame,labelMap[detection.label],(bbox[0],bbox[1]+40), cv2.FONT_HERSHEY_TRIPLEX,0.5,(255,255,255))
-                #center and get distance from map
-                c_x,c_y = detCenter(frame,detection)
-                if detection.label == 0:
-                    color=(0,0,255)
-                else:
-                    color=(255,0,0)
-                cv2.circle(frame,(c_x,c_y),radius=1,color=color)
-                cv2.putText(frame,("z [mm]: " + numf.format(detection.spatialCoordinates.z)),(bbox[0],bbox[1]+20), cv2.FONT_HERSHEY_TRIPLEX,0.5,(0,255,0))
-                cv2.putText(frame,("confidence: " + numf.format(detection.confidence*100) + "%"),(bbox[0],bbox[1]+60), cv2.FONT_HERSHEY_TRIPLEX,0.5,(0,255,0))
-            # After all the drawing is finished, we show the frame on the screen
-            cv2.imshow("preview", frame)
-
-        if in_imu is not None:
-            imuPackets = in_imu.packets
-            for imuPacket in imuPackets:
-                acceleroValues = imuPacket.acceleroMeter
-                gyroValues = imuPacket.gyroscope
-                magnetometerValues = imuPacket.magneticField
-
-                print("Accelerometer x:" + imuf.format(acceleroValues.x) + " y:" + imuf.format(acceleroValues.y) + " z:" + imuf.format(acceleroValues.z))
-                print("Gyroscope x:" + imuf.format(gyroValues.x) + " y:" + imuf.format(gyroValues.y) + " z:" + imuf.format(gyroValues.z))
-                print("Magnetometer x:" + imuf.format(magnetometerValues.x) + " y:" + imuf.format(magnetometerValues.y) + " z:" + imuf.format(magnetometerValues.z))
-                print('\033[4A') # move cursor up 3 lines (4-1 due to newline from print)
-
-        #if frame_depth is not None:
-        #    #normalize
-        #    frame_depth = (frame_depth * (255 / depth.initialConfig.getMaxDisparity())).astype(np.uint8)
-        #    # apply colormap
-        #    frame_depth = cv2.applyColorMap(frame_depth, cv2.COLORMAP_JET)
-        #    # draw circles for detected center dot
-        #    for detection in det_dists:
-        #        bbox = frameNorm(frame_depth, (detection.xmin, detection.ymin, detection.xmax, detection.ymax))
-        #        cv2.rectangle(frame_depth, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (255, 0, 0), 2)
-        #        cv2.putText(frame_depth,labelMap[detection.label],(bbox[0],bbox[1]+40), cv2.FONT_HERSHEY_TRIPLEX,0.5,(255,255,255))
-        #        #center and get distance from map
-        #        c_x,c_y = detCenter(frame_depth,detection)
-        #        cv2.circle(frame_depth,(c_x,c_y),radius=1,color=(0,0,255))
-        #        cv2.putText(frame_depth,("z [mm]: " + str(detection.spatialCoordinates.z)),(bbox[0],bbox[1]+20), cv2.FONT_HERSHEY_TRIPLEX,0.5,(255,255,255))
-        #    cv2.imshow("disparity", frame_depth)
-
-        # at any time, you can press "q" and exit the main loop, therefore exiting the program itself
-        if cv2.waitKey(1) == ord('q'):
-            break
-
 
+    # Every queue is drained by its own thread into a latest-value slot, the loop below only shows
+    # the newest of each at render_fps. Frames that were never shown are counted, not queued.
+    rgb_slot = LatestSlot()
+    mono_slot = LatestSlot()
+    spatial_slot = LatestSlot()
+    imu_ingest = ImuIngest(log_dir=imu_log_dir)
+    readers = start_readers({
+        "rgb": (device.getOutputQueue("rgb", maxSize=4, blocking=False), lambda msg: rgb_slot.put(msg.getCvFrame())),
+        "mono_r": (device.getOutputQueue("mono_r", maxSize=4, blocking=False), lambda msg: mono_slot.put(msg.getCvFrame())),
+        "spatial": (device.getOutputQueue("spatial", maxSize=4, blocking=False), lambda msg: spatial_slot.put(msg.detections)),
+        # Every IMU sample goes into ring buffers (and the log), see imu_log.py
+        "imu": (device.getOutputQueue("imu", maxSize=50, blocking=False), imu_ingest),
+    })
+
+    period = 1.0 / render_fps
+    next_render = time.perf_counter()
+    next_imu_print = next_render
+    try:
+        while True:
+            now = time.perf_counter()
+            if now < next_render:
+                time.sleep(next_render - now)
+            next_render = max(next_render + period, time.perf_counter())
+
+            frame_r, new_r = mono_slot.get()
+            if new_r:
+                cv2.imshow("Right", frame_r)
+
+            frame, new_rgb = rgb_slot.get()
+            det_dists, new_det = spatial_slot.get()
+            if frame is not None and (new_rgb or new_det):
+                # Draw on a copy so a frame shown twice does not collect old overlays
+                frame = frame.copy()
+                draw_detections(frame, det_dists or [])
+                # After all the drawing is finished, we show the frame on the screen
+                cv2.imshow("preview", frame)
+
+            if time.perf_counter() >= next_imu_print:
+                print_imu(imu_ingest)
+                next_imu_print = time.perf_counter() + imu_print_interval
+
+            #frame_depth = ...
+            #if frame_depth is not None:
+            #    #normalize
+            #    frame_depth = (frame_depth * (255 / depth.initialConfig.getMaxDisparity())).astype(np.uint8)
+            #    # apply colormap
+            #    frame_depth = cv2.applyColorMap(frame_depth, cv2.COLORMAP_JET)
+            #    # draw boxes and center dots
+            #    draw_detections(frame_depth, det_dists or [])
+            #    cv2.imshow("disparity", frame_depth)
+
+            # at any time, you can press "q" and exit the main loop, therefore exiting the program itself
+            if cv2.waitKey(1) == ord('q'):
+                break
+    finally:
+        stop_readers(readers)
+        imu_ingest.close()
+        print("\n" * 3)
+        for name, reader in readers.items():
+            print(f"{name}: {reader.rate():.1f} msg/s received")
+        print(f"Frames never shown: rgb {rgb_slot.skipped}, right {mono_slot.skipped}")
+        for name, stats in imu_ingest.report().items():
+            print(f"{name}: {stats['samples']} samples, {stats['dropped']} dropped")
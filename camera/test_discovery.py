@@ -0,0 +1,99 @@
+# Inventory behavior against FakeProvider, no camera needed:  python -m pytest test_discovery.py
+import pytest
+
+from discovery import FakeProvider, Inventory
+
+
+@pytest.fixture
+def provider():
+    return FakeProvider(3, scan_delay=0.0, probe_delay=0.0)
+
+
+@pytest.fixture
+def inventory(provider, tmp_path):
+    return Inventory(provider, str(tmp_path / "devices.json"), ttl=10.0, roles={})
+
+
+def test_first_scan_finds_and_probes_every_device(provider, inventory):
+    devices, events = inventory.scan()
+    assert sorted(events) == sorted((mxid, "found") for mxid in provider.devices)
+    assert provider.probes == 3
+    for entry in devices.values():
+        assert entry['online'] and entry['error'] is None
+        assert entry['bootloader_version'] == "0.0.28"
+
+
+def test_dropped_device_stays_offline_in_the_inventory(provider, inventory):
+    inventory.scan()
+    mxid = sorted(provider.devices)[0]
+    provider.drop(mxid)
+    devices, events = inventory.scan()
+    assert events == [(mxid, "dropped")]
+    assert devices[mxid]['online'] is False
+    assert mxid not in [entry['mxid'] for entry in inventory.online(max_age=1e9)]
+    assert inventory.resolve(mxid, max_age=1e9) is None
+    assert inventory.resolve(mxid, max_age=1e9, online=False)['mxid'] == mxid
+    # Scanning again without a change reports nothing
+    assert inventory.scan()[1] == []
+
+
+def test_reconnected_device_is_probed_again(provider, inventory):
+    inventory.scan()
+    mxid = sorted(provider.devices)[0]
+    provider.drop(mxid)
+    inventory.scan()
+    probes = provider.probes
+    provider.reconnect(mxid)
+    devices, events = inventory.scan()
+    assert events == [(mxid, "reconnected")]
+    assert devices[mxid]['online'] is True
+    assert provider.probes == probes + 1  # the others are within probe_ttl
+
+
+def test_cache_answers_until_ttl_expires(provider, inventory):
+    inventory.devices()  # empty cache, scans
+    assert provider.scans == 1
+    mxid = sorted(provider.devices)[0]
+    provider.drop(mxid)
+    # Within ttl the inventory is not scanned again and still shows the device online
+    assert inventory.resolve(mxid)['online'] is True
+    assert provider.scans == 1
+    # Expired: scanned again
+    assert inventory.resolve(mxid, max_age=0.0) is None
+    assert provider.scans == 2
+
+
+def test_cache_is_shared_through_the_file(provider, inventory):
+    inventory.scan()
+    other = Inventory(None, inventory.path, ttl=10.0, roles={})
+    assert sorted(entry['mxid'] for entry in other.online()) == sorted(provider.devices)
+
+
+def test_probe_ttl_expiry_probes_again(provider, tmp_path):
+    inventory = Inventory(provider, str(tmp_path / "devices.json"), probe_ttl=0.0, roles={})
+    inventory.scan()
+    inventory.scan()
+    assert provider.probes == 6
+
+
+def test_list_only_scan_does_not_probe(provider, inventory):
+    assert len(inventory.online(max_age=0.0, probe=False)) == 3
+    assert provider.probes == 0
+
+
+def test_unbooted_usb_and_booted_devices_are_not_probed(provider, inventory):
+    usb, booted, poe = sorted(provider.devices)
+    provider.devices[usb].update(state="UNBOOTED", protocol="X_LINK_USB_VSC")
+    provider.devices[booted].update(state="BOOTED")
+    devices, _ = inventory.scan()
+    assert provider.probes == 1
+    assert devices[poe]['bootloader_version'] == "0.0.28"
+    assert 'bootloader_version' not in devices[usb]
+
+
+def test_failing_probe_is_recorded(provider, inventory):
+    mxid = sorted(provider.devices)[0]
+    provider.failing.add(mxid)
+    devices, _ = inventory.scan()
+    assert devices[mxid]['online'] is True
+    assert "bootloader" in devices[mxid]['error']
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# Per-device calibration store, so host tools never have to boot a camera to read its calibration.
+#
+# `pull` opens every camera once, reads the full calibration from its EEPROM (intrinsics,
+# distortion, field of view, extrinsics between all sockets and camera -> IMU extrinsics) and
+# writes it to <dir>/<MXID>.npy as one CALIBRATION_DTYPE record. A .npy record loads with a
+# single read and no parsing (a few hundred us), the store only loads a device when it is first
+# asked for, so frames.py/fusion.py start instantly and work without a camera attached.
+#
+# Every record has the format version of this module and a hash of its content: a record of
+# another format version is rejected, pulling again only rewrites files whose content changed.
+# Values that the device does not have (an uncalibrated socket, no IMU) are NaN.
+# Translations are in cm like DepthAI returns them, intrinsics in pixels at the calibration resolution.
+#
+#   python calibration.py pull                  # every camera found, or --mxid 1844301... ...
+#   python calibration.py list
+#   python calibration.py show 18443010D1A2F10F00
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration")
+SOCKETS = ("CAM_A", "CAM_B", "CAM_C")  # color, left mono, right mono on the OAK-D
+NUM_SOCKETS = len(SOCKETS)
+DISTORTION_SIZE = 14
+
+CALIBRATION_DTYPE = np.dtype([
+    ('format_version', '<u2'),
+    ('content_hash', 'S16'),
+    ('mxid', 'S32'),
+    ('board', 'S32'),
+    ('pulled_at', '<f8'),  # host time.time()
+    ('resolution', '<i4', (NUM_SOCKETS, 2)),  # width, height the intrinsics belong to
+    ('intrinsics', '<f8', (NUM_SOCKETS, 3, 3)),
+    ('distortion', '<f8', (NUM_SOCKETS, DISTORTION_SIZE)),
+    ('fov', '<f8', (NUM_SOCKETS,)),  # horizontal field of view in degrees
+    ('extrinsics', '<f8', (NUM_SOCKETS, NUM_SOCKETS, 4, 4)),  # [src, dst]: src -> dst camera
+    ('camera_to_imu', '<f8', (NUM_SOCKETS, 4, 4)),  # imu_T_camera of each socket
+])
+HASHED_FIELDS = [name for name in CALIBRATION_DTYPE.names
+                 if name not in ('format_version', 'content_hash', 'pulled_at')]
+
+
+def socket_index(socket):
+    # 'CAM_A' or 0 -> 0
+    return SOCKETS.index(socket) if isinstance(socket, str) else int(socket)
+
+
+def content_hash(record):
+    h = hashlib.blake2b(digest_size=8)
+    for name in HASHED_FIELDS:
+        h.update(np.ascontiguousarray(record[name]).tobytes())
+    return h.hexdigest().encode()
+
+
+def empty_record(mxid, board=""):
+    record = np.zeros((), dtype=CALIBRATION_DTYPE)
+    record['format_version'] = FORMAT_VERSION
+    record['mxid'] = mxid.encode()
+    record['board'] = board.encode()[:32]
+    for name in ('intrinsics', 'distortion', 'fov', 'extrinsics', 'camera_to_imu'):
+        record[name] = np.nan
+    return record
+
+
+class Calibration:
+    # Accessors of one record, arrays are views into it
+    def __init__(self, record):
+        self.record = record
+
+    @property
+    def mxid(self):
+        return self.record['mxid'].item().decode()
+
+    @property
+    def board(self):
+        return self.record['board'].item().decode()
+
+    def has(self, socket):
+        return not np.isnan(self.record['intrinsics'][socket_index(socket), 0, 0])
+
+    def intrinsics(self, socket):
+        # (3x3 camera matrix, (width, height) it belongs to)
+        i = socket_index(socket)
+        return self.record['intrinsics'][i], tuple(int(v) for v in self.record['resolution'][i])
+
+    def scaled_intrinsics(self, socket, width, height):
+        # Camera matrix for an output of width x height scaled from the full sensor (no crop)
+        K, (w, h) = self.intrinsics(socket)
+        K = K.copy()
+        K[0] *= width / w
+        K[1] *= height / h
+        return K
+
+    def distortion(self, socket):
+        return self.record['distortion'][socket_index(socket)]
+
+    def fov(self, socket):
+        return float(self.record['fov'][socket_index(socket)])
+
+    def extrinsics(self, src, dst):
+        # 4x4 src camera -> dst camera, translation in cm
+        return self.record['extrinsics'][socket_index(src), socket_index(dst)]
+
+    def camera_to_imu(self, socket="CAM_A"):
+        # 4x4 camera -> IMU, translation in cm (what getCameraInfo.py prints)
+        return self.record['camera_to_imu'][socket_index(socket)]
+
+
+class CalibrationStore:
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self.loaded = {}
+
+    def path(self, mxid):
+        return os.path.join(self.directory, f"{mxid}.npy")
+
+    def mxids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith(".npy"))
+
+    def get(self, mxid):
+        # Calibration of a device, loaded from disk the first time; KeyError if it was never pulled
+        calibration = self.loaded.get(mxid)
+        if calibration is None:
+            try:
+                record = np.load(self.path(mxid))
+            except FileNotFoundError:
+                raise KeyError(f"No calibration for {mxid} in {self.directory}, run calibration.py pull")
+            if record.dtype != CALIBRATION_DTYPE or record['format_version'] != FORMAT_VERSION:
+                raise ValueError(f"{self.path(mxid)} has an unsupported calibration format, pull it again")
+            calibration = self.loaded[mxid] = Calibration(record)
+        return calibration
+
+    def __contains__(self, mxid):
+        return mxid in self.loaded or os.path.exists(self.path(mxid))
+
+    def save(self, record):
+        # Writes a record unless the stored one has the same content, returns True if written
+        record['content_hash'] = content_hash(record)
+        mxid = record['mxid'].item().decode()
+        path = self.path(mxid)
+        if os.path.exists(path):
+            try:
+                old = np.load(path)
+                if old.dtype == CALIBRATION_DTYPE and old['content_hash'] == record['content_hash']:
+                    return False
+            except (OSError, ValueError):
+                pass  # unreadable, overwritten below
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, record)
+        os.replace(tmp, path)
+        self.loaded.pop(mxid, None)
+        return True
+
+
+def _try(function, *args):
+    # DepthAI raises RuntimeError for data that is not in the EEPROM
+    try:
+        return function(*args)
+    except RuntimeError:
+        return None
+
+
+def read_record(calib, mxid):
+    # CalibrationHandler of a device -> CALIBRATION_DTYPE record
+    import depthai as dai
+
+    eeprom = calib.getEepromData()
+    record = empty_record(mxid, eeprom.boardName)
+    record['pulled_at'] = time.time()
+    sockets = [getattr(dai.CameraBoardSocket, name) for name in SOCKETS]
+    for i, socket in enumerate(sockets):
+        default = _try(calib.getDefaultIntrinsics, socket)
+        if default is None:
+            continue
+        K, width, height = default
+        record['intrinsics'][i] = K
+        record['resolution'][i] = (width, height)
+        distortion = (_try(calib.getDistortionCoefficients, socket) or [])[:DISTORTION_SIZE]
+        record['distortion'][i, :len(distortion)] = distortion
+        record['fov'][i] = _try(calib.getFov, socket) or np.nan
+        imu = _try(calib.getCameraToImuExtrinsics, socket)
+        if imu is not None:
+            record['camera_to_imu'][i] = imu
+        for j, other in enumerate(sockets):
+            if i == j:
+                record['extrinsics'][i, j] = np.eye(4)
+                continue
+            extrinsics = _try(calib.getCameraExtrinsics, socket, other)
+            if extrinsics is not None:
+                record['extrinsics'][i, j] = extrinsics
+    return record
+
+
+def pull(store, mxids=None):
+    # Reads the calibration of the given (default: all available) devices into the store,
+    # returns {mxid: 'written' | 'unchanged' | error message}
+    import depthai as dai
+
+    if mxids:
+        infos = [dai.DeviceInfo(mxid) for mxid in mxids]
+    else:
+        infos = dai.Device.getAllAvailableDevices()
+    result = {}
+    for info in infos:
+        mxid = info.getMxId()
+        try:
+            with dai.Device(info) as device:
+                record = read_record(device.readCalibration(), mxid)
+            result[mxid] = "written" if store.save(record) else "unchanged"
+        except RuntimeError as e:
+            result[mxid] = f"failed: {e}"
+    return result
+
+
+def benchmark(store, mxid, repeat=1000):
+    # us for the first load of a record and for a lookup of an already loaded one
+    start = time.perf_counter()
+    for _ in range(repeat):
+        store.loaded.pop(mxid, None)
+        store.get(mxid)
+    first = (time.perf_counter() - start) / repeat * 1e6
+    start = time.perf_counter()
+    for _ in range(repeat):
+        store.get(mxid).camera_to_imu("CAM_A")
+    cached = (time.perf_counter() - start) / repeat * 1e6
+    return first, cached
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-device calibration store")
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    pull_parser = sub.add_parser("pull", help="read the calibration of the connected cameras")
+    pull_parser.add_argument("--mxid", nargs="*", help="only these devices")
+    sub.add_parser("list", help="stored devices")
+    show_parser = sub.add_parser("show", help="print a stored calibration")
+    show_parser.add_argument("mxid")
+    args = parser.parse_args()
+
+    store = CalibrationStore(args.dir)
+    if args.command == "pull":
+        for mxid, status in pull(store, args.mxid).items():
+            print(f"{mxid}: {status}")
+    elif args.command == "list":
+        for mxid in store.mxids():
+            calibration = store.get(mxid)
+            pulled = time.strftime("%Y-%m-%d %H:%M", time.localtime(float(calibration.record['pulled_at'])))
+            sockets = ", ".join(name for name in SOCKETS if calibration.has(name))
+            print(f"{mxid}: {calibration.board}, {sockets}, pulled {pulled}")
+    else:
+        calibration = store.get(args.mxid)
+        np.set_printoptions(precision=4, suppress=True)
+        for name in SOCKETS:
+            if not calibration.has(name):
+                continue
+            K, resolution = calibration.intrinsics(name)
+            print(f"{name} {resolution[0]}x{resolution[1]}, fov {calibration.fov(name):.1f} deg\n{K}")
+            print(f"distortion {calibration.distortion(name)}")
+            print(f"camera -> IMU [cm]\n{calibration.camera_to_imu(name)}")
+        first, cached = benchmark(store, args.mxid)
+        print(f"Load {first:.0f} us, cached lookup {cached:.1f} us")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# Flashes the profiles of profiles.json to the cameras, only the ones whose pipeline changed.
+#
+# deploy.json maps each MXID to the profile it runs (or {"profile": ..., "address": "<IP>"} to
+# skip the MXID search on the network). For every camera the pipeline is built and reduced to a
+# fingerprint: the merged profile, the serialized pipeline, the device_loop.py script source
+# (hashed directly, so an edit to it always forces a reflash), the content hash of the blob and the
+# depthai version. deploy_state.json (per machine, not committed) keeps the fingerprint last
+# flashed to every MXID. Cameras whose fingerprint matches are skipped without connecting to
+# them, the others are flashed in parallel (one thread each, the work happens on the cameras)
+# with one progress line for all of them. A record is only written after its flash succeeded.
+# Flashing with main.py/base_cam.py bypasses the record, run with --force after doing that.
+#
+#   python deploy.py                              # every camera in deploy.json
+#   python deploy.py --dry-run                    # only show what would be flashed
+#   python deploy.py --only 14442C10515CF0D600 --force
+#   python deploy.py 14442C101102F4D600=claw      # other profile for one camera
+#   python deploy.py --mock                       # mock_dai.py bootloaders, no camera needed
+#
+# --mock keeps its records in deploy_state.mock.json, a simulated flash never marks a real camera
+# as up to date.
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import device_loop
+import pipeline_profiles
+
+STATE_VERSION = 1
+HERE = os.path.dirname(os.path.abspath(__file__))
+TARGETS_PATH = os.path.join(HERE, "deploy.json")
+STATE_PATH = os.path.join(HERE, "deploy_state.json")
+MOCK_STATE_PATH = os.path.join(HERE, "deploy_state.mock.json")
+
+
+def load_targets(path=TARGETS_PATH):
+    # {mxid: {'profile', 'address'}}
+    with open(path) as f:
+        targets = json.load(f)
+    return {mxid: (dict(target) if isinstance(target, dict) else {'profile': target})
+            for mxid, target in targets.items()}
+
+
+class DeployState:
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.records = {}  # mxid -> {'fingerprint', 'profile', 'flashed_at', 'seconds'}
+        self.blobs = {}  # blob path -> {'hash', 'size', 'mtime'}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == STATE_VERSION:
+                self.records = data['records']
+                self.blobs = data['blobs']
+
+    def blob_hash(self, path):
+        # Content hash of a blob, reused while its size and mtime match
+        st = os.stat(path)
+        cached = self.blobs.get(path)
+        if not cached or cached['size'] != st.st_size or cached['mtime'] != st.st_mtime_ns:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            cached = self.blobs[path] = {'hash': h.hexdigest(), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+        return cached['hash']
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({'version': STATE_VERSION, 'records': self.records, 'blobs': self.blobs},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def serialize(pipeline):
+    # Text form of a built pipeline: the depthai JSON serialization, or the recorded node settings
+    # and links of a mock_dai pipeline
+    if hasattr(pipeline, "serializeToJson"):
+        return json.dumps(pipeline.serializeToJson(), sort_keys=True, default=str)
+    nodes = [(type(node).__name__, sorted((k, repr(v)) for k, v in node.settings.items()))
+             for node in pipeline.nodes]
+    links = [(pipeline.nodes.index(a.node), a.name, pipeline.nodes.index(b.node), b.name)
+             for a, b in pipeline.links]
+    return repr((nodes, links))
+
+
+def fingerprint(profile, pipeline, dai, state):
+    blob = str((Path(HERE) / profile['blob']).resolve())
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(profile, sort_keys=True).encode())
+    h.update(serialize(pipeline).encode())
+    h.update(device_loop.script_source(pipeline_profiles.loop_config(profile)).encode())
+    h.update(state.blob_hash(blob).encode() if os.path.exists(blob) else b"missing blob")
+    h.update(str(getattr(dai, "__version__", "")).encode())
+    return h.hexdigest()
+
+
+def plan(targets, dai, state, force=False):
+    # [{'mxid', 'address', 'profile', 'pipeline', 'fingerprint', 'changed'}] without touching a camera
+    jobs = []
+    for mxid, target in targets.items():
+        profile = pipeline_profiles.load(target['profile'])
+        pipeline = pipeline_profiles.build(profile, dai)
+        fp = fingerprint(profile, pipeline, dai, state)
+        record = state.records.get(mxid)
+        changed = force or record is None or record['fingerprint'] != fp
+        jobs.append({'mxid': mxid, 'address': target.get('address') or mxid, 'profile': target['profile'],
+                     'pipeline': pipeline, 'fingerprint': fp, 'changed': changed})
+    return jobs
+
+
+class Progress:
+    # One line with the flash progress of every camera, redrawn at most every `interval` seconds
+    def __init__(self, names, out=sys.stdout, interval=0.2):
+        self.values = {name: 0.0 for name in names}
+        self.lock = threading.Lock()
+        self.out = out
+        self.interval = interval
+        self.last = 0.0
+
+    def update(self, name, value):
+        with self.lock:
+            self.values[name] = value
+            now = time.perf_counter()
+            if now - self.last >= self.interval or value >= 1.0:
+                self.last = now
+                line = " | ".join(f"{n[-6:]} {v * 100:5.1f}%" for n, v in self.values.items())
+                self.out.write(f"\rFlashing {line}")
+                self.out.flush()
+
+    def done(self):
+        self.out.write("\n")
+
+
+def flash_one(job, dai, progress):
+    start = time.perf_counter()
+    device_info = dai.DeviceInfo(job['address'])
+    with dai.DeviceBootloader(device_info) as bootloader:
+        result = bootloader.flash(lambda p: progress.update(job['mxid'], p), job['pipeline'])
+    ok, message = result if isinstance(result, tuple) else (True, "")
+    return ok, message, time.perf_counter() - start
+
+
+def deploy(targets, dai, state, force=False, dry_run=False, workers=4, out=sys.stdout):
+    # Flashes the changed cameras in parallel, returns {mxid: 'unchanged' | 'flashed' | error}
+    jobs = plan(targets, dai, state, force)
+    changed = [job for job in jobs if job['changed']]
+    result = {job['mxid']: "unchanged" for job in jobs if not job['changed']}
+    if dry_run:
+        result.update({job['mxid']: "would flash" for job in changed})
+        return result
+    if not changed:
+        return result
+    progress = Progress([job['mxid'] for job in changed], out)
+    with ThreadPoolExecutor(max_workers=min(workers, len(changed))) as executor:
+        futures = {job['mxid']: (job, executor.submit(flash_one, job, dai, progress)) for job in changed}
+        outcomes = {}
+        for mxid, (job, future) in futures.items():
+            try:
+                outcomes[mxid] = (job,) + future.result()
+            except Exception as e:  # device not found, connection lost, ...
+                outcomes[mxid] = (job, False, str(e), 0.0)
+    progress.done()
+    for mxid, (job, ok, message, seconds) in outcomes.items():
+        if ok:
+            state.records[mxid] = {'fingerprint': job['fingerprint'], 'profile': job['profile'],
+                                   'flashed_at': time.time(), 'seconds': round(seconds, 1)}
+            result[mxid] = "flashed"
+        else:
+            result[mxid] = f"failed: {message}"
+    state.save()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flash the changed pipelines to the cameras")
+    parser.add_argument("overrides", nargs="*", help="MXID=profile, replaces the profile of a camera")
+    parser.add_argument("--targets", default=TARGETS_PATH)
+    parser.add_argument("--state", default=None, help="default deploy_state.json (deploy_state.mock.json with --mock)")
+    parser.add_argument("--only", nargs="*", help="only these MXIDs")
+    parser.add_argument("--force", action="store_true", help="flash even if unchanged")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mock", action="store_true", help="use mock_dai.py instead of depthai")
+    args = parser.parse_args()
+
+    if args.state is None:
+        args.state = MOCK_STATE_PATH if args.mock else STATE_PATH
+    if args.mock and os.path.abspath(args.state) == STATE_PATH:
+        parser.error("--mock cannot use the state of the real cameras")
+    if args.mock:
+        import mock_dai as dai
+    else:
+        import depthai as dai
+    targets = load_targets(args.targets)
+    for override in args.overrides:
+        mxid, _, profile = override.partition("=")
+        targets.setdefault(mxid, {})['profile'] = profile
+    if args.only:
+        targets = {mxid: target for mxid, target in targets.items() if mxid in args.only}
+
+    state = DeployState(args.state)
+    start = time.perf_counter()
+    result = deploy(targets, dai, state, args.force, args.dry_run, args.workers)
+    for mxid, status in result.items():
+        print(f"{mxid} ({targets[mxid]['profile']}): {status}")
+    print(f"Done in {time.perf_counter() - start:.1f} s")
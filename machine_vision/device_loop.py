@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# Detection/IMU -> UDP loop for the on-device Script node (LEON_CSS).
+#
+# main.py and base_cam.py send this file to the camera with script_source(), the
+# Script node then calls run(node, config). script_harness.py imports the same file
+# on a host and runs it against a fake node.io, so the loop can be profiled without a camera.
+#
+# The IMU and the detection network are linked to the one Script input SCRIPT_INPUT, so the loop
+# blocks in get() until either delivers and tells the messages apart by type.
+#
+# Only the standard library is used at module level, the Script node has no numpy/pathlib.
+# The packet layout comes from telemetry.py through host_config(), kind and camera_id use the
+# KIND_*/CAMERA_* values defined there.
+#
+# raw_imu: every accelerometer/gyroscope sample of each IMU batch is also sent, as one IMU_RAW
+# datagram per batch to imu_port (orientation.py filters them on the host). The pipeline has to
+# enable ACCELEROMETER_RAW and GYROSCOPE_RAW for this, see raw_imu in profiles.json.
+#
+# raw_camera: positions are sent as measured, without the y flip and z offsets below, and the
+# header gets FLAG_RAW_CAMERA; frames.py applies them on the host. hooked still uses the offsets.
+#
+# all_detections: every detection of each new detection frame is also sent, one DETECTIONS
+# datagram per frame to detections_port (positions like the slots: y flipped and z offset of the
+# label's slot unless raw_camera). The slots keep one position per label, the last detection of a
+# label wins there; tracker.py follows any number of objects per label from these datagrams.
+#
+# The upper bits of the header flags count the detection frames processed (mod 16), so the host can
+# tell a new detection from the same position sent again (telemetry.DETECTION_FRAME_SHIFT).
+#
+# hooked is a bit mask, bit i is set while both objects of rules[i] are detected and the inner one
+# is within the half size of the outer one on every axis (the claw rule is bit 0). More objects
+# and zones than one slot each are evaluated on the host by zones.py.
+import time
+import socket
+import struct
+
+NOT_DETECTED = 32767  # sentinel sent for every axis of an object that is not detected
+INT16_MIN = -32768
+INT16_MAX = 32767
+SCRIPT_INPUT = 'in'  # the IMU and the detection network are both linked to this Script input
+
+# Detection slots used by main.py (claw & ball) and base_cam.py (payload & zone)
+CLAW_CONFIG = {
+    'kind': 1,
+    'camera_id': 1,
+    'label_map': ["Claw", "Ball", "ClawTop"],
+    'slots': [["Ball", 0], ["ClawTop", 145]],  # [label, z offset in mm], in packet order
+    'rules': [["Ball", "ClawTop", [170, 170, 50]]],  # [inner, outer, half size in mm], bit i of hooked
+    'port': 5008,
+    'host': "192.168.80.15",
+    'hz_udp': 200,
+    'raw_imu': False,
+    'imu_port': None,  # None = port + telemetry.IMU_PORT_OFFSET
+    'raw_camera': False,
+    'all_detections': False,
+    'detections_port': None,  # None = port + telemetry.DETECTIONS_PORT_OFFSET
+}
+PAYLOAD_CONFIG = {
+    'kind': 2,
+    'camera_id': 1,
+    'label_map': ["pl", "zone"],
+    'slots': [["pl", 0], ["zone", 0]],
+    'rules': [],
+    'port': 5008,
+    'host': "192.168.80.15",
+    'hz_udp': 200,
+    'raw_imu': False,
+    'imu_port': None,
+    'raw_camera': False,
+    'all_detections': False,
+    'detections_port': None,
+}
+
+
+def clamp_short(value):
+    return max(min(int(value), INT16_MAX), INT16_MIN)
+
+
+def new_state(config):
+    # buffer = header | positions + hooked | quaternion, each part is repacked only when it changes
+    header_size = struct.calcsize(config['header_format'])
+    position_size = struct.calcsize(config['position_format'])
+    rotation_size = struct.calcsize(config['rotation_format'])
+    state = {
+        'slot_index': {},
+        'rules': [],
+        'z_offset': [],
+        'positions': [[NOT_DETECTED] * 3 for _ in config['slots']],
+        'hooked': 0,
+        'labels': list(config['label_map']),
+        'buffer': bytearray(header_size + position_size + rotation_size),
+        'header_format': config['header_format'],
+        'pos_format': config['position_format'],
+        'rot_format': config['rotation_format'],
+        'pos_offset': header_size,
+        'quat_offset': header_size + position_size,
+        'seq': 0,
+        'det_frames': 0,
+        'last_send': 0.0,
+        'raw_camera': bool(config.get('raw_camera')),
+        'flags': config['flag_raw_camera'] if config.get('raw_camera') else 0,
+    }
+    for i, (label, z_offset) in enumerate(config['slots']):
+        state['slot_index'][label] = i
+        state['z_offset'].append(z_offset)
+    for inner, outer, size in config['rules']:
+        state['rules'].append((state['slot_index'][inner], state['slot_index'][outer], size))
+    if config.get('raw_imu'):
+        imu_header_size = struct.calcsize(config['imu_header_format'])
+        imu_sample_size = struct.calcsize(config['imu_sample_format'])
+        state['imu_buffer'] = bytearray(imu_header_size + config['imu_max_samples'] * imu_sample_size)
+        state['imu_view'] = memoryview(state['imu_buffer'])
+        state['imu_header_size'] = imu_header_size
+        state['imu_sample_size'] = imu_sample_size
+        state['imu_seq'] = 0
+    if config.get('all_detections'):
+        det_header_size = struct.calcsize(config['detections_header_format'])
+        det_size = struct.calcsize(config['detection_format'])
+        state['det_buffer'] = bytearray(det_header_size + config['detections_max'] * det_size)
+        state['det_view'] = memoryview(state['det_buffer'])
+        state['det_header_size'] = det_header_size
+        state['det_size'] = det_size
+        state['det_seq'] = 0
+        # z offset per class index, of the label's slot or 0
+        state['label_z_offset'] = [0] * len(config['label_map'])
+        for label, z_offset in config['slots']:
+            state['label_z_offset'][config['label_map'].index(label)] = z_offset
+    pack_positions(state)
+    pack_rotation(state, (0.0, 0.0, 0.0, 0.0))
+    return state
+
+
+def pack_positions(state):
+    flat = []
+    for position in state['positions']:
+        flat.extend(position)
+    flat.append(state['hooked'])
+    struct.pack_into(state['pos_format'], state['buffer'], state['pos_offset'], *flat)
+
+
+def pack_rotation(state, quaternion):
+    struct.pack_into(state['rot_format'], state['buffer'], state['quat_offset'], *quaternion)
+
+
+def pack_header(state, config, now):
+    flags = state['flags'] | ((state['det_frames'] & 0xF) << config['detection_frame_shift'])
+    struct.pack_into(state['header_format'], state['buffer'], 0, config['version'], config['kind'],
+                     config['camera_id'], flags, state['seq'], int(now * 1e6))
+    state['seq'] = (state['seq'] + 1) & 0xFFFFFFFF
+
+
+def update_detections(state, config, detections):
+    # Rebuild every slot from this frame, objects missing from the frame go back to the sentinel
+    state['det_frames'] += 1
+    positions = [[NOT_DETECTED] * 3 for _ in state['positions']]
+    sent = [[NOT_DETECTED] * 3 for _ in state['positions']] if state['raw_camera'] else positions
+    labels = state['labels']
+    for detection in detections:
+        try:
+            label = labels[detection.label]
+        except Exception:
+            label = detection.label  # unknown class index, kept as the raw int
+        i = state['slot_index'].get(label)
+        if i is None:
+            continue
+        coords = detection.spatialCoordinates
+        # Last detection of a label wins, y is negated to go from left to right handed frame
+        positions[i] = [clamp_short(coords.x),
+                        clamp_short(-coords.y),
+                        clamp_short(int(coords.z) + state['z_offset'][i])]
+        if state['raw_camera']:
+            sent[i] = [clamp_short(coords.x), clamp_short(coords.y), clamp_short(coords.z)]
+
+    hooked = 0
+    for bit, (inner, outer, size) in enumerate(state['rules']):
+        a = positions[inner]
+        b = positions[outer]
+        if a[0] != NOT_DETECTED and b[0] != NOT_DETECTED:
+            if abs(a[0] - b[0]) < size[0] and abs(a[1] - b[1]) < size[1] and abs(a[2] - b[2]) < size[2]:
+                hooked |= 1 << bit
+
+    if sent == state['positions'] and hooked == state['hooked']:
+        return False
+    state['positions'] = sent
+    state['hooked'] = hooked
+    pack_positions(state)
+    return True
+
+
+def update_rotation(state, packets):
+    # Only the newest rotation of the batch is sent
+    if not packets:
+        return False
+    rv = packets[-1].rotationVector
+    pack_rotation(state, (rv.i, rv.j, rv.k, rv.real))
+    return True
+
+
+def device_us(report):
+    return int(report.getTimestampDevice().total_seconds() * 1e6)
+
+
+def pack_imu(state, config, packets):
+    # Packs up to imu_max_samples packets into the raw IMU buffer, returns its length in bytes
+    header_size = state['imu_header_size']
+    sample_size = state['imu_sample_size']
+    sample_format = config['imu_sample_format']
+    buffer = state['imu_buffer']
+    base = device_us(packets[0].acceleroMeter)
+    offset = header_size
+    for packet in packets:
+        a = packet.acceleroMeter
+        g = packet.gyroscope
+        struct.pack_into(sample_format, buffer, offset, device_us(a) - base, device_us(g) - base,
+                         a.x, a.y, a.z, g.x, g.y, g.z, a.sequence & 0xFFFF, g.sequence & 0xFFFF)
+        offset += sample_size
+    rv = packets[-1].rotationVector
+    struct.pack_into(config['imu_header_format'], buffer, 0, config['version'], config['imu_kind'],
+                     config['camera_id'], 0, state['imu_seq'], base, rv.i, rv.j, rv.k, rv.real, len(packets))
+    state['imu_seq'] = (state['imu_seq'] + 1) & 0xFFFFFFFF
+    return offset
+
+
+def pack_detections(state, config, detections, now):
+    # Packs up to detections_max detections into the detections buffer, returns its length in bytes
+    detection_format = config['detection_format']
+    buffer = state['det_buffer']
+    size = state['det_size']
+    z_offsets = state['label_z_offset']
+    offset = state['det_header_size']
+    count = 0
+    for detection in detections[:config['detections_max']]:
+        coords = detection.spatialCoordinates
+        label = detection.label
+        if state['raw_camera']:
+            x, y, z = coords.x, coords.y, coords.z
+        else:
+            z_offset = z_offsets[label] if 0 <= label < len(z_offsets) else 0
+            x, y, z = coords.x, -coords.y, int(coords.z) + z_offset
+        struct.pack_into(detection_format, buffer, offset, label & 0xFF,
+                         max(min(int(detection.confidence * 100), 100), 0),
+                         clamp_short(x), clamp_short(y), clamp_short(z))
+        offset += size
+        count += 1
+    struct.pack_into(config['detections_header_format'], buffer, 0, config['version'],
+                     config['detections_kind'], config['camera_id'], state['flags'], state['det_seq'],
+                     int(now * 1e6), count)
+    state['det_seq'] = (state['det_seq'] + 1) & 0xFFFFFFFF
+    return offset
+
+
+def send(udp_socket, data, address):
+    # Returns the socket to use next, a new one if sending failed
+    try:
+        udp_socket.sendto(data, address)
+    except Exception:
+        try:
+            udp_socket.close()
+        except Exception:
+            pass
+        time.sleep(0.01)  # Minimal delay to prevent overwhelming logs/network
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return udp_socket
+
+
+def run(node, config, udp_socket=None):
+    state = new_state(config)
+    address = (config['host'], config['port'])
+    min_period = 1.0 / config['hz_udp']
+    messages = node.io[SCRIPT_INPUT]
+    raw_imu = config.get('raw_imu')
+    if raw_imu:
+        imu_address = (config['host'], config['imu_port'])
+        max_samples = config['imu_max_samples']
+    all_detections = config.get('all_detections')
+    if all_detections:
+        det_address = (config['host'], config['detections_port'])
+    if udp_socket is None:
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    while True:
+        # Sleep until either output delivers, then take everything already queued. Every IMU
+        # batch is used, of the detection frames only the newest one matters.
+        msg = messages.get()
+        inDet = None
+        while msg is not None:
+            if hasattr(msg, 'packets'):
+                packets = msg.packets
+                update_rotation(state, packets)
+                if raw_imu:
+                    # Every sample is forwarded, not rate limited
+                    for start in range(0, len(packets), max_samples):
+                        size = pack_imu(state, config, packets[start:start + max_samples])
+                        udp_socket = send(udp_socket, state['imu_view'][:size], imu_address)
+            else:
+                inDet = msg
+            msg = messages.tryGet()
+
+        if inDet is not None:
+            update_detections(state, config, inDet.detections)
+            if all_detections:
+                # Every detection frame is forwarded, not rate limited (15 FPS)
+                size = pack_detections(state, config, inDet.detections, time.time())
+                udp_socket = send(udp_socket, state['det_view'][:size], det_address)
+
+        # IMU-only updates are rate limited, a new detection is always sent at once
+        now = time.time()
+        if inDet is None and now - state['last_send'] < min_period:
+            continue
+        state['last_send'] = now
+        pack_header(state, config, now)
+        udp_socket = send(udp_socket, state['buffer'], address)
+
+
+def host_config(config, **overrides):
+    # Adds the packet layout from telemetry.py, which the Script node cannot import
+    import telemetry
+    config = dict(config, **overrides)
+    config.update(telemetry.DEVICE_LAYOUT)
+    if config.get('imu_port') is None:
+        config['imu_port'] = config['port'] + telemetry.IMU_PORT_OFFSET
+    if config.get('detections_port') is None:
+        config['detections_port'] = config['port'] + telemetry.DETECTIONS_PORT_OFFSET
+    return config
+
+
+def script_source(config):
+    # Source handed to script.setScript(): this file followed by the call that starts the loop
+    import os
+    with open(os.path.abspath(__file__)) as f:
+        source = f.read()
+    return source + "\n\nrun(node, " + repr(host_config(config)) + ")\n"
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# Host-side state estimator that upsamples the 15 FPS detections to the 200 Hz packet rate.
+#
+# One Kalman filter per tracked object, the three axes are independent so each axis keeps a tiny
+# state and every predict/update costs the same no matter how long it runs (O(1)):
+#   cv:       [position, velocity], constant velocity with white noise acceleration
+#   pendulum: [position, velocity, rest position] on the horizontal axes, a damped pendulum of
+#             length rope_length swinging about a slowly moving rest position (the hanging payload).
+#             The vertical axis stays constant velocity.
+# With use_imu the measurements are first rotated by the camera IMU quaternion, so the pendulum
+# axes are level. Every 200 Hz packet calls step(): it predicts to the packet time and only
+# updates when the detector produced a new frame, told by the detection frame counter in the
+# header flags (telemetry.detection_frame), so an object standing still keeps being measured.
+# Packets from senders without the counter fall back to a changed, non-sentinel position. The
+# output is position, velocity, covariance and a 0..1 confidence instead of the 32767 sentinel.
+#
+#   python estimator.py session.mlrec --port 5008 --slot 0 --model pendulum
+# benchmarks the filter on a recording: cost per step and how well it predicts the next detection
+# compared to holding the last one (what the controller sees today).
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import telemetry
+from frames import quaternion_matrices
+
+GRAVITY = 9810.0  # mm/s^2
+
+Estimate = namedtuple("Estimate", ["position", "velocity", "covariance", "confidence", "valid"])
+
+
+class Estimator:
+    def __init__(self, model="cv", accel_noise=2000.0, meas_noise=20.0, rope_length=1000.0,
+                 damping=0.02, rest_noise=50.0, max_coast=0.5, use_imu=False, vertical_axis=1):
+        # Units are mm and s: accel_noise is the white noise acceleration density, meas_noise the
+        # detection standard deviation, rest_noise how fast the rest position may wander
+        self.model = model
+        self.n = 3 if model == "pendulum" else 2
+        self.q = accel_noise ** 2
+        self.r = meas_noise ** 2
+        self.q_rest = rest_noise ** 2
+        self.omega2 = GRAVITY / rope_length
+        self.damping = damping
+        self.max_coast = max_coast
+        self.use_imu = use_imu
+        self.vertical_axis = vertical_axis
+        self.x = np.zeros((3, self.n))
+        self.P = np.zeros((3, self.n, self.n))
+        self.t = None
+        self.last_update = None
+        self.last_measurement = None
+        self.last_frame = None
+        self.has_frames = False  # the sender counts detection frames
+        self.initialized = False
+        self._F = np.zeros((3, self.n, self.n))
+        self._Q = np.zeros((3, self.n, self.n))
+
+    def reset(self):
+        self.initialized = False
+        self.last_measurement = None
+
+    def _transition(self, dt):
+        # Fills self._F and self._Q for a step of dt seconds (second order expansion of the
+        # continuous model, dt is 5 ms at 200 Hz)
+        F, Q = self._F, self._Q
+        F[:] = 0.0
+        Q[:] = 0.0
+        dt2, dt3 = dt * dt, dt * dt * dt
+        F[:, 0, 0] = 1.0
+        F[:, 0, 1] = dt
+        F[:, 1, 1] = 1.0
+        Q[:, 0, 0] = self.q * dt3 / 3.0
+        Q[:, 0, 1] = Q[:, 1, 0] = self.q * dt2 / 2.0
+        Q[:, 1, 1] = self.q * dt
+        if self.n == 3:
+            F[:, 2, 2] = 1.0
+            Q[:, 2, 2] = self.q_rest * dt
+            w2, c = self.omega2, 2.0 * self.damping * np.sqrt(self.omega2)
+            horizontal = [a for a in range(3) if a != self.vertical_axis]
+            for a in horizontal:
+                # A = [[0, 1, 0], [-w2, -c, w2], [0, 0, 0]], F = I + A dt + A^2 dt^2 / 2
+                F[a, 0, 0] = 1.0 - w2 * dt2 / 2.0
+                F[a, 0, 1] = dt - c * dt2 / 2.0
+                F[a, 0, 2] = w2 * dt2 / 2.0
+                F[a, 1, 0] = -w2 * dt + c * w2 * dt2 / 2.0
+                F[a, 1, 1] = 1.0 - c * dt + (c * c - w2) * dt2 / 2.0
+                F[a, 1, 2] = w2 * dt - c * w2 * dt2 / 2.0
+
+    def predict(self, t):
+        if self.t is None or not self.initialized:
+            self.t = t
+            return
+        dt = t - self.t
+        if dt <= 0.0:
+            return
+        self._transition(dt)
+        self.x = np.einsum('aij,aj->ai', self._F, self.x)
+        self.P = self._F @ self.P @ self._F.transpose(0, 2, 1) + self._Q
+        self.t = t
+
+    def update(self, z):
+        # Position measurement of all three axes (H = [1, 0, ...] per axis)
+        if not self.initialized:
+            self.x[:] = 0.0
+            self.x[:, 0] = z
+            self.P[:] = 0.0
+            self.P[:, 0, 0] = self.r
+            self.P[:, 1, 1] = (1000.0) ** 2  # unknown velocity, up to ~1 m/s
+            if self.n == 3:
+                self.x[:, 2] = z
+                self.P[:, 2, 2] = (200.0) ** 2
+            self.initialized = True
+            return
+        S = self.P[:, 0, 0] + self.r
+        K = self.P[:, :, 0] / S[:, None]
+        self.x += K * (z - self.x[:, 0])[:, None]
+        self.P -= K[:, :, None] * self.P[:, 0, None, :]
+
+    def is_new(self, position, frame):
+        # True if position comes from a detection frame not seen before
+        if frame is not None:
+            previous, self.last_frame = self.last_frame, frame
+            if previous is not None and frame != previous:
+                self.has_frames = True
+            if self.has_frames:
+                return frame != previous
+        new = self.last_measurement is None or tuple(position) != self.last_measurement
+        self.last_measurement = tuple(position)
+        return new
+
+    def step(self, t, position, quat=None, frame=None):
+        # One packet: t in seconds (device time), position the raw int16 triple (may be the
+        # sentinel or a repeat of the previous detection), quat the camera orientation, frame the
+        # detection frame counter of the header flags (None if not known)
+        if position[0] == telemetry.NOT_DETECTED:
+            position = None
+            self.last_measurement = None
+            if frame is not None:
+                self.last_frame = frame
+        elif not self.is_new(position, frame):
+            position = None  # the detector has not produced anything new
+        self.predict(t)
+        if position is not None:
+            z = np.asarray(position, dtype=np.float64)
+            if self.use_imu and quat is not None:
+                z = quaternion_matrices(quat) @ z
+            self.update(z)
+            self.last_update = t
+        elif self.initialized and t - self.last_update > self.max_coast:
+            self.reset()
+        return self.estimate()
+
+    def estimate(self):
+        if not self.initialized:
+            return Estimate(np.full(3, np.nan), np.full(3, np.nan), np.full((3, 2, 2), np.nan), 0.0, False)
+        sigma = np.sqrt(self.P[:, 0, 0].mean())
+        confidence = float(np.sqrt(self.r) / max(sigma, np.sqrt(self.r)))
+        return Estimate(self.x[:, 0].copy(), self.x[:, 1].copy(), self.P[:, :2, :2].copy(), confidence, True)
+
+
+def benchmark(packets, slot, estimator):
+    # Runs the estimator over decoded packets. At each new detection the estimate from just
+    # before it (predicted from older detections) and the previous detection (zero-order hold)
+    # are compared with the new value.
+    t = packets['timestamp_us'].astype(np.float64) * 1e-6
+    pos = packets['pos'][:, slot]
+    quat = packets['quat']
+    frames = telemetry.detection_frame(packets['flags'])
+    counted = bool(np.any(frames != frames[0])) if len(frames) else False
+    held = None
+    last_frame = None
+    err_filter = []
+    err_hold = []
+    start = time.perf_counter()
+    for i in range(len(packets)):
+        p = pos[i]
+        if counted:
+            new = p[0] != telemetry.NOT_DETECTED and frames[i] != last_frame
+            last_frame = frames[i]
+        else:
+            new = p[0] != telemetry.NOT_DETECTED and (held is None or tuple(p) != held)
+        if new and estimator.initialized and held is not None:
+            estimator.predict(t[i])
+            z = p.astype(np.float64)
+            if estimator.use_imu:
+                R = quaternion_matrices(quat[i])
+                z = R @ z
+                h = R @ np.asarray(held, dtype=np.float64)
+            else:
+                h = np.asarray(held, dtype=np.float64)
+            err_filter.append(np.linalg.norm(estimator.x[:, 0] - z))
+            err_hold.append(np.linalg.norm(h - z))
+        estimator.step(t[i], p, quat[i], int(frames[i]))
+        if p[0] == telemetry.NOT_DETECTED:
+            held = None
+        elif new:
+            held = tuple(p)
+    elapsed = time.perf_counter() - start
+    return {
+        'steps': len(packets),
+        'us_per_step': 1e6 * elapsed / max(len(packets), 1),
+        'detections': len(err_filter),
+        'filter_rms': float(np.sqrt(np.mean(np.square(err_filter)))) if err_filter else float('nan'),
+        'hold_rms': float(np.sqrt(np.mean(np.square(err_hold)))) if err_hold else float('nan'),
+    }
+
+
+if __name__ == "__main__":
+    from recording import Recording
+
+    parser = argparse.ArgumentParser(description="Benchmark the estimator on a telemetry recording")
+    parser.add_argument("path", help="recording made with recording.py or listener.py --record")
+    parser.add_argument("--port", type=int, default=5008)
+    parser.add_argument("--slot", type=int, default=0, help="0 = payload/ball, 1 = zone/claw")
+    parser.add_argument("--model", choices=["cv", "pendulum"], default="cv")
+    parser.add_argument("--rope-length", type=float, default=1000.0, help="mm, pendulum model")
+    parser.add_argument("--use-imu", action="store_true")
+    args = parser.parse_args()
+
+    packets, _ = Recording(args.path).packets(args.port)
+    estimator = Estimator(args.model, rope_length=args.rope_length, use_imu=args.use_imu)
+    result = benchmark(packets, args.slot, estimator)
+    print(f"{result['steps']} packets, {result['detections']} detections, "
+          f"{result['us_per_step']:.1f} us per step")
+    print(f"Error at the next detection [mm RMS]: filter {result['filter_rms']:.1f}, "
+          f"hold last detection {result['hold_rms']:.1f}")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# Camera -> robot base frame transforms for the telemetry positions.
+#
+# A position goes through these frames, every step is a homogeneous transform:
+#   spatial: DepthAI spatialCoordinates in mm, what the detector measures
+#   camera:  y flipped into the right handed calibration frame (x right, y down, z forward) and the
+#            object offset added (ClawTop z + 145 mm, the slots of device_loop.py)
+#   imu:     camera -> IMU extrinsics of the calibration, as printed by getCameraInfo.py (cm)
+#   level:   rotated by the rotation vector quaternion of the packet (only with use_imu)
+#   base:    the configured mount pose, level (imu without use_imu) -> robot base frame in mm
+# device_loop.py does the spatial -> camera step itself unless raw_camera is set, then the header
+# has FLAG_RAW_CAMERA and it is done here, both kinds of packets end up in the same base frame.
+#
+# Everything that does not change per packet is folded into one rotation and one translation per
+# camera and object when the frames are built. Per packet only the quaternion is left, a batch of
+# packets is converted with one einsum.
+#
+#   python frames.py session.mlrec --frames frames.json   converts a recording and times it
+# frames.json maps camera id to its transforms, missing ones are the identity, e.g.
+#   {"1": {"imu_T_camera": [[...4x4 in cm...]], "base_T_mount": [[...4x4 in mm...]], "use_imu": true}}
+# Instead of imu_T_camera an entry can name the device, "mxid": "1844301...", and optionally
+# "socket": "CAM_A"; the extrinsics then come from the calibration store (calibration.py pull).
+import argparse
+import json
+import time
+
+import numpy as np
+
+import telemetry
+from device_loop import CLAW_CONFIG, PAYLOAD_CONFIG
+
+CALIBRATION_UNIT = 10.0  # mm per calibration unit, DepthAI extrinsics are in cm
+SPATIAL_TO_CAMERA = np.diag([1.0, -1.0, 1.0])  # the y negation device_loop.py applies
+
+# kind -> offset of each slot in the camera frame (mm), the same z offsets device_loop.py adds
+SLOT_OFFSETS = {
+    config['kind']: np.array([[0.0, 0.0, z_offset] for _, z_offset in config['slots']])
+    for config in (CLAW_CONFIG, PAYLOAD_CONFIG)
+}
+
+
+def homogeneous(rotation=None, translation=None):
+    # 4x4 transform from a 3x3 rotation and a translation
+    T = np.eye(4)
+    if rotation is not None:
+        T[:3, :3] = rotation
+    if translation is not None:
+        T[:3, 3] = translation
+    return T
+
+
+def _quaternion_basis():
+    # (16, 9) map from the products q_a * q_b (a, b over i, j, k, real) to R - I of a unit quaternion
+    x, y, z, w = range(4)
+    terms = [
+        [(-1, y, y), (-1, z, z)], [(1, x, y), (-1, z, w)], [(1, x, z), (1, y, w)],
+        [(1, x, y), (1, z, w)], [(-1, x, x), (-1, z, z)], [(1, y, z), (-1, x, w)],
+        [(1, x, z), (-1, y, w)], [(1, y, z), (1, x, w)], [(-1, x, x), (-1, y, y)],
+    ]
+    basis = np.zeros((16, 9))
+    for entry, products in enumerate(terms):
+        for sign, a, b in products:
+            basis[a * 4 + b, entry] += sign
+    return basis
+
+
+QUATERNION_BASIS = _quaternion_basis()
+
+
+def quaternion_matrices(q):
+    # Rotation matrices (..., 3, 3) of quaternions (..., 4) given as (i, j, k, real), one matmul
+    # for the whole batch. Zero quaternions (rotation vector not enabled on the device) give the
+    # identity.
+    q = np.asarray(q, dtype=np.float64)
+    norm2 = np.einsum('...i,...i->...', q, q)
+    s = np.divide(2.0, norm2, out=np.zeros_like(norm2), where=norm2 > 1e-12)
+    products = (q[..., :, None] * q[..., None, :]).reshape(q.shape[:-1] + (16,))
+    R = (products @ QUATERNION_BASIS) * s[..., None]
+    R[..., ::4] += 1.0
+    return R.reshape(q.shape[:-1] + (3, 3))
+
+
+class CameraFrames:
+    def __init__(self, imu_T_camera=None, base_T_mount=None, use_imu=True):
+        # imu_T_camera: 4x4 camera -> IMU extrinsics in calibration units (cm)
+        # base_T_mount: 4x4 level (or IMU) frame -> robot base frame in mm
+        imu_T_camera = homogeneous() if imu_T_camera is None else np.array(imu_T_camera, dtype=np.float64)
+        imu_T_camera[:3, 3] *= CALIBRATION_UNIT
+        base_T_mount = homogeneous() if base_T_mount is None else np.asarray(base_T_mount, dtype=np.float64)
+        self.imu_T_camera = imu_T_camera
+        self.base_T_mount = base_T_mount
+        self.use_imu = use_imu
+        # Static parts: camera -> imu for packets in the camera frame, spatial -> imu for raw ones,
+        # and the whole chain when the quaternion is not used
+        self.camera_rotation = imu_T_camera[:3, :3]
+        self.raw_rotation = imu_T_camera[:3, :3] @ SPATIAL_TO_CAMERA
+        self.raw_translation = {kind: offsets @ imu_T_camera[:3, :3].T + imu_T_camera[:3, 3]
+                                for kind, offsets in SLOT_OFFSETS.items()}
+        self.mount_rotation = base_T_mount[:3, :3]
+        self.mount_translation = base_T_mount[:3, 3]
+
+    def to_imu(self, points, raw=False, kind=telemetry.KIND_CLAW):
+        # points (..., slots, 3) in the camera frame (spatial frame if raw) -> IMU frame
+        points = np.asarray(points, dtype=np.float64)
+        if raw:
+            return points @ self.raw_rotation.T + self.raw_translation[kind][:points.shape[-2]]
+        return points @ self.camera_rotation.T + self.imu_T_camera[:3, 3]
+
+    def to_base(self, points, quats=None, raw=False, kind=telemetry.KIND_CLAW):
+        # points (N, slots, 3) -> (N, slots, 3) in the base frame, quats (N, 4) of the same packets
+        p = self.to_imu(points, raw, kind)
+        if self.use_imu and quats is not None:
+            R = self.mount_rotation @ quaternion_matrices(quats)
+            return np.einsum('nij,nsj->nsi', R, p) + self.mount_translation
+        return p @ self.mount_rotation.T + self.mount_translation
+
+    def transform(self, quat=None):
+        # Full 4x4 camera frame -> base frame transform for one quaternion
+        level = homogeneous(quaternion_matrices(quat)) if self.use_imu and quat is not None else homogeneous()
+        return self.base_T_mount @ level @ self.imu_T_camera
+
+
+class FrameTransformer:
+    def __init__(self, frames=None):
+        # frames: {camera_id: CameraFrames}, cameras without an entry use the identity
+        self.frames = dict(frames or {})
+        self.default = CameraFrames()
+        self.last = None
+
+    def get(self, camera_id):
+        return self.frames.get(int(camera_id), self.default)
+
+    def packets(self, packets):
+        # telemetry.PACKET_DTYPE array -> positions (N, 2, 3) in the base frame (mm), NaN for
+        # objects that are not detected
+        out = np.full(packets['pos'].shape, np.nan)
+        if not len(packets):
+            return out
+        found = telemetry.detected(packets['pos'])
+        raw = (packets['flags'] & telemetry.FLAG_RAW_CAMERA) != 0
+        # One vectorized call per group of packets that share camera, kind and raw flag
+        groups = packets['camera_id'].astype(np.int64) * 512 + packets['kind'] * 2 + raw
+        keys = np.unique(groups)
+        for group in keys:
+            index = slice(None) if len(keys) == 1 else np.flatnonzero(groups == group)
+            camera_id, rest = divmod(int(group), 512)
+            kind, is_raw = divmod(rest, 2)
+            if kind not in SLOT_OFFSETS:
+                continue
+            group_packets = packets[index]
+            out[index] = self.get(camera_id).to_base(group_packets['pos'], group_packets['quat'],
+                                                     bool(is_raw), kind)
+        out[~found] = np.nan
+        return out
+
+    def __call__(self, batch):
+        # receiver.py consumer, keeps the positions of the last batch
+        self.last = self.packets(batch.packets)
+
+
+def load_frames(path, store=None):
+    # store: calibration.CalibrationStore for entries given by mxid (default directory if None)
+    with open(path) as f:
+        config = json.load(f)
+    frames = {}
+    for camera_id, c in config.items():
+        imu_T_camera = c.get('imu_T_camera')
+        if imu_T_camera is None and 'mxid' in c:
+            if store is None:
+                from calibration import CalibrationStore
+                store = CalibrationStore()
+            socket = c.get('socket', "CAM_A")
+            imu_T_camera = store.get(c['mxid']).camera_to_imu(socket)
+            if not np.isfinite(imu_T_camera).all():
+                # Not in the device calibration, every converted position would be NaN
+                raise ValueError(f"Calibration of {c['mxid']} has no camera to IMU extrinsics for {socket}, "
+                                 f"give imu_T_camera for camera {camera_id} in {path}")
+        frames[int(camera_id)] = CameraFrames(imu_T_camera, c.get('base_T_mount'), c.get('use_imu', True))
+    return FrameTransformer(frames)
+
+
+def benchmark(transformer, packets, repeat=200):
+    # us per call for single packets (one per 200 Hz packet) and us per packet for the whole batch
+    single = packets[:1]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        transformer.packets(single)
+    per_call = (time.perf_counter() - start) / repeat * 1e6
+    start = time.perf_counter()
+    positions = transformer.packets(packets)
+    per_packet = (time.perf_counter() - start) / max(len(packets), 1) * 1e6
+    return positions, per_call, per_packet
+
+
+if __name__ == "__main__":
+    from recording import Recording
+
+    parser = argparse.ArgumentParser(description="Convert the positions of a recording to the base frame")
+    parser.add_argument("path", help="recording made with recording.py or listener.py --record")
+    parser.add_argument("--frames", help="frames.json, identity transforms if not given")
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+
+    transformer = load_frames(args.frames) if args.frames else FrameTransformer()
+    packets, _ = Recording(args.path).packets(args.port)
+    if not len(packets):
+        raise SystemExit("No telemetry packets in the recording")
+    positions, per_call, per_packet = benchmark(transformer, packets)
+    print(f"{len(packets)} packets: {per_call:.1f} us for one packet, {per_packet:.2f} us per packet in one batch")
+    for slot in range(positions.shape[1]):
+        seen = positions[:, slot][~np.isnan(positions[:, slot, 0])]
+        if len(seen):
+            print(f"slot {slot}: {len(seen)} detections, mean {np.round(seen.mean(axis=0), 1)} mm")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Fuses the payload/zone positions of the base (5007) and top (5008) cameras into one state.
+#
+# Reads the shared memory ring written by `listener.py --shm`, so it runs next to the other
+# consumers without binding the camera ports. At a fixed rate it reads the newest samples of every
+# camera on its own (a fast camera does not push the other one out of the window) and brings them
+# to one fusion time, now - delay on the host clock: each object is interpolated between the two
+# samples of a camera around that time, or taken from the last sample before it (aged by how much
+# older it is). With delay of about one packet period both cameras usually bracket the fusion time.
+# Samples older than max_age are dropped, the positions are transformed into the common frame with
+# each camera's 4x4 pose and combined per object:
+#   weighted: average weighted by freshness and by 1 / (1 + (z / 1 m)^2), stereo depth noise
+#             grows with the square of the distance
+#   best:     the single observation with the highest weight
+# The result goes out as a telemetry FUSED packet, so the controller reads one UDP source.
+#
+#   python fusion.py --poses poses.json --rate 100 --out 127.0.0.1:5010
+# poses.json maps camera id to a 4x4 camera-to-common-frame matrix (mm), e.g.
+#   {"0": [[1,0,0,0],[0,1,0,0],[0,0,1,0],[0,0,0,1]], "1": [...]}
+import argparse
+import json
+import socket
+import time
+
+import numpy as np
+
+import telemetry
+
+OBJECTS = ("payload", "zone")
+
+
+class Fusion:
+    def __init__(self, poses, max_age=0.2, tau=0.05, mode="weighted"):
+        # poses: {camera_id: 4x4 camera-to-common-frame transform}
+        self.camera_ids = sorted(poses)
+        transforms = np.stack([np.asarray(poses[c], dtype=np.float64) for c in self.camera_ids])
+        self.rotation = transforms[:, :3, :3]
+        self.translation = transforms[:, :3, 3]
+        self.max_age = max_age
+        self.tau = tau
+        self.mode = mode
+        self.bits = np.array([1 << c for c in self.camera_ids], dtype=np.uint8)
+
+    def observations(self, per_camera, t):
+        # {camera_id: that camera's newest samples, oldest first} -> positions (C, objects, 3) at
+        # host time t in camera frame with NaN for "not detected", and age (C,) in seconds of the
+        # data used (0 when interpolated, inf if the camera has no sample)
+        n_cams = len(self.camera_ids)
+        positions = np.full((n_cams, len(OBJECTS), 3), np.nan)
+        age = np.full(n_cams, np.inf)
+        for i, camera_id in enumerate(self.camera_ids):
+            samples = per_camera.get(camera_id)
+            if samples is None or not len(samples):
+                continue
+            times = samples['recv_time']
+            after = int(np.searchsorted(times, t, side='right'))
+            if after == 0:
+                # Every sample read is newer than t (a very fast camera), the oldest is the closest
+                before, nxt = samples[0], None
+                age[i] = 0.0
+            elif after < len(samples):
+                # Bracketed: linear interpolation where both samples saw the object
+                before = samples[after - 1]
+                nxt = samples[after]
+                span = times[after] - times[after - 1]
+                w = (t - times[after - 1]) / span if span > 0 else 0.0
+                age[i] = 0.0
+            else:
+                before, nxt = samples[after - 1], None
+                age[i] = t - times[after - 1]
+            for j, name in enumerate(OBJECTS):
+                if before[name][0] == telemetry.NOT_DETECTED:
+                    continue
+                a = before[name].astype(np.float64)
+                if nxt is not None and nxt[name][0] != telemetry.NOT_DETECTED:
+                    a = a + w * (nxt[name] - a)
+                positions[i, j] = a
+        return positions, age
+
+    def weights(self, positions, age):
+        # (C, objects) weight of each observation, 0 for missing or too old ones
+        fresh = np.where(age < self.max_age, np.exp(-np.clip(age, 0.0, None) / self.tau), 0.0)
+        depth = positions[..., 2] / 1000.0
+        w = fresh[:, None] / (1.0 + depth ** 2)
+        return np.where(np.isnan(w), 0.0, w)
+
+    def fuse(self, positions, age):
+        # Returns fused positions (objects, 3) in the common frame with NaN where nothing was
+        # seen, and a camera bit mask per object
+        common = np.einsum('cij,coj->coi', self.rotation, positions) + self.translation[:, None, :]
+        w = self.weights(positions, age)
+        used = w > 0
+        if self.mode == "best":
+            cols = np.arange(common.shape[1])
+            best = np.argmax(w, axis=0)
+            fused = common[best, cols]
+            used = np.zeros_like(used)
+            used[best, cols] = w[best, cols] > 0
+        else:
+            total = w.sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fused = (w[..., None] * np.nan_to_num(common)).sum(axis=0) / total[:, None]
+        fused[~used.any(axis=0)] = np.nan
+        sources = (used * self.bits[:, None]).sum(axis=0).astype(np.uint8)
+        return fused, sources
+
+
+def run(reader, fusion, address, rate=100.0, per_camera=8, delay=0.005, on_state=None):
+    # per_camera: newest samples read per camera, delay: fusion time behind now (s)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    encoder = telemetry.FusedEncoder()
+    period = 1.0 / rate
+    next_tick = time.perf_counter()
+    while True:
+        samples = {c: reader.camera(c, per_camera)[0] for c in fusion.camera_ids}
+        now = time.time()
+        t = now - delay
+        fused, sources = fusion.fuse(*fusion.observations(samples, t))
+        sock.sendto(encoder.pack(fused[0], fused[1], sources, int(t * 1e6)), address)
+        if on_state is not None:
+            on_state(now, fused, sources)
+        next_tick += period
+        sleep_for = next_tick - time.perf_counter()
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+        else:
+            next_tick = time.perf_counter()  # fell behind, do not try to catch up
+
+
+def load_poses(path):
+    with open(path) as f:
+        return {int(k): np.asarray(v, dtype=np.float64) for k, v in json.load(f).items()}
+
+
+if __name__ == "__main__":
+    from telemetry_ring import DEFAULT_NAME, RingReader
+
+    parser = argparse.ArgumentParser(description="Fuse the camera streams into one state")
+    parser.add_argument("--shm", default=DEFAULT_NAME, help="ring written by listener.py --shm")
+    parser.add_argument("--poses", default=None, help="JSON file with a 4x4 pose per camera id")
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--out", default="127.0.0.1:5010", help="host:port for the fused packets")
+    parser.add_argument("--mode", choices=["weighted", "best"], default="weighted")
+    parser.add_argument("--max-age", type=float, default=0.2, help="seconds before a camera is ignored")
+    parser.add_argument("--delay", type=float, default=0.005, help="fusion time behind now in seconds")
+    args = parser.parse_args()
+
+    if args.poses:
+        poses = load_poses(args.poses)
+    else:
+        print("No --poses given, using the identity for both cameras")
+        poses = {telemetry.CAMERA_BASE: np.eye(4), telemetry.CAMERA_TOP: np.eye(4)}
+    host, port = args.out.rsplit(":", 1)
+
+    last_print = [0.0]
+
+    def show(now, fused, sources):
+        if now - last_print[0] >= 1.0:
+            last_print[0] = now
+            print(f"payload={np.round(fused[0], 1)} (cams {sources[0]:02b}) "
+                  f"zone={np.round(fused[1], 1)} (cams {sources[1]:02b})")
+
+    run(RingReader(args.shm), Fusion(poses, args.max_age, mode=args.mode), (host, int(port)),
+        args.rate, delay=args.delay, on_state=show)
@@ -1,44 +1,50 @@
-import struct
-import socket
-import select
-import time
-
-listen_ip = "0.0.0.0"
-listen_port = 5006
-
-udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-udp_socket.bind((listen_ip, listen_port))
-udp_socket.setblocking(False)
-
-print(f"Listening for UDP packets on {listen_ip}:{listen_port}...")
-
-message_count = 0
-start_time = time.time()
-
-while True:
-    try:
-        ready = select.select([udp_socket], [], [], 0.001)  # Non-blocking with 1ms timeout
-        if ready[0]:  # If data is available
-            data, addr = udp_socket.recvfrom(32)
-            if len(data) == 32:
-                unpacked_data = struct.unpack("hhhhhhBffff", data)
-                B_pos = unpacked_data[0:3]
-                C_pos = unpacked_data[3:6]
-                hooked = unpacked_data[6]
-                quatRot = unpacked_data[7:11]
-
-                message_count += 1
-                elapsed_time = time.time() - start_time
-                if elapsed_time >= 1.0:
-                    hz = message_count / elapsed_time
-                    print(f"Message frequency: {hz:.2f} Hz")
-                    message_count = 0
-                    start_time = time.time()
-
-                print(f"Received from {addr}: B_pos={B_pos}, C_pos={C_pos}, quatRot={quatRot}, hooked={hooked}")
-            else:
-                print(f"Warning: Received unexpected data length ({len(data)} bytes) from {addr}")
-    except Exception as e:
-        print(f"Error: {e}")
-        time.sleep(0.001)  # Small delay to reduce CPU usage
-
+# Listens for camera telemetry on every camera port and prints a summary once per second.
+#   python listener.py                 # ports 5007 (base) and 5008 (top)
+#   python listener.py --ports 5006 --verbose
+#   python listener.py --shm           # also publish to shared memory for telemetry_ring.RingReader
+#   python listener.py --record session.mlrec   # also record the datagrams, see recording.py
+#   python listener.py --stats         # add jitter/loss/staleness lines, see telemetry_stats.py
+import argparse
+
+import telemetry
+from receiver import DEFAULT_PORTS, TelemetryReceiver
+
+parser = argparse.ArgumentParser(description="Receive camera telemetry over UDP")
+parser.add_argument("--host", default="0.0.0.0")
+parser.add_argument("--ports", type=int, nargs="+", default=list(DEFAULT_PORTS))
+parser.add_argument("--interval", type=float, default=1.0, help="seconds between summaries")
+parser.add_argument("--verbose", action="store_true", help="also print every packet (slow)")
+parser.add_argument("--shm", nargs="?", const="motionlab_telemetry", default=None,
+                    help="publish decoded samples to this shared memory ring")
+parser.add_argument("--record", default=None, help="append the datagrams to this recording file")
+parser.add_argument("--stats", action="store_true", help="print jitter, loss and detection staleness")
+args = parser.parse_args()
+
+receiver = TelemetryReceiver(args.ports, args.host)
+
+if args.stats:
+    from telemetry_stats import TelemetryStats
+    receiver.add_reporter(receiver.add_consumer(TelemetryStats()))
+
+closing = []
+if args.shm:
+    from telemetry_ring import RingWriter
+    closing.append(receiver.add_consumer(RingWriter(args.shm)))
+if args.record:
+    from recording import Recorder
+    closing.append(receiver.add_tap(Recorder(args.record)))
+
+if args.verbose:
+    def print_packets(batch):
+        for packet in batch.packets:
+            names = telemetry.SLOT_NAMES.get(int(packet['kind']), ("a", "b"))
+            print(f"port {batch.port} seq {packet['seq']}: {names[0]}={packet['pos'][0]}, "
+                  f"{names[1]}={packet['pos'][1]}, quatRot={packet['quat']}, hooked={packet['hooked']}")
+    receiver.add_consumer(print_packets)
+
+print(f"Listening for UDP packets on {args.host}:{', '.join(str(p) for p in args.ports)}...")
+try:
+    receiver.run(args.interval)
+finally:
+    for consumer in closing:
+        consumer.close()
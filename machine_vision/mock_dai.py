@@ -0,0 +1,247 @@
+# Stand-in for the depthai module, so pipeline_profiles.py can build and sweep pipelines without a
+# camera (CI, laptops).
+#
+# Nodes record every set*/enable* call and link, so a built pipeline can be inspected. Device runs
+# a rough cost model of the pipeline instead of the hardware: the color camera delivers fps frames,
+# the network handles inference_threads frames at a time with an inference time that grows with
+# the preview area and with contention between threads, stereo adds latency that depends on the
+# mono resolution and preset, frames arriving while every thread is busy are dropped (the network
+# input is non-blocking). Output queues of XLinkOut nodes replay the resulting messages on a
+# simulated clock, so measuring 10 s of "device time" returns immediately. The numbers are only
+# meant to rank settings against each other, real values come from a sweep on a camera.
+import random
+import time
+import zlib
+from datetime import timedelta
+
+__version__ = "mock"
+_now = [0.0]  # simulated device clock in seconds, only moves forward
+
+# Cost model constants (ms), roughly a YOLOv6n 416x416 on 6 shaves of an OAK-D
+NN_MS = 38.0  # one inference at 416x416 on one thread
+THREAD_CONTENTION = 0.3  # every extra thread slows each inference by this fraction
+ISP_MS = 12.0
+STEREO_MS = {'THE_400_P': 4.0, 'THE_480_P': 5.0, 'THE_720_P': 10.0, 'THE_800_P': 11.0}
+STEREO_PRESET_MS = {'HIGH_DENSITY': 0.0, 'HIGH_ACCURACY': 3.0}
+STEREO_MAX_FPS = {'THE_400_P': 120.0, 'THE_480_P': 110.0, 'THE_720_P': 60.0, 'THE_800_P': 60.0}
+JITTER_MS = 1.5
+
+
+class _Names:
+    # Enum namespace: every attribute is its own name
+    def __init__(self, **nested):
+        self.__dict__.update(nested)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return name
+
+
+class _Port:
+    def __init__(self, node, name):
+        self.node = node
+        self.name = name
+        self.settings = {}
+
+    def link(self, other):
+        self.node.pipeline.links.append((self, other))
+
+    def setBlocking(self, blocking):
+        self.settings['blocking'] = blocking
+
+    def setQueueSize(self, size):
+        self.settings['queue_size'] = size
+
+
+class _Ports(dict):
+    def __init__(self, node):
+        super().__init__()
+        self.node = node
+
+    def __missing__(self, name):
+        port = self[name] = _Port(self.node, name)
+        return port
+
+
+class _Node:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.settings = {}  # method name -> args of the last call, enableIMUSensor -> list of args
+        self.ports = {}
+        self.inputs = _Ports(self)
+        self.outputs = _Ports(self)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name.startswith("set") or name.startswith("enable"):
+            def record(*args, **kwargs):
+                if name.startswith("enable"):
+                    self.settings.setdefault(name, []).append(args)
+                else:
+                    self.settings[name] = args[0] if len(args) == 1 else args
+            return record
+        port = self.ports.get(name)
+        if port is None:
+            port = self.ports[name] = _Port(self, name)
+        return port
+
+
+def _node_type(name, **nested):
+    return type(name, (_Node,), dict(nested))
+
+
+node = _Names(
+    ColorCamera=_node_type("ColorCamera"),
+    MonoCamera=_node_type("MonoCamera"),
+    StereoDepth=_node_type("StereoDepth", PresetMode=_Names()),
+    YoloSpatialDetectionNetwork=_node_type("YoloSpatialDetectionNetwork"),
+    IMU=_node_type("IMU"),
+    Script=_node_type("Script"),
+    XLinkOut=_node_type("XLinkOut"),
+)
+ColorCameraProperties = _Names(SensorResolution=_Names(), ColorOrder=_Names())
+MonoCameraProperties = _Names(SensorResolution=_Names())
+CameraBoardSocket = _Names()
+IMUSensor = _Names()
+ProcessorType = _Names()
+OpenVINO = _Names(Version=_Names())
+
+
+class Pipeline:
+    def __init__(self):
+        self.nodes = []
+        self.links = []
+
+    def create(self, node_type):
+        created = node_type(self)
+        self.nodes.append(created)
+        return created
+
+    def find(self, type_name):
+        return [n for n in self.nodes if type(n).__name__ == type_name]
+
+
+class Clock:
+    @staticmethod
+    def now():
+        return timedelta(seconds=_now[0])
+
+
+class DeviceInfo:
+    def __init__(self, name=""):
+        self.name = name
+
+
+class _Message:
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.detections = []
+        self.packets = []
+
+    def getTimestamp(self):
+        return timedelta(seconds=self.timestamp)
+
+
+def performance(pipeline):
+    # Cost model of a built pipeline: detections per second, mean detection latency (s) and IMU
+    # messages per second
+    camera = pipeline.find("ColorCamera")[0].settings
+    network = pipeline.find("YoloSpatialDetectionNetwork")[0].settings
+    stereo = pipeline.find("StereoDepth")[0].settings
+    mono = pipeline.find("MonoCamera")[0].settings
+    imu = pipeline.find("IMU")[0].settings
+    fps = float(camera.get('setFps', 30))
+    width, height = camera.get('setPreviewSize', (416, 416))
+    threads = int(network.get('setNumInferenceThreads', 2))
+    resolution = mono.get('setResolution', 'THE_400_P')
+    nn = NN_MS * (width * height) / (416 * 416) * (1 + THREAD_CONTENTION * (threads - 1)) / 1e3
+    stereo_time = (STEREO_MS.get(resolution, 10.0) + STEREO_PRESET_MS.get(stereo.get('setDefaultProfilePreset'), 0.0)) / 1e3
+    capacity = min(threads / nn, STEREO_MAX_FPS.get(resolution, 60.0))
+    rate = min(fps, capacity)
+    # A frame waits for a free thread about half an inference when the network is saturated
+    wait = 0.5 * nn * min(fps / capacity, 1.0) ** 4
+    latency = ISP_MS / 1e3 + 0.5 / fps + stereo_time + nn + wait
+    imu_rate = 0.0
+    for sensor, sensor_rate in imu.get('enableIMUSensor', []):
+        imu_rate = max(imu_rate, float(sensor_rate))
+    imu_rate /= max(int(imu.get('setBatchReportThreshold', 1)), 1)
+    return rate, latency, imu_rate
+
+
+class _Queue:
+    # Messages of one stream in simulated time: a message becomes available at timestamp + latency
+    def __init__(self, rate, latency, seed):
+        self.period = 1.0 / rate if rate > 0 else float("inf")
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.next_time = _now[0]
+
+    def _next(self):
+        timestamp = self.next_time
+        self.next_time += self.period
+        arrival = timestamp + max(self.latency + self.rng.gauss(0.0, JITTER_MS / 1e3), 0.0)
+        return _Message(timestamp), arrival
+
+    def get(self):
+        msg, arrival = self._next()
+        _now[0] = max(_now[0], arrival)
+        return msg
+
+    def tryGetAll(self):
+        messages = []
+        while self.next_time + self.latency <= _now[0]:
+            messages.append(self._next()[0])
+        return messages
+
+    def tryGet(self):
+        if self.next_time + self.latency <= _now[0]:
+            return self._next()[0]
+        return None
+
+
+class Device:
+    def __init__(self, pipeline, *args, **kwargs):
+        self.pipeline = pipeline
+        self.rate, self.latency, self.imu_rate = performance(pipeline)
+        self.sources = {}  # XLinkOut stream name -> type of the node linked to it
+        for source, target in pipeline.links:
+            if type(target.node).__name__ == "XLinkOut":
+                self.sources[target.node.settings.get('setStreamName')] = type(source.node).__name__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def getOutputQueue(self, name, maxSize=4, blocking=False):
+        source = self.sources[name]
+        if source == "IMU":
+            return _Queue(self.imu_rate, 0.002, seed=zlib.crc32(name.encode()))
+        return _Queue(self.rate, self.latency, seed=zlib.crc32(name.encode()))
+
+    def getMxId(self):
+        return "MOCK00000000000000"
+
+
+class DeviceBootloader:
+    # Flashing takes FLASH_SECONDS of wall time with progress callbacks, like the real one
+    FLASH_SECONDS = 2.0
+
+    def __init__(self, devInfo=None, *args, **kwargs):
+        self.device_info = devInfo
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def flash(self, progress, pipeline, *args, **kwargs):
+        steps = 20
+        for i in range(1, steps + 1):
+            time.sleep(self.FLASH_SECONDS / steps)
+            progress(i / steps)
+        return True, ""
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# Host-side orientation filter for the raw IMU stream (device_loop.py with raw_imu).
+#
+# The Script loop keeps only the newest rotation vector of every IMU batch and the game rotation
+# vector leaves the frame pitched ~20 deg (see README). With raw_imu every accelerometer and
+# gyroscope sample is sent instead and this filter turns whole batches into quaternions.
+#
+# Mahony complementary filter (gyro integration corrected towards the measured gravity, with an
+# integral term that estimates the gyro bias), evaluated a batch at a time without a Python loop
+# over the samples:
+#   1. the gyro is integrated over the batch as a prefix product of the per-sample rotations
+#      (log2(n) vectorized quaternion products)
+#   2. the gravity error of every sample is taken against that open-loop orientation
+#   3. the bias is updated from the summed error and the batch is integrated again with the
+#      proportional correction added to the rates
+# Batches are 10-20 ms, short enough that taking the error against the open-loop orientation is
+# indistinguishable from the sample-by-sample filter (reference_update). Repeated gyro reports
+# (the gyro runs at 400 Hz in 500 Hz packets) get dt = 0 and do not integrate twice. Gravity says
+# nothing about yaw, so the bias around the vertical is only learned while the camera is tilted.
+#
+# Quaternions are (i, j, k, real) like the telemetry packets, body to world, world z up.
+#
+#   python orientation.py bench                 synthetic swing: cost per batch and tilt/bias error
+#   python orientation.py live --port 5018      filter the raw stream of a camera, compare the tilt
+#                                               with the on-device rotation vector
+import argparse
+import socket
+import time
+
+import numpy as np
+
+import telemetry
+from frames import quaternion_matrices
+
+GRAVITY = 9.81  # m/s^2
+
+
+# a * b = L(a) @ b, L(a) gathered from a with these indices and signs
+_L_INDEX = np.array([[3, 2, 1, 0], [2, 3, 0, 1], [1, 0, 3, 2], [0, 1, 2, 3]])
+_L_SIGN = np.array([[1, -1, 1, 1], [1, 1, -1, 1], [-1, 1, 1, 1], [-1, -1, -1, 1]], dtype=np.float64)
+
+
+def quat_multiply(a, b):
+    # Hamilton product of (..., 4) arrays in (i, j, k, real) order. Written as one gathered 4x4
+    # matrix product, a handful of NumPy calls no matter the batch size.
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    return (a[..., _L_INDEX] * _L_SIGN @ b[..., None])[..., 0]
+
+
+_NEXT = np.array([1, 2, 0])
+_PREV = np.array([2, 0, 1])
+
+
+def cross(a, b):
+    # np.cross for (n, 3), without its overhead on short arrays
+    return a[:, _NEXT] * b[:, _PREV] - a[:, _PREV] * b[:, _NEXT]
+
+
+def rotation_quat(rates, dt):
+    # (n, 3) body rates [rad/s] held for dt (n,) seconds -> (n, 4) rotation quaternions
+    angle = np.linalg.norm(rates, axis=1) * dt
+    half = 0.5 * angle
+    # sin(half) / |rates| without dividing by zero, small angle limit 0.5 * dt
+    scale = np.where(angle > 1e-12, np.sin(half) / np.maximum(angle, 1e-12) * dt, 0.5 * dt)
+    return np.concatenate([rates * scale[:, None], np.cos(half)[:, None]], axis=1)
+
+
+def prefix_product(q):
+    # q[0], q[0] q[1], q[0] q[1] q[2], ... for (n, 4), Hillis-Steele scan in log2(n) steps
+    q = q.copy()
+    step = 1
+    while step < len(q):
+        q[step:] = quat_multiply(q[:-step], q[step:])
+        step *= 2
+    return q
+
+
+def gravity_in_body(q):
+    # World up (0, 0, 1) seen from the body, third row of the rotation matrix of q, (..., 3)
+    return quaternion_matrices(q)[..., 2, :]
+
+
+def tilt_quat(accel):
+    # Orientation with zero yaw that maps the measured gravity direction to world up
+    a = accel / np.linalg.norm(accel)
+    q = np.array([a[1], -a[0], 0.0, 1.0 + a[2]])  # shortest rotation a -> (0, 0, 1)
+    if q[3] < 1e-6:
+        return np.array([1.0, 0.0, 0.0, 0.0])  # upside down
+    return q / np.linalg.norm(q)
+
+
+def tilt_angle(q_a, q_b):
+    # Angle [rad] between the gravity directions of two orientations, ignores yaw
+    ga, gb = gravity_in_body(q_a), gravity_in_body(q_b)
+    cos = np.sum(ga * gb, axis=-1) / (np.linalg.norm(ga, axis=-1) * np.linalg.norm(gb, axis=-1))
+    return np.arccos(np.clip(cos, -1.0, 1.0))
+
+
+class OrientationFilter:
+    def __init__(self, kp=1.0, ki=0.2, accel_gate=0.15, max_dt=0.05):
+        # kp: gravity correction gain [1/s], ki: bias gain, accel_gate: measurements whose norm is
+        # off g by more than this fraction (the camera is accelerating) do not correct
+        self.kp = kp
+        self.ki = ki
+        self.accel_gate = accel_gate
+        self.max_dt = max_dt
+        self.q = None
+        self.bias = np.zeros(3)
+        self.t = None
+
+    def _errors(self, q, accel):
+        norm = np.linalg.norm(accel, axis=1)
+        valid = np.abs(norm - GRAVITY) < self.accel_gate * GRAVITY
+        a = accel / np.maximum(norm, 1e-9)[:, None]
+        return cross(a, gravity_in_body(q)) * valid[:, None]
+
+    def update(self, t, accel, gyro):
+        # t (n,) gyro sample times [s], accel/gyro (n, 3) -> (n, 4) orientation after every sample
+        t = np.asarray(t, dtype=np.float64)
+        accel = np.asarray(accel, dtype=np.float64)
+        gyro = np.asarray(gyro, dtype=np.float64)
+        if self.q is None:
+            self.q = tilt_quat(accel[0])
+            self.t = t[0]
+        dt = np.diff(t, prepend=self.t)
+        dt = np.clip(dt, 0.0, self.max_dt)
+        rates = gyro - self.bias
+        # Open loop pass, only used for the gravity error
+        q_open = quat_multiply(self.q, prefix_product(rotation_quat(rates, dt)))
+        error = self._errors(q_open, accel)
+        self.bias -= self.ki * np.sum(error * dt[:, None], axis=0)
+        q = quat_multiply(self.q, prefix_product(rotation_quat(rates + self.kp * error, dt)))
+        q /= np.linalg.norm(q, axis=1, keepdims=True)
+        self.q = q[-1]
+        self.t = max(self.t, t[-1])
+        return q
+
+    def reference_update(self, t, accel, gyro):
+        # The same filter sample by sample, for comparing accuracy and cost
+        out = np.empty((len(t), 4))
+        for i in range(len(t)):
+            if self.q is None:
+                self.q = tilt_quat(accel[i])
+                self.t = t[i]
+            dt = min(max(t[i] - self.t, 0.0), self.max_dt)
+            error = self._errors(self.q[None], accel[i:i + 1])[0]
+            self.bias -= self.ki * error * dt
+            rates = gyro[i] - self.bias + self.kp * error
+            self.q = quat_multiply(self.q, rotation_quat(rates[None], np.array([dt]))[0])
+            self.q /= np.linalg.norm(self.q)
+            self.t = max(self.t, t[i])
+            out[i] = self.q
+        return out
+
+
+def batch_arrays(batch):
+    # telemetry.ImuBatch -> (gyro times [s], accel, gyro) as used by OrientationFilter.update
+    samples = batch.samples
+    t = (batch.timestamp_us + samples['gyro_dt_us'].astype(np.int64)) * 1e-6
+    return t, samples['accel'].astype(np.float64), samples['gyro'].astype(np.float64)
+
+
+def synthetic(seconds=20.0, rate_accel=500.0, rate_gyro=400.0, bias=(0.02, -0.015, 0.01), seed=0):
+    # Swinging camera: packets at the accelerometer rate, each with the latest gyro report.
+    # Returns (t gyro per packet, accel, gyro, true orientation per packet)
+    rng = np.random.default_rng(seed)
+    t = np.arange(0.0, seconds, 1.0 / rate_accel)
+    t_gyro = np.floor(t * rate_gyro) / rate_gyro  # latest gyro report in each packet
+    def truth(tt):
+        roll = 0.3 * np.sin(2 * np.pi * 0.5 * tt)
+        pitch = 0.2 * np.sin(2 * np.pi * 0.3 * tt + 1.0)
+        yaw = 0.1 * tt
+        half = np.stack([roll, pitch, yaw], axis=1) / 2
+        qx = np.stack([np.sin(half[:, 0]), 0 * tt, 0 * tt, np.cos(half[:, 0])], axis=1)
+        qy = np.stack([0 * tt, np.sin(half[:, 1]), 0 * tt, np.cos(half[:, 1])], axis=1)
+        qz = np.stack([0 * tt, 0 * tt, np.sin(half[:, 2]), np.cos(half[:, 2])], axis=1)
+        return quat_multiply(qz, quat_multiply(qy, qx))
+    q_true = truth(t)
+    # Body rates from the change of the true orientation around each gyro sample time
+    h = 1e-4
+    qa, qb = truth(t_gyro - h), truth(t_gyro + h)
+    dq = quat_multiply(qa * np.array([-1, -1, -1, 1]), qb)
+    rates = 2 * dq[:, :3] * np.sign(dq[:, 3:]) / (2 * h)
+    gyro = rates + np.asarray(bias) + rng.normal(0, 0.005, rates.shape)
+    accel = GRAVITY * gravity_in_body(q_true) + rng.normal(0, 0.05, (len(t), 3))
+    return t_gyro, accel, gyro, q_true
+
+
+def benchmark(batch_size=10, seconds=20.0):
+    t, accel, gyro, q_true = synthetic(seconds)
+    results = {}
+    for name in ("batch", "reference"):
+        f = OrientationFilter()
+        out = np.empty((len(t), 4))
+        start = time.perf_counter()
+        for i in range(0, len(t), batch_size):
+            s = slice(i, i + batch_size)
+            update = f.update if name == "batch" else f.reference_update
+            out[s] = update(t[s], accel[s], gyro[s])
+        elapsed = time.perf_counter() - start
+        settled = t > 10.0  # after the bias has converged
+        results[name] = {
+            'us_per_batch': 1e6 * elapsed / int(np.ceil(len(t) / batch_size)),
+            'tilt_rms_deg': float(np.degrees(np.sqrt(np.mean(tilt_angle(out[settled], q_true[settled]) ** 2)))),
+            'bias': f.bias.copy(),
+        }
+    return results
+
+
+def live(port, host="0.0.0.0", interval=1.0, filter_=None):
+    # Filters the raw IMU datagrams of one camera and prints the tilt against the device
+    # rotation vector every interval
+    filter_ = filter_ or OrientationFilter()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    buffer = bytearray(65536)
+    samples = batches = 0
+    cost = 0.0
+    diffs = []
+    last = time.perf_counter()
+    last_seq = None
+    lost = 0
+    while True:
+        size = sock.recv_into(buffer)
+        try:
+            batch = telemetry.decode_imu(memoryview(buffer)[:size])
+        except ValueError:
+            continue
+        if last_seq is not None:
+            gap = (batch.seq - last_seq) & 0xFFFFFFFF
+            if 1 < gap < 1 << 16:
+                lost += gap - 1
+        last_seq = batch.seq
+        t, accel, gyro = batch_arrays(batch)
+        start = time.perf_counter()
+        q = filter_.update(t, accel, gyro)
+        cost += time.perf_counter() - start
+        samples += len(t)
+        batches += 1
+        if any(batch.quat):
+            diffs.append(np.degrees(tilt_angle(q[-1], np.asarray(batch.quat))))
+        now = time.perf_counter()
+        if now - last >= interval:
+            tilt = f"tilt vs device {np.mean(diffs):5.2f} deg" if diffs else "no device rotation vector"
+            print(f"{samples / (now - last):6.0f} samples/s  {1e6 * cost / max(batches, 1):5.1f} us/batch  "
+                  f"bias {np.round(filter_.bias, 4)} rad/s  {tilt}  lost batches {lost}")
+            samples = batches = 0
+            cost = 0.0
+            diffs = []
+            last = now
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host-side orientation filter for the raw IMU stream")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("bench", help="synthetic benchmark of the batch filter against the per-sample loop")
+    p.add_argument("--batch", type=int, default=10, help="samples per IMU batch")
+    p.add_argument("--seconds", type=float, default=20.0)
+    p = sub.add_parser("live", help="filter a camera's raw IMU stream")
+    p.add_argument("--port", type=int, default=5008 + telemetry.IMU_PORT_OFFSET)
+    p.add_argument("--kp", type=float, default=1.0)
+    p.add_argument("--ki", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        for name, r in benchmark(args.batch, args.seconds).items():
+            print(f"{name:9s} {r['us_per_batch']:7.1f} us per batch of {args.batch}, "
+                  f"tilt error {r['tilt_rms_deg']:.3f} deg RMS, bias {np.round(r['bias'], 4)}")
+    else:
+        live(args.port, filter_=OrientationFilter(args.kp, args.ki))
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Pipeline builder for main.py/base_cam.py driven by the named profiles in profiles.json.
+#
+# A profile is a flat dict of settings: "defaults" holds everything both cameras share, a profile
+# lists what differs and may extend another one ("extends"). build() turns a profile into the
+# pipeline main.py and base_cam.py flash: color camera -> YOLO spatial network with stereo depth,
+# IMU, and the device_loop.py Script node configured with the profile's loop, port and rates.
+#
+# The sweep builds the pipeline for every point of a parameter grid, runs it with two extra
+# XLinkOut taps (detections and IMU) and records the detection rate, the detection latency
+# (device clock now - frame timestamp) and the IMU message rate. It runs against a camera with
+# --device, or with --mock against the cost model of mock_dai.py (hand-picked constants, the report
+# is then marked as simulated and only ranks the settings roughly); the report marks the Pareto-best
+# settings (no other setting has a higher detection rate and a lower p95 latency).
+#
+#   python pipeline_profiles.py show payload_base
+#   python pipeline_profiles.py sweep claw --grid fps=10,15,20,30 inference_threads=1,2 --mock
+#   python pipeline_profiles.py sweep claw --grid stereo_preset=HIGH_DENSITY,HIGH_ACCURACY --device 14442C10515CF0D600
+import argparse
+import itertools
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+import device_loop
+
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.json")
+LOOPS = {
+    'claw': device_loop.CLAW_CONFIG,
+    'payload': device_loop.PAYLOAD_CONFIG,
+}
+TAP_DETECTIONS = "sweep_detections"
+TAP_IMU = "sweep_imu"
+
+
+def load(name, path=PROFILES_PATH, **overrides):
+    # Profile `name` merged over its parents and the defaults, with overrides on top
+    with open(path) as f:
+        profiles = json.load(f)
+    chain = []
+    while name is not None:
+        if name not in profiles:
+            raise KeyError(f"No profile {name!r} in {path}")
+        if name in chain:
+            raise ValueError(f"Profile {name!r} extends itself")
+        chain.append(name)
+        name = profiles[name].get('extends')
+    profile = dict(profiles.get('defaults', {}))
+    for name in reversed(chain):
+        profile.update(profiles[name])
+    profile.pop('extends', None)
+    profile['name'] = chain[0]
+    profile.update(overrides)
+    return profile
+
+
+def names(path=PROFILES_PATH):
+    with open(path) as f:
+        return [name for name in json.load(f) if name != 'defaults']
+
+
+def loop_config(profile):
+    # device_loop.py config of a profile
+    return dict(LOOPS[profile['loop']], port=profile['port'], camera_id=profile['camera_id'],
+                hz_udp=profile['hz_udp'], raw_imu=profile['raw_imu'],
+                all_detections=profile['all_detections'])
+
+
+def build(profile, dai=None, taps=False):
+    # Pipeline of a profile; dai is the depthai module (or mock_dai), taps adds the XLinkOut
+    # outputs the sweep reads
+    if dai is None:
+        import depthai as dai
+    p = profile
+    blob_file_path = str((Path(__file__).parent / Path(p['blob'])).resolve().absolute())
+
+    pipeline = dai.Pipeline()
+    camRgb = pipeline.create(dai.node.ColorCamera)
+    spatialDetectionNetwork = pipeline.create(dai.node.YoloSpatialDetectionNetwork)
+    monoLeft = pipeline.create(dai.node.MonoCamera)
+    monoRight = pipeline.create(dai.node.MonoCamera)
+    stereo = pipeline.create(dai.node.StereoDepth)
+    imu = pipeline.create(dai.node.IMU)
+    script = pipeline.create(dai.node.Script)
+
+    camRgb.setPreviewSize(*p['preview'])  # Must match the trained model
+    camRgb.setPreviewKeepAspectRatio(False)  # Force stretching (no letterbox)
+    camRgb.setResolution(getattr(dai.ColorCameraProperties.SensorResolution, p['rgb_resolution']))
+    camRgb.setInterleaved(False)
+    camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
+    camRgb.setFps(p['fps'])
+
+    mono_resolution = getattr(dai.MonoCameraProperties.SensorResolution, p['mono_resolution'])
+    monoLeft.setResolution(mono_resolution)
+    monoLeft.setBoardSocket(dai.CameraBoardSocket.CAM_B)
+    monoRight.setResolution(mono_resolution)
+    monoRight.setBoardSocket(dai.CameraBoardSocket.CAM_C)
+
+    stereo.setDepthAlign(dai.CameraBoardSocket.CAM_A)
+    stereo.setDefaultProfilePreset(getattr(dai.node.StereoDepth.PresetMode, p['stereo_preset']))
+
+    spatialDetectionNetwork.setBlobPath(blob_file_path)
+    spatialDetectionNetwork.setConfidenceThreshold(p['confidence'])
+    spatialDetectionNetwork.input.setBlocking(False)
+    spatialDetectionNetwork.setBoundingBoxScaleFactor(p['bbox_scale'])
+    spatialDetectionNetwork.setDepthLowerThreshold(p['depth_lower'])
+    spatialDetectionNetwork.setDepthUpperThreshold(p['depth_upper'])
+    spatialDetectionNetwork.setNumClasses(p['num_classes'])
+    spatialDetectionNetwork.setCoordinateSize(4)
+    spatialDetectionNetwork.setAnchors(p['anchors'])
+    spatialDetectionNetwork.setAnchorMasks(p['anchor_masks'])
+    spatialDetectionNetwork.setIouThreshold(p['iou'])
+    spatialDetectionNetwork.setNumInferenceThreads(p['inference_threads'])
+
+    imu.enableIMUSensor(getattr(dai.IMUSensor, p['imu_sensor']), p['imu_rate'])
+    imu.setBatchReportThreshold(p['imu_batch_threshold'])  # Keep low to minimize buffering
+    imu.setMaxBatchReports(p['imu_max_batch'])
+    if p['raw_imu']:  # Also stream every accelerometer/gyroscope sample to port + 10 (orientation.py)
+        imu.enableIMUSensor(dai.IMUSensor.ACCELEROMETER_RAW, p['raw_accel_rate'])
+        imu.enableIMUSensor(dai.IMUSensor.GYROSCOPE_RAW, p['raw_gyro_rate'])
+        imu.setMaxBatchReports(p['raw_max_batch'])
+
+    script.setProcessor(dai.ProcessorType.LEON_CSS)
+
+    monoLeft.out.link(stereo.left)
+    monoRight.out.link(stereo.right)
+    stereo.depth.link(spatialDetectionNetwork.inputDepth)
+    camRgb.preview.link(spatialDetectionNetwork.input)
+    # One input for both, so the Script node blocks until either delivers
+    script_input = script.inputs[device_loop.SCRIPT_INPUT]
+    spatialDetectionNetwork.out.link(script_input)
+    imu.out.link(script_input)
+
+    script_input.setBlocking(False)
+    imu_queue = p['raw_imu_queue'] if p['raw_imu'] else p['imu_queue']  # Raw samples must not be dropped
+    script_input.setQueueSize(p['detection_queue'] + imu_queue)
+
+    script.setScript(device_loop.script_source(loop_config(p)))
+
+    if taps:
+        for name, output in ((TAP_DETECTIONS, spatialDetectionNetwork.out), (TAP_IMU, imu.out)):
+            xout = pipeline.create(dai.node.XLinkOut)
+            xout.setStreamName(name)
+            output.link(xout.input)
+    return pipeline
+
+
+def measure(profile, dai, duration=10.0, warmup=2.0, device_info=None):
+    # Runs a profile for duration seconds of device time, returns its metrics
+    pipeline = build(profile, dai, taps=True)
+    args = (pipeline,) if device_info is None else (pipeline, device_info)
+    latencies = []
+    detections = imu_messages = 0
+    with dai.Device(*args) as device:
+        det_queue = device.getOutputQueue(TAP_DETECTIONS, maxSize=8, blocking=False)
+        imu_queue = device.getOutputQueue(TAP_IMU, maxSize=50, blocking=False)
+        start = dai.Clock.now().total_seconds()
+        measure_from = start + warmup
+        while True:
+            msg = det_queue.get()
+            now = dai.Clock.now().total_seconds()
+            imu_count = len(imu_queue.tryGetAll())
+            if now < measure_from:
+                continue
+            if now - measure_from > duration:
+                break
+            detections += 1
+            imu_messages += imu_count
+            latencies.append(now - msg.getTimestamp().total_seconds())
+    latencies = np.array(latencies) * 1e3
+    return {
+        'det_hz': detections / duration,
+        'latency_ms': float(np.median(latencies)) if len(latencies) else float("nan"),
+        'latency_p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else float("nan"),
+        'imu_hz': imu_messages / duration,
+    }
+
+
+def grid_points(grid):
+    # {setting: [values]} -> list of {setting: value}, every combination
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def sweep(name, grid, dai, duration=10.0, device_info=None, path=PROFILES_PATH):
+    # [(settings, metrics)] for every grid point applied to profile `name`
+    results = []
+    for settings in grid_points(grid):
+        metrics = measure(load(name, path, **settings), dai, duration, device_info=device_info)
+        results.append((settings, metrics))
+    return results
+
+
+def pareto(results):
+    # Mask of the results no other result beats on both detection rate and p95 latency
+    det = np.array([m['det_hz'] for _, m in results])
+    latency = np.array([m['latency_p95_ms'] for _, m in results])
+    better_or_equal = (det[None, :] >= det[:, None]) & (latency[None, :] <= latency[:, None])
+    strictly = (det[None, :] > det[:, None]) | (latency[None, :] < latency[:, None])
+    return ~(better_or_equal & strictly).any(axis=1)
+
+
+def report(results, simulated=False):
+    best = pareto(results)
+    order = sorted(range(len(results)), key=lambda i: (not best[i], -results[i][1]['det_hz']))
+    texts = [" ".join(f"{k}={v}" for k, v in settings.items()) or "(profile)" for settings, _ in results]
+    width = max(len(text) for text in texts) + 2
+    lines = ["SIMULATED with the mock_dai.py cost model, not measured on a camera"] if simulated else []
+    lines += [f"{'':2}{'settings':{width}}{'det Hz':>8}{'lat ms':>8}{'p95 ms':>8}{'IMU Hz':>8}"]
+    for i in order:
+        m = results[i][1]
+        lines.append(f"{'*' if best[i] else ' ':2}{texts[i]:{width}}{m['det_hz']:8.1f}{m['latency_ms']:8.1f}"
+                     f"{m['latency_p95_ms']:8.1f}{m['imu_hz']:8.1f}")
+    lines.append("* = Pareto-best (no other setting has a higher rate and a lower p95 latency)")
+    return "\n".join(lines)
+
+
+def parse_grid(items):
+    # ["fps=10,15", "stereo_preset=HIGH_DENSITY"] -> {'fps': [10, 15], 'stereo_preset': ['HIGH_DENSITY']}
+    grid = {}
+    for item in items:
+        key, _, values = item.partition("=")
+        parsed = []
+        for value in values.split(","):
+            try:
+                parsed.append(json.loads(value))
+            except ValueError:
+                parsed.append(value)
+        grid[key] = parsed
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline profiles and performance sweep")
+    parser.add_argument("--profiles", default=PROFILES_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    show_parser = sub.add_parser("show", help="print the merged settings of a profile")
+    show_parser.add_argument("name", nargs="?")
+    sweep_parser = sub.add_parser("sweep", help="measure a profile over a parameter grid")
+    sweep_parser.add_argument("name")
+    sweep_parser.add_argument("--grid", nargs="*", default=[], help="setting=value,value ...")
+    sweep_parser.add_argument("--duration", type=float, default=10.0, help="seconds per grid point")
+    target = sweep_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--device", help="MXID or IP of the camera to measure on")
+    target.add_argument("--mock", action="store_true", help="simulate with the mock_dai.py cost model")
+    sweep_parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        for name in [args.name] if args.name else names(args.profiles):
+            profile = load(name, args.profiles)
+            print(f"{name}: " + ", ".join(f"{k}={v}" for k, v in profile.items()
+                                           if k not in ('anchors', 'anchor_masks', 'name')))
+    else:
+        if args.device:
+            import depthai as dai
+            device_info = dai.DeviceInfo(args.device)
+        else:
+            import mock_dai as dai
+            device_info = None
+        results = sweep(args.name, parse_grid(args.grid), dai, args.duration, device_info, args.profiles)
+        print(report(results, simulated=args.mock))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump([{'settings': s, 'metrics': m, 'simulated': args.mock} for s, m in results], f, indent=1)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# Batched telemetry receiver for all camera ports at once.
+#
+# Each port gets a non-blocking socket registered with an asyncio selector loop. On every wakeup
+# the socket is drained completely into one preallocated buffer, the datagrams are decoded in a
+# single telemetry.decode_many() call and the batch is handed to every registered consumer.
+# Legacy datagrams (cameras still running the unversioned script) are converted in place to a
+# PACKET with version 0, seq 0 and device time 0, so those cameras keep showing up. Taps see every
+# datagram as received, before any check (recording.py records through one). tap_ports are only
+# handed to the taps, for the raw IMU and detections ports whose datagrams are not state packets.
+import asyncio
+import socket
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import telemetry
+
+DEFAULT_PORTS = (5007, 5008)
+
+# port/camera_id: where it came from, recv_time: host time.time() per packet,
+# packets: telemetry.PACKET_DTYPE array, raw: the datagrams back to back (PACKET_SIZE each, legacy
+# ones converted).
+# packets, recv_time and raw point into the receiver's buffers, copy them to keep them.
+Batch = namedtuple("Batch", ["port", "camera_id", "recv_time", "packets", "raw"])
+
+
+class PortStats:
+    def __init__(self):
+        self.packets = 0
+        self.rejected = 0
+        self.legacy = 0
+        self.tapped = 0  # datagrams of a tap port
+        self.wakeups = 0
+        self.largest_batch = 0
+        self.last = None  # last decoded packet (structured scalar copy)
+
+
+class TelemetryReceiver:
+    def __init__(self, ports=DEFAULT_PORTS, host="0.0.0.0", max_batch=256, rcvbuf=1 << 20, tap_ports=()):
+        self.tap_ports = set(tap_ports)
+        self.ports = list(ports) + [port for port in tap_ports if port not in ports]
+        self.host = host
+        self.max_batch = max_batch
+        self.rcvbuf = rcvbuf
+        self.consumers = []
+        self.reporters = []
+        self.taps = []
+        self.consumer_errors = 0
+        self.last_error = None
+        self.sockets = {}
+        self.stats = {port: PortStats() for port in self.ports}
+        # Spare room after the last slot so any datagram fits and wrong sizes can be told apart
+        self.buffer = bytearray(max_batch * telemetry.PACKET_SIZE + 2048)
+        self.view = memoryview(self.buffer)
+        self.recv_time = np.zeros(max_batch)
+
+    def add_consumer(self, consumer):
+        # consumer(batch) is called from the receive loop, keep it short
+        self.consumers.append(consumer)
+        return consumer
+
+    def add_tap(self, tap):
+        # tap(port, recv_time, datagram) is called for every datagram before it is checked, the
+        # datagram is a memoryview into the receive buffer, copy it to keep it
+        self.taps.append(tap)
+        return tap
+
+    def add_reporter(self, reporter):
+        # reporter.report(elapsed) -> str is printed after every summary
+        self.reporters.append(reporter)
+        return reporter
+
+    def open(self):
+        for port in self.ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            sock.bind((self.host, port))
+            sock.setblocking(False)
+            self.sockets[port] = sock
+
+    def close(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets.clear()
+
+    def poll(self, port):
+        # Drain everything queued on one port, returns the number of packets handed out
+        sock = self.sockets[port]
+        stats = self.stats[port]
+        size = telemetry.PACKET_SIZE
+        count = 0
+        total = 0
+        while True:
+            if count == self.max_batch:
+                self._dispatch(port, count)
+                total += count
+                count = 0
+            try:
+                nbytes = sock.recv_into(self.view[count * size:])
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                # Windows reports ICMP port unreachable on UDP sockets, nothing to do
+                continue
+            now = time.time()
+            for tap in self.taps:
+                try:
+                    tap(port, now, self.view[count * size:count * size + nbytes])
+                except Exception as e:
+                    self.consumer_errors += 1
+                    self.last_error = f"{getattr(tap, '__name__', tap)}: {e}"
+            if port in self.tap_ports:
+                stats.tapped += 1
+                continue
+            if nbytes != size:
+                # A camera still running the old script, anything else is rejected
+                try:
+                    telemetry.upgrade_legacy(self.view[count * size:count * size + nbytes], self.buffer,
+                                             count * size, telemetry.CAMERA_PORTS.get(port, 255))
+                except ValueError:
+                    stats.rejected += 1
+                    continue
+                stats.legacy += 1
+            elif self.buffer[count * size] != telemetry.VERSION:
+                stats.rejected += 1
+                continue
+            self.recv_time[count] = now
+            count += 1
+        if count:
+            self._dispatch(port, count)
+            total += count
+        stats.wakeups += 1
+        return total
+
+    def _dispatch(self, port, count):
+        size = telemetry.PACKET_SIZE
+        raw = self.view[:count * size]
+        packets = np.frombuffer(raw, dtype=telemetry.PACKET_DTYPE, count=count)  # checked in poll()
+        stats = self.stats[port]
+        stats.packets += count
+        stats.largest_batch = max(stats.largest_batch, count)
+        stats.last = packets[-1].copy()
+        batch = Batch(port, telemetry.CAMERA_PORTS.get(port), self.recv_time[:count], packets, raw)
+        for consumer in self.consumers:
+            try:
+                consumer(batch)
+            except Exception as e:
+                self.consumer_errors += 1
+                self.last_error = f"{getattr(consumer, '__name__', consumer)}: {e}"
+
+    def summary(self, elapsed, previous):
+        # One compact line per port, previous holds the packet counts from the last summary
+        lines = []
+        for port in self.ports:
+            stats = self.stats[port]
+            if port in self.tap_ports:
+                rate = (stats.tapped - previous.get(port, 0)) / elapsed if elapsed > 0 else 0.0
+                previous[port] = stats.tapped
+                lines.append(f"port {port}: {rate:7.1f} Hz, total {stats.tapped} (tapped only)")
+                continue
+            rate = (stats.packets - previous.get(port, 0)) / elapsed if elapsed > 0 else 0.0
+            previous[port] = stats.packets
+            line = (f"port {port}: {rate:7.1f} Hz, total {stats.packets}, rejected {stats.rejected}, "
+                    f"legacy {stats.legacy}, "
+                    f"largest batch {stats.largest_batch}")
+            if stats.last is not None:
+                names = telemetry.SLOT_NAMES.get(int(stats.last['kind']), ("a", "b"))
+                pos = stats.last['pos']
+                line += (f" | seq {int(stats.last['seq'])} {names[0]}={tuple(pos[0].tolist())} "
+                         f"{names[1]}={tuple(pos[1].tolist())} hooked={int(stats.last['hooked'])}")
+            lines.append(line)
+        if self.consumer_errors:
+            lines.append(f"consumer errors: {self.consumer_errors} (last: {self.last_error})")
+        return "\n".join(lines)
+
+    async def serve(self, summary_interval=1.0, out=sys.stdout):
+        loop = asyncio.get_running_loop()
+        if not self.sockets:
+            self.open()
+        for port, sock in self.sockets.items():
+            loop.add_reader(sock.fileno(), self.poll, port)
+        try:
+            previous = {}
+            last = time.time()
+            while True:
+                await asyncio.sleep(summary_interval if summary_interval else 3600)
+                if summary_interval:
+                    now = time.time()
+                    print(self.summary(now - last, previous), file=out)
+                    for reporter in self.reporters:
+                        print(reporter.report(now - last), file=out)
+                    out.flush()
+                    last = now
+        finally:
+            for sock in self.sockets.values():
+                loop.remove_reader(sock.fileno())
+
+    def run(self, summary_interval=1.0):
+        # Selector loop on every platform, the Windows proactor loop has no add_reader()
+        loop = asyncio.SelectorEventLoop()
+        try:
+            loop.run_until_complete(self.serve(summary_interval))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+            loop.close()
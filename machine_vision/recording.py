@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# Records the raw camera datagrams to a memory-mapped file and replays them over UDP.
+#
+# Datagrams are recorded as they come off the socket (a TelemetryReceiver tap), before any length
+# or version check: state packets, legacy ones, IMU_RAW, DETECTIONS, ZONES and whatever else
+# arrives on the recorded ports, and replayed byte for byte.
+#
+# File layout: 64 byte header (magic, format version, record count, bytes of records) followed by
+# the records in receive order, each a 12 byte prefix (receive time, source port, length) and the
+# datagram. The header is updated after every record, a recording cut short by a crash is still
+# readable up to the last datagram. The index (offset, receive time, port, length per record) is
+# kept next to it in <path>.idx, written by Recorder.close(); a recording without a matching index
+# (cut short, or format 2 without one) is walked once and the index saved. The receive time column
+# is sorted and doubles as the index for seeking by time (np.searchsorted).
+#
+# The raw IMU and detections ports are recorded through the receiver's tap_ports, so they are not
+# checked (and rejected) as state packets.
+#
+#   python recording.py record session.mlrec                  # state, raw IMU and detections ports
+#   python recording.py info session.mlrec
+#   python recording.py replay session.mlrec --speed 2        # 0 = as fast as possible
+#   python recording.py replay session.mlrec --start 30 --end 60 --host 127.0.0.1
+import argparse
+import mmap
+import os
+import socket
+import struct
+import time
+
+import numpy as np
+
+import telemetry
+
+MAGIC = b"MLREC\0\0\0"
+FORMAT_VERSION = 2  # 1 was fixed 64 byte records of the accepted state packets only
+HEADER = struct.Struct("<8sIQQ")  # magic, format version, record count, bytes of records
+HEADER_SIZE = 64
+PREFIX = struct.Struct("<dHH")  # host time.time(), port, datagram length
+GROW_BYTES = 1 << 22
+RAW_PORTS = set(telemetry.IMU_PORTS) | set(telemetry.DETECTIONS_PORTS)  # not state packets
+DEFAULT_PORTS = sorted(set(telemetry.CAMERA_PORTS) | RAW_PORTS)
+INDEX_SUFFIX = ".idx"
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('recv_time', '<f8'), ('port', '<u2'), ('length', '<u2')])
+
+
+def write_index(path, index):
+    # Best effort, a recording on a read-only medium is walked on every open instead
+    try:
+        with open(path + INDEX_SUFFIX, "wb") as f:
+            np.save(f, index)
+    except OSError:
+        pass
+
+
+class Recorder:
+    # Receiver tap (receiver.add_tap) that appends every datagram to the file
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.used = 0
+        self.capacity = 0
+        self.file = open(path, "w+b")
+        if os.path.exists(path + INDEX_SUFFIX):
+            os.remove(path + INDEX_SUFFIX)  # of an older recording at this path
+        self.index = np.zeros(1024, dtype=INDEX_DTYPE)
+        self.mm = None
+        self._grow(GROW_BYTES)
+        self._write_header()
+
+    def _grow(self, capacity):
+        if self.mm is not None:
+            self.mm.close()
+        self.file.truncate(HEADER_SIZE + capacity)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.capacity = capacity
+
+    def _write_header(self):
+        HEADER.pack_into(self.mm, 0, MAGIC, FORMAT_VERSION, self.count, self.used)
+
+    def append(self, recv_time, port, data):
+        size = len(data)
+        if self.used + PREFIX.size + size > self.capacity:
+            self._grow(max(self.capacity * 2, self.used + PREFIX.size + size))
+        offset = HEADER_SIZE + self.used
+        PREFIX.pack_into(self.mm, offset, recv_time, port, size)
+        self.mm[offset + PREFIX.size:offset + PREFIX.size + size] = data
+        if self.count == len(self.index):
+            self.index = np.resize(self.index, 2 * len(self.index))
+        self.index[self.count] = (self.used + PREFIX.size, recv_time, port, size)
+        self.used += PREFIX.size + size
+        self.count += 1
+        self._write_header()
+
+    def __call__(self, port, recv_time, data):
+        self.append(recv_time, port, data)
+
+    def close(self):
+        self._write_header()
+        self.mm.flush()
+        self.mm.close()
+        self.file.truncate(HEADER_SIZE + self.used)
+        self.file.close()
+        write_index(self.path, self.index[:self.count])
+
+
+class Recording:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, count, used = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a telemetry recording (format {FORMAT_VERSION})")
+        self.path = path
+        if used:
+            self.data = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_SIZE, shape=(used,))
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+        index = self._load_index(count, used)
+        if index is None:
+            index = self._walk(count)
+            write_index(path, index)
+        self.offsets = index['offset']  # of the datagram in self.data
+        self.recv_time = index['recv_time']
+        self.ports = index['port'].astype(np.int64)
+        self.lengths = index['length'].astype(np.int64)
+
+    def _load_index(self, count, used):
+        # The saved index, if it covers exactly the records in the header
+        try:
+            index = np.load(self.path + INDEX_SUFFIX)
+        except (OSError, ValueError):
+            return None
+        if index.dtype != INDEX_DTYPE or len(index) != count:
+            return None
+        if count and index['offset'][-1] + index['length'][-1] != used:
+            return None
+        return index
+
+    def _walk(self, count):
+        # One pass over the length prefixes
+        index = np.zeros(count, dtype=INDEX_DTYPE)
+        raw = memoryview(self.data) if count else b""
+        offset = 0
+        for i in range(count):
+            recv_time, port, length = PREFIX.unpack_from(raw, offset)
+            offset += PREFIX.size
+            index[i] = (offset, recv_time, port, length)
+            offset += length
+        return index
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def start_time(self):
+        return float(self.recv_time[0]) if len(self) else 0.0
+
+    @property
+    def duration(self):
+        return float(self.recv_time[-1]) - self.start_time if len(self) else 0.0
+
+    def seek(self, seconds):
+        # Index of the first record at or after `seconds` from the start of the recording
+        return int(np.searchsorted(self.recv_time, self.start_time + seconds))
+
+    def slice(self, start=None, end=None):
+        # Record indices between start and end seconds
+        first = self.seek(start) if start is not None else 0
+        last = self.seek(end) if end is not None else len(self)
+        return np.arange(first, last)
+
+    def datagram(self, i):
+        offset = int(self.offsets[i])
+        return self.data[offset:offset + int(self.lengths[i])].tobytes()
+
+    def datagrams(self, records=None):
+        # (port, bytes) for each record
+        records = range(len(self)) if records is None else records
+        for i in records:
+            yield int(self.ports[i]), self.datagram(i)
+
+    def packets(self, port=None):
+        # All telemetry state packets (optionally of one port) decoded in one call
+        mask = self.lengths == telemetry.PACKET_SIZE
+        if port is not None:
+            mask &= self.ports == port
+        gather = self.offsets[mask][:, None] + np.arange(telemetry.PACKET_SIZE)
+        raw = np.ascontiguousarray(self.data[gather])
+        return telemetry.decode_many(raw.tobytes()), self.recv_time[mask]
+
+
+def replay(recording, host="127.0.0.1", speed=1.0, start=None, end=None, port_offset=0):
+    # Re-emit the datagrams verbatim with the recorded timing scaled by speed (0 = as fast as possible)
+    records = recording.slice(start, end)
+    if not len(records):
+        return 0
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    times = recording.recv_time[records]
+    ports = recording.ports[records] + port_offset
+    t0 = times[0]
+    wall0 = time.perf_counter()
+    for k, i in enumerate(records):
+        if speed > 0:
+            delay = (times[k] - t0) / speed - (time.perf_counter() - wall0)
+            if delay > 0:
+                time.sleep(delay)
+        sock.sendto(recording.datagram(i), (host, int(ports[k])))
+    sock.close()
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record and replay camera telemetry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("path")
+    rec.add_argument("--host", default="0.0.0.0")
+    rec.add_argument("--ports", type=int, nargs="+", default=DEFAULT_PORTS)
+    info = sub.add_parser("info")
+    info.add_argument("path")
+    rep = sub.add_parser("replay")
+    rep.add_argument("path")
+    rep.add_argument("--host", default="127.0.0.1")
+    rep.add_argument("--speed", type=float, default=1.0, help="1 = original speed, 0 = as fast as possible")
+    rep.add_argument("--start", type=float, default=None, help="seconds from the start of the recording")
+    rep.add_argument("--end", type=float, default=None)
+    rep.add_argument("--port-offset", type=int, default=0, help="added to the recorded ports")
+    rep.add_argument("--loop", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        from receiver import TelemetryReceiver
+        receiver = TelemetryReceiver([p for p in args.ports if p not in RAW_PORTS], args.host,
+                                     tap_ports=[p for p in args.ports if p in RAW_PORTS])
+        recorder = receiver.add_tap(Recorder(args.path))
+        print(f"Recording {', '.join(str(p) for p in args.ports)} to {args.path}, Ctrl+C to stop")
+        try:
+            receiver.run()
+        finally:
+            recorder.close()
+            print(f"Recorded {recorder.count} datagrams")
+    elif args.command == "info":
+        recording = Recording(args.path)
+        print(f"{args.path}: {len(recording)} datagrams, {recording.duration:.1f} s, "
+              f"{os.path.getsize(args.path) / 1e6:.1f} MB")
+        for port in np.unique(recording.ports):
+            n = int((recording.ports == port).sum())
+            print(f"  port {port}: {n} datagrams ({n / max(recording.duration, 1e-9):.1f} Hz)")
+    else:
+        recording = Recording(args.path)
+        while True:
+            t = time.perf_counter()
+            n = replay(recording, args.host, args.speed, args.start, args.end, args.port_offset)
+            print(f"Replayed {n} datagrams in {time.perf_counter() - t:.2f} s")
+            if not args.loop:
+                break
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# Runs device_loop.py on a Linux host against a fake node.io, no camera needed.
+# Detections and IMU batches are pushed at the camera rates and every datagram the loop
+# sends is captured, so detection-to-send latency and loop CPU time can be measured.
+#
+#   python script_harness.py --seconds 10 --config claw
+#   python script_harness.py --raw-imu --hz-imu 50 --imu-batch 10   # 500 Hz raw samples
+#   python script_harness.py --all-detections --objects 20          # DETECTIONS datagrams
+import argparse
+import datetime
+import queue
+import threading
+import time
+
+import device_loop
+import telemetry
+
+
+class HarnessStopped(Exception):
+    pass
+
+
+class FakeInput:
+    # Stand-in for node.io[...] inside the Script node: blocking get() and non-blocking tryGet(),
+    # both raise HarnessStopped once the session is closed and the queue is empty
+    def __init__(self, size=8):
+        self.queue = queue.Queue(maxsize=size)
+        self.closed = False
+
+    def send(self, msg):
+        # Non-blocking input with a small queue, the oldest message is dropped when full
+        while True:
+            try:
+                self.queue.put_nowait(msg)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self):
+        while True:
+            try:
+                return self.queue.get(timeout=0.05)
+            except queue.Empty:
+                if self.closed:
+                    raise HarnessStopped()
+
+    def tryGet(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            if self.closed:
+                raise HarnessStopped()
+            return None
+
+
+class FakeNode:
+    def __init__(self):
+        self.io = {device_loop.SCRIPT_INPUT: FakeInput(3)}  # detection_queue + imu_queue
+
+    def close(self):
+        for io in self.io.values():
+            io.closed = True
+
+
+class Coordinates:
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+
+class Detection:
+    def __init__(self, label, x, y, z, confidence=0.9):
+        self.label = label
+        self.confidence = confidence
+        self.spatialCoordinates = Coordinates(x, y, z)
+
+
+class ImgDetections:
+    def __init__(self, detections):
+        self.detections = detections
+
+
+class RotationVector:
+    def __init__(self, i, j, k, real):
+        self.i, self.j, self.k, self.real = i, j, k, real
+
+
+class IMUReport:
+    def __init__(self, x, y, z, sequence, t):
+        self.x, self.y, self.z, self.sequence = x, y, z, sequence
+        self.timestamp = datetime.timedelta(seconds=t)
+
+    def getTimestampDevice(self):
+        return self.timestamp
+
+
+class IMUPacket:
+    def __init__(self, rotation, accel=None, gyro=None):
+        self.rotationVector = rotation
+        self.acceleroMeter = accel
+        self.gyroscope = gyro
+
+
+class IMUData:
+    def __init__(self, packets):
+        self.packets = packets
+
+
+class CaptureSocket:
+    # Records (host time, payload) for every sendto() instead of touching the network
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append((time.perf_counter(), bytes(data)))
+
+    def close(self):
+        pass
+
+
+def imu_batch(t, count, period, seq):
+    # count packets ending at t, with raw samples when seq is not None
+    rotation = RotationVector(0.0, 0.0, t % 1.0, 1.0)
+    if seq is None:
+        return IMUData([IMUPacket(rotation)])
+    packets = []
+    for i in range(count):
+        ts = 1.0 + t - (count - 1 - i) * period  # device clock, never negative
+        packets.append(IMUPacket(rotation, IMUReport(0.0, 0.0, 9.81, seq + i, ts),
+                                 IMUReport(0.01, 0.0, 0.0, seq + i, ts)))
+    return IMUData(packets)
+
+
+def run_session(config, seconds=5.0, hz_imu=100.0, hz_det=15.0, imu_batch_size=1, objects=1):
+    node = FakeNode()
+    sock = CaptureSocket()
+    # marker -> time the detection was handed to the Script node
+    pushed = {}
+    label = config['label_map'].index(config['slots'][0][0])
+
+    cpu = {}
+
+    def loop():
+        start = time.thread_time()
+        try:
+            device_loop.run(node, device_loop.host_config(config), udp_socket=sock)
+        except HarnessStopped:
+            pass
+        cpu['loop'] = time.thread_time() - start
+
+    worker = threading.Thread(target=loop)
+    worker.start()
+
+    start = time.perf_counter()
+    next_imu = next_det = start
+    marker = 1
+    imu_seq = 0
+    while time.perf_counter() - start < seconds:
+        now = time.perf_counter()
+        if now >= next_imu:
+            t = now - start
+            if config.get('raw_imu'):
+                node.io[device_loop.SCRIPT_INPUT].send(imu_batch(t, imu_batch_size, 1.0 / (hz_imu * imu_batch_size), imu_seq))
+                imu_seq += imu_batch_size
+            else:
+                node.io[device_loop.SCRIPT_INPUT].send(imu_batch(t, 1, 0.0, None))
+            next_imu += 1.0 / hz_imu
+        if now >= next_det:
+            # The x coordinate carries a unique marker so the send can be matched back to it
+            pushed[marker] = time.perf_counter()
+            # Extra objects of the same label come first, the marked one is the last (it wins the slot)
+            extra = [Detection(label, 2000 + 100 * i, 0, 1000) for i in range(objects - 1)]
+            node.io[device_loop.SCRIPT_INPUT].send(ImgDetections(extra + [Detection(label, marker, 0, 1000)]))
+            marker = marker % 30000 + 1
+            next_det += 1.0 / hz_det
+        time.sleep(max(0.0, min(next_imu, next_det) - time.perf_counter()))
+    node.close()
+    worker.join()
+
+    latencies = []
+    seen = set()
+    imu_samples = imu_datagrams = 0
+    det_objects = det_datagrams = 0
+    for t_sent, data in sock.sent:
+        if data[1] == telemetry.KIND_IMU_RAW:
+            imu_datagrams += 1
+            imu_samples += len(telemetry.decode_imu(data).samples)
+            continue
+        if data[1] == telemetry.KIND_DETECTIONS:
+            det_datagrams += 1
+            det_objects += len(telemetry.decode_detections(data).detections)
+            continue
+        x = telemetry.decode(data).pos_a[0]
+        if x in pushed and x not in seen:
+            seen.add(x)
+            latencies.append(t_sent - pushed[x])
+    sent = len(sock.sent) - imu_datagrams - det_datagrams
+    return {
+        'sent': sent,
+        'rate': sent / seconds,
+        'imu_datagrams': imu_datagrams,
+        'imu_samples': imu_samples,
+        'det_datagrams': det_datagrams,
+        'det_objects': det_objects,
+        'detections': len(pushed),
+        'matched': len(latencies),
+        'latencies': sorted(latencies),
+        'cpu': cpu.get('loop', 0.0),
+        'seconds': seconds,
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def print_report(result):
+    lat = result['latencies']
+    print(f"Sent {result['sent']} packets ({result['rate']:.1f} Hz), "
+          f"matched {result['matched']}/{result['detections']} detections")
+    if result['imu_datagrams']:
+        print(f"Raw IMU: {result['imu_datagrams']} datagrams, {result['imu_samples']} samples "
+              f"({result['imu_samples'] / result['seconds']:.0f} Hz)")
+    if result['det_datagrams']:
+        print(f"All detections: {result['det_datagrams']} datagrams, "
+              f"{result['det_objects'] / result['det_datagrams']:.1f} objects each")
+    print(f"Detection-to-send latency [ms]: p50={percentile(lat, 50) * 1e3:.2f} "
+          f"p90={percentile(lat, 90) * 1e3:.2f} p99={percentile(lat, 99) * 1e3:.2f} "
+          f"max={(lat[-1] if lat else float('nan')) * 1e3:.2f}")
+    print(f"Loop CPU: {result['cpu']:.3f} s over {result['seconds']:.1f} s "
+          f"({100 * result['cpu'] / result['seconds']:.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile device_loop.py against a fake node.io")
+    parser.add_argument("--config", choices=["claw", "payload"], default="claw")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--hz-imu", type=float, default=100.0)
+    parser.add_argument("--hz-det", type=float, default=15.0)
+    parser.add_argument("--raw-imu", action="store_true", help="also forward raw accelerometer/gyroscope samples")
+    parser.add_argument("--imu-batch", type=int, default=1, help="packets per IMU batch with --raw-imu")
+    parser.add_argument("--all-detections", action="store_true", help="also send every detection of a frame")
+    parser.add_argument("--objects", type=int, default=1, help="detections of the first slot label per frame")
+    args = parser.parse_args()
+
+    config = device_loop.CLAW_CONFIG if args.config == "claw" else device_loop.PAYLOAD_CONFIG
+    config = dict(config, raw_imu=args.raw_imu, all_detections=args.all_detections)
+    print_report(run_session(config, args.seconds, args.hz_imu, args.hz_det, args.imu_batch, args.objects))
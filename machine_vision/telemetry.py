@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# Binary telemetry codec shared by the camera senders (device_loop.py) and the host tools.
+#
+# Packet = 16 byte header + 29 byte state, little-endian without padding (45 bytes):
+#   header: version (B), kind (B), camera id (B), flags (B), sequence (I), device time in us (Q)
+#   state:  2 positions x/y/z in mm (6h), hooked bits (B), imu quaternion i/j/k/real (4f)
+# What the two positions are depends on kind (ball & claw top, or payload & zone).
+#
+# The old unversioned packets (29 bytes from main.py, 28 bytes from base_cam.py) are still
+# decoded so cameras flashed with the previous script keep working.
+#
+# fusion.py publishes a FUSED packet (same header, kind KIND_FUSED) for the controller:
+#   fused: payload x/y/z and zone x/y/z in mm in the common frame (6f, NaN = unknown),
+#          bit mask of the cameras used for payload and zone (2B)
+#
+# With raw_imu the cameras also send every accelerometer/gyroscope sample, one IMU_RAW datagram
+# per IMU batch on IMU_PORTS (variable length, kind KIND_IMU_RAW):
+#   header (device time in us of the first sample) | device rotation vector of the last packet (4f)
+#   | sample count (H) | per sample: accel and gyro time relative to the header in us (2i),
+#   accel x/y/z in m/s^2 (3f), gyro x/y/z in rad/s (3f), accel and gyro sequence numbers (2H)
+#
+# zones.py publishes the object/zone relations as one ZONES datagram (variable length, kind
+# KIND_ZONES): header | object count N (B) | zone count M (B) | contained and overlap bits, N x M
+# row-major each (packed, ceil(N * M / 8) bytes) | nearest zone per object (N B, 255 = none) |
+# distance to it per object in mm (N H, 65535 = none or farther)
+#
+# With all_detections the cameras also send every detection of each frame, one DETECTIONS datagram
+# per frame on DETECTIONS_PORTS (variable length, kind KIND_DETECTIONS, flags like the state
+# packet): header | detection count (B) | per detection: label index (B), confidence in % (B),
+# x/y/z in mm (3h). tracker.py turns them into TRACKS datagrams (kind KIND_TRACKS, camera id of
+# the camera tracked): header | track count (B) | per track: id (H), label index (B), status (B,
+# TRACK_*), position x/y/z in mm (3h), velocity x/y/z in mm/s (3h), frames since the last
+# detection (B)
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+VERSION = 1
+
+KIND_CLAW = 1  # main.py: ball, claw top, hooked
+KIND_PAYLOAD = 2  # base_cam.py: payload, zone
+KIND_FUSED = 3  # fusion.py: payload, zone from all cameras
+KIND_IMU_RAW = 4  # device_loop.py with raw_imu: every accelerometer/gyroscope sample
+KIND_ZONES = 5  # zones.py: object/zone containment, overlap and distance
+KIND_DETECTIONS = 6  # device_loop.py with all_detections: every detection of a frame
+KIND_TRACKS = 7  # tracker.py: tracked objects with persistent ids
+
+CAMERA_BASE = 0
+CAMERA_TOP = 1
+CAMERA_PORTS = {5007: CAMERA_BASE, 5008: CAMERA_TOP}
+IMU_PORT_OFFSET = 10  # raw IMU of a camera goes to its telemetry port + 10
+IMU_PORTS = {port + IMU_PORT_OFFSET: camera for port, camera in CAMERA_PORTS.items()}
+DETECTIONS_PORT_OFFSET = 20  # all detections of a camera go to its telemetry port + 20
+DETECTIONS_PORTS = {port + DETECTIONS_PORT_OFFSET: camera for port, camera in CAMERA_PORTS.items()}
+
+SLOT_NAMES = {
+    KIND_CLAW: ("ball", "claw"),
+    KIND_PAYLOAD: ("payload", "zone"),
+}
+
+NOT_DETECTED = 32767
+
+# Header flag bits
+FLAG_RAW_CAMERA = 1  # positions are DepthAI spatial coordinates as measured, without the y flip
+                     # and z offsets of device_loop.py (frames.py applies them on the host)
+DETECTION_FRAME_SHIFT = 4  # bits 4-7: detection frames the sender processed, mod 16. Changes with every
+                           # detector frame, so a new detection can be told from a repeat of the
+                           # same position (estimator.py); always 0 from senders before it
+
+# Track status
+TRACK_TENTATIVE = 0  # seen in fewer than min_hits frames
+TRACK_CONFIRMED = 1  # detected in the last frame
+TRACK_COASTING = 2  # confirmed, missed in the last frame(s), position is predicted
+
+HEADER_FORMAT = "<BBBBIQ"
+POSITION_FORMAT = "<hhhhhhB"
+ROTATION_FORMAT = "<ffff"
+
+HEADER = struct.Struct(HEADER_FORMAT)
+POSITIONS = struct.Struct(POSITION_FORMAT)
+ROTATION = struct.Struct(ROTATION_FORMAT)
+PACKET = struct.Struct("<BBBBIQhhhhhhBffff")
+PACKET_SIZE = PACKET.size
+
+FUSED = struct.Struct("<BBBBIQffffffBB")
+FUSED_SIZE = FUSED.size
+
+IMU_HEADER_FORMAT = "<BBBBIQffffH"
+IMU_SAMPLE_FORMAT = "<iiffffffHH"
+IMU_HEADER = struct.Struct(IMU_HEADER_FORMAT)
+IMU_SAMPLE = struct.Struct(IMU_SAMPLE_FORMAT)
+IMU_MAX_SAMPLES = 32  # 34 + 32 * 36 bytes fits any MTU
+
+ZONES_HEADER = struct.Struct("<BBBBIQBB")
+ZONES_MAX = 64  # objects and zones, 18 + 2 * 512 + 64 * 3 bytes at most
+NO_ZONE = 255
+FAR = 65535
+
+DETECTIONS_HEADER_FORMAT = "<BBBBIQB"
+DETECTION_FORMAT = "<BBhhh"
+DETECTIONS_HEADER = struct.Struct(DETECTIONS_HEADER_FORMAT)
+DETECTION = struct.Struct(DETECTION_FORMAT)
+DETECTIONS_MAX = 64  # 17 + 64 * 8 bytes
+
+TRACKS_HEADER = DETECTIONS_HEADER
+TRACKS_MAX = 64  # 17 + 64 * 17 bytes
+
+LEGACY_CLAW = struct.Struct("<hhhhhhBffff")  # 29 bytes
+LEGACY_PAYLOAD = struct.Struct("<hhhhhhffff")  # 28 bytes
+
+# Same layout as PACKET, used to decode many packets at once
+PACKET_DTYPE = np.dtype([
+    ('version', '<u1'),
+    ('kind', '<u1'),
+    ('camera_id', '<u1'),
+    ('flags', '<u1'),
+    ('seq', '<u4'),
+    ('timestamp_us', '<u8'),
+    ('pos', '<i2', (2, 3)),
+    ('hooked', '<u1'),
+    ('quat', '<f4', (4,)),
+])
+assert PACKET_DTYPE.itemsize == PACKET_SIZE
+
+FUSED_DTYPE = np.dtype([
+    ('version', '<u1'),
+    ('kind', '<u1'),
+    ('camera_id', '<u1'),
+    ('flags', '<u1'),
+    ('seq', '<u4'),
+    ('timestamp_us', '<u8'),
+    ('pos', '<f4', (2, 3)),
+    ('sources', '<u1', (2,)),
+])
+assert FUSED_DTYPE.itemsize == FUSED_SIZE
+
+IMU_SAMPLE_DTYPE = np.dtype([
+    ('accel_dt_us', '<i4'),
+    ('gyro_dt_us', '<i4'),
+    ('accel', '<f4', (3,)),
+    ('gyro', '<f4', (3,)),
+    ('accel_seq', '<u2'),
+    ('gyro_seq', '<u2'),
+])
+assert IMU_SAMPLE_DTYPE.itemsize == IMU_SAMPLE.size
+
+DETECTION_DTYPE = np.dtype([
+    ('label', '<u1'),
+    ('confidence', '<u1'),
+    ('pos', '<i2', (3,)),
+])
+assert DETECTION_DTYPE.itemsize == DETECTION.size
+
+TRACK_DTYPE = np.dtype([
+    ('id', '<u2'),
+    ('label', '<u1'),
+    ('status', '<u1'),
+    ('pos', '<i2', (3,)),
+    ('vel', '<i2', (3,)),
+    ('misses', '<u1'),
+])
+
+# Layout handed to the Script node, which cannot import this module
+DEVICE_LAYOUT = {
+    'version': VERSION,
+    'header_format': HEADER_FORMAT,
+    'position_format': POSITION_FORMAT,
+    'rotation_format': ROTATION_FORMAT,
+    'flag_raw_camera': FLAG_RAW_CAMERA,
+    'detection_frame_shift': DETECTION_FRAME_SHIFT,
+    'imu_kind': KIND_IMU_RAW,
+    'imu_header_format': IMU_HEADER_FORMAT,
+    'imu_sample_format': IMU_SAMPLE_FORMAT,
+    'imu_max_samples': IMU_MAX_SAMPLES,
+    'detections_kind': KIND_DETECTIONS,
+    'detections_header_format': DETECTIONS_HEADER_FORMAT,
+    'detection_format': DETECTION_FORMAT,
+    'detections_max': DETECTIONS_MAX,
+}
+
+Telemetry = namedtuple("Telemetry", [
+    "version", "kind", "camera_id", "flags", "seq", "timestamp_us",
+    "pos_a", "pos_b", "hooked", "quat",
+])
+Fused = namedtuple("Fused", ["seq", "timestamp_us", "payload", "zone", "sources"])
+ImuBatch = namedtuple("ImuBatch", ["camera_id", "seq", "timestamp_us", "quat", "samples"])
+Detections = namedtuple("Detections", ["camera_id", "flags", "seq", "timestamp_us", "detections"])
+Tracks = namedtuple("Tracks", ["camera_id", "seq", "timestamp_us", "tracks"])
+ZoneState = namedtuple("ZoneState", ["seq", "timestamp_us", "contained", "overlap", "nearest", "distance"])
+
+
+class Encoder:
+    # Packs into one preallocated buffer, the returned memoryview is only valid until the next pack
+    def __init__(self, kind, camera_id):
+        self.kind = kind
+        self.camera_id = camera_id
+        self.seq = 0
+        self.buffer = bytearray(PACKET_SIZE)
+        self.view = memoryview(self.buffer)
+
+    def pack(self, pos_a, pos_b, hooked, quat, timestamp_us, flags=0):
+        PACKET.pack_into(self.buffer, 0, VERSION, self.kind, self.camera_id, flags,
+                         self.seq, timestamp_us, *pos_a, *pos_b, hooked, *quat)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return self.view
+
+
+class FusedEncoder:
+    def __init__(self, camera_id=255):
+        self.camera_id = camera_id
+        self.seq = 0
+        self.buffer = bytearray(FUSED_SIZE)
+        self.view = memoryview(self.buffer)
+
+    def pack(self, payload, zone, sources, timestamp_us, flags=0):
+        FUSED.pack_into(self.buffer, 0, VERSION, KIND_FUSED, self.camera_id, flags,
+                        self.seq, timestamp_us, *payload, *zone, *sources)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return self.view
+
+
+def decode_fused(data, offset=0):
+    v = FUSED.unpack_from(data, offset)
+    if v[0] != VERSION or v[1] != KIND_FUSED:
+        raise ValueError(f"Not a fused packet (version {v[0]}, kind {v[1]})")
+    return Fused(v[4], v[5], v[6:9], v[9:12], v[12:14])
+
+
+def decode_imu(data):
+    # One IMU_RAW datagram -> ImuBatch, samples is an IMU_SAMPLE_DTYPE view into data
+    v = IMU_HEADER.unpack_from(data, 0)
+    if v[0] != VERSION or v[1] != KIND_IMU_RAW:
+        raise ValueError(f"Not a raw IMU packet (version {v[0]}, kind {v[1]})")
+    count = v[10]
+    if len(data) < IMU_HEADER.size + count * IMU_SAMPLE.size:
+        raise ValueError(f"Raw IMU packet of {len(data)} bytes is too short for {count} samples")
+    samples = np.frombuffer(data, dtype=IMU_SAMPLE_DTYPE, count=count, offset=IMU_HEADER.size)
+    return ImuBatch(v[2], v[4], v[5], v[6:10], samples)
+
+
+class ZonesEncoder:
+    # Packs into one preallocated buffer, the returned memoryview is only valid until the next pack
+    def __init__(self, camera_id=255):
+        self.camera_id = camera_id
+        self.seq = 0
+        self.buffer = bytearray(ZONES_HEADER.size + 2 * (ZONES_MAX * ZONES_MAX // 8) + 3 * ZONES_MAX)
+        self.view = memoryview(self.buffer)
+        self.array = np.frombuffer(self.buffer, dtype=np.uint8)
+
+    def pack(self, contained, overlap, nearest, distance, timestamp_us, flags=0):
+        # contained/overlap (N, M) bool, nearest (N,) zone index or -1, distance (N,) mm (inf = far)
+        n, m = contained.shape
+        if n > ZONES_MAX or m > ZONES_MAX:
+            raise ValueError(f"At most {ZONES_MAX} objects and zones, got {n} and {m}")
+        ZONES_HEADER.pack_into(self.buffer, 0, VERSION, KIND_ZONES, self.camera_id, flags,
+                               self.seq, timestamp_us, n, m)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        offset = ZONES_HEADER.size
+        bits = (n * m + 7) // 8
+        for matrix in (contained, overlap):
+            self.array[offset:offset + bits] = np.packbits(matrix, axis=None)
+            offset += bits
+        self.array[offset:offset + n] = np.where(nearest < 0, NO_ZONE, nearest)
+        offset += n
+        far = ~(distance < FAR)  # also NaN
+        np.frombuffer(self.buffer, dtype='<u2', count=n, offset=offset)[:] = np.where(far, FAR, np.nan_to_num(distance))
+        return self.view[:offset + 2 * n]
+
+
+def decode_zones(data):
+    # One ZONES datagram -> ZoneState with numpy arrays (nearest -1 and distance inf for none)
+    v = ZONES_HEADER.unpack_from(data, 0)
+    if v[0] != VERSION or v[1] != KIND_ZONES:
+        raise ValueError(f"Not a zones packet (version {v[0]}, kind {v[1]})")
+    n, m = v[6], v[7]
+    bits = (n * m + 7) // 8
+    offset = ZONES_HEADER.size
+    if len(data) < offset + 2 * bits + 3 * n:
+        raise ValueError(f"Zones packet of {len(data)} bytes is too short for {n} x {m}")
+    raw = np.frombuffer(data, dtype=np.uint8)
+    contained = np.unpackbits(raw[offset:offset + bits], count=n * m).reshape(n, m).astype(bool)
+    overlap = np.unpackbits(raw[offset + bits:offset + 2 * bits], count=n * m).reshape(n, m).astype(bool)
+    offset += 2 * bits
+    nearest = raw[offset:offset + n].astype(np.int64)
+    nearest[nearest == NO_ZONE] = -1
+    distance = np.frombuffer(data, dtype='<u2', count=n, offset=offset + n).astype(np.float64)
+    distance[distance == FAR] = np.inf
+    return ZoneState(v[4], v[5], contained, overlap, nearest, distance)
+
+
+def decode_detections(data):
+    # One DETECTIONS datagram -> Detections, detections is a DETECTION_DTYPE view into data
+    v = DETECTIONS_HEADER.unpack_from(data, 0)
+    if v[0] != VERSION or v[1] != KIND_DETECTIONS:
+        raise ValueError(f"Not a detections packet (version {v[0]}, kind {v[1]})")
+    count = v[6]
+    if len(data) < DETECTIONS_HEADER.size + count * DETECTION.size:
+        raise ValueError(f"Detections packet of {len(data)} bytes is too short for {count} detections")
+    detections = np.frombuffer(data, dtype=DETECTION_DTYPE, count=count, offset=DETECTIONS_HEADER.size)
+    return Detections(v[2], v[3], v[4], v[5], detections)
+
+
+class TracksEncoder:
+    # Packs into one preallocated buffer, the returned memoryview is only valid until the next pack
+    def __init__(self, camera_id=255):
+        self.camera_id = camera_id
+        self.seq = 0
+        self.buffer = bytearray(TRACKS_HEADER.size + TRACKS_MAX * TRACK_DTYPE.itemsize)
+        self.view = memoryview(self.buffer)
+        self.tracks = np.frombuffer(self.buffer, dtype=TRACK_DTYPE, count=TRACKS_MAX, offset=TRACKS_HEADER.size)
+
+    def pack(self, ids, labels, status, positions, velocities, misses, timestamp_us, flags=0):
+        # One row per track, positions in mm and velocities in mm/s (float, clipped to int16)
+        n = len(ids)
+        if n > TRACKS_MAX:
+            raise ValueError(f"At most {TRACKS_MAX} tracks, got {n}")
+        TRACKS_HEADER.pack_into(self.buffer, 0, VERSION, KIND_TRACKS, self.camera_id, flags,
+                                self.seq, timestamp_us, n)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        tracks = self.tracks[:n]
+        tracks['id'] = ids
+        tracks['label'] = labels
+        tracks['status'] = status
+        tracks['pos'] = np.clip(np.rint(positions), -32768, 32767)
+        tracks['vel'] = np.clip(np.rint(velocities), -32768, 32767)
+        tracks['misses'] = np.minimum(misses, 255)
+        return self.view[:TRACKS_HEADER.size + n * TRACK_DTYPE.itemsize]
+
+
+def decode_tracks(data):
+    # One TRACKS datagram -> Tracks, tracks is a TRACK_DTYPE view into data
+    v = TRACKS_HEADER.unpack_from(data, 0)
+    if v[0] != VERSION or v[1] != KIND_TRACKS:
+        raise ValueError(f"Not a tracks packet (version {v[0]}, kind {v[1]})")
+    count = v[6]
+    if len(data) < TRACKS_HEADER.size + count * TRACK_DTYPE.itemsize:
+        raise ValueError(f"Tracks packet of {len(data)} bytes is too short for {count} tracks")
+    tracks = np.frombuffer(data, dtype=TRACK_DTYPE, count=count, offset=TRACKS_HEADER.size)
+    return Tracks(v[2], v[4], v[5], tracks)
+
+
+def decode(data, offset=0):
+    # Decode one datagram, raises ValueError for lengths/versions that are not understood
+    size = len(data) - offset
+    if size == PACKET_SIZE:
+        v = PACKET.unpack_from(data, offset)
+        if v[0] != VERSION:
+            raise ValueError(f"Unsupported telemetry version {v[0]}")
+        return Telemetry(v[0], v[1], v[2], v[3], v[4], v[5], v[6:9], v[9:12], v[12], v[13:17])
+    if size == LEGACY_CLAW.size:
+        v = LEGACY_CLAW.unpack_from(data, offset)
+        return Telemetry(0, KIND_CLAW, None, 0, None, None, v[0:3], v[3:6], v[6], v[7:11])
+    if size == LEGACY_PAYLOAD.size:
+        v = LEGACY_PAYLOAD.unpack_from(data, offset)
+        return Telemetry(0, KIND_PAYLOAD, None, 0, None, None, v[0:3], v[3:6], 0, v[6:10])
+    raise ValueError(f"Unexpected telemetry length {size} bytes")
+
+
+def upgrade_legacy(data, buffer, offset, camera_id=255):
+    # Packs a legacy datagram as a PACKET into buffer at offset: version 0, the camera id given (the
+    # old packets carry none), sequence number and device time 0. Raises ValueError like decode().
+    t = decode(data)
+    if t.version != 0:
+        raise ValueError("Not a legacy packet")
+    PACKET.pack_into(buffer, offset, 0, t.kind, camera_id, 0, 0, 0, *t.pos_a, *t.pos_b, t.hooked, *t.quat)
+
+
+def decode_many(data):
+    # Vectorized decode of back-to-back PACKET_SIZE packets (bytes, memoryview, mmap or a list
+    # of datagrams). Returns a structured array; packets of another length/version are dropped.
+    if isinstance(data, (list, tuple)):
+        data = b"".join(d for d in data if len(d) == PACKET_SIZE)
+    count = len(data) // PACKET_SIZE
+    packets = np.frombuffer(data, dtype=PACKET_DTYPE, count=count)
+    if count and not (packets['version'] == VERSION).all():
+        packets = packets[packets['version'] == VERSION]
+    return packets
+
+
+def detection_frame(flags):
+    # Detection frame counter (0-15) of the header flags, works on ints and arrays
+    return (flags >> DETECTION_FRAME_SHIFT) & 0xF
+
+
+def detected(pos):
+    # Mask of positions that hold a detection, works on tuples and on decode_many()['pos']
+    return np.asarray(pos)[..., 0] != NOT_DETECTED
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# Shared memory ring buffer of decoded camera telemetry.
+#
+# The receiver process owns a RingWriter and adds it as a consumer, any number of local processes
+# open a RingReader with the same name and read the latest samples straight out of shared memory.
+#
+# Layout: 64 byte control block (magic, capacity, write index, begin index, writer PID) followed by
+# 2 * capacity samples. Every sample is written twice (slot i and i + capacity), so the newest
+# n <= capacity samples are always one contiguous slice and can be returned as a view without
+# copying. There is a single writer and no lock, a seqlock instead: the writer first announces the
+# index it is about to write up to (begin index), fills the slots and publishes the write index
+# after. Readers check afterwards against the begin index that the slots they used were not
+# overwritten, or are not being overwritten right now (RingReader.valid).
+#
+# A second writer with the same name fails while the first one's process is alive, a segment left
+# over by a writer that died is replaced.
+#
+#   python telemetry_ring.py              # print the newest sample of each camera once per second
+import argparse
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import telemetry
+
+DEFAULT_NAME = "motionlab_telemetry"
+DEFAULT_CAPACITY = 1 << 16  # ~5 min of both cameras at 200 Hz
+MAGIC = 0x4D4C5452  # "MLTR"
+CONTROL_SIZE = 64
+
+SAMPLE_DTYPE = np.dtype([
+    ('recv_time', '<f8'),  # host time.time()
+    ('device_time_us', '<u8'),
+    ('seq', '<u4'),
+    ('camera_id', '<u1'),
+    ('kind', '<u1'),
+    ('hooked', '<u1'),
+    ('ball', '<i2', (3,)),
+    ('claw', '<i2', (3,)),
+    ('payload', '<i2', (3,)),
+    ('zone', '<i2', (3,)),
+    ('quat', '<f4', (4,)),
+], align=True)
+
+# (kind, first position, second position)
+_SLOT_FIELDS = [(telemetry.KIND_CLAW, 'ball', 'claw'), (telemetry.KIND_PAYLOAD, 'payload', 'zone')]
+
+
+def _attach(name):
+    # Readers must not unlink the segment when they exit (Python < 3.13 resource tracker does that)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if sys.platform != "win32":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _alive(pid):
+    if sys.platform == "win32":
+        return True  # the segment only outlives its last handle on POSIX
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _views(shm):
+    control = np.ndarray((5,), dtype='<i8', buffer=shm.buf)  # magic, capacity, write, begin, PID
+    capacity = int(control[1])
+    data = np.ndarray((2 * capacity,), dtype=SAMPLE_DTYPE, buffer=shm.buf, offset=CONTROL_SIZE)
+    return control, capacity, data
+
+
+class RingWriter:
+    def __init__(self, name=DEFAULT_NAME, capacity=DEFAULT_CAPACITY):
+        size = CONTROL_SIZE + 2 * capacity * SAMPLE_DTYPE.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            old = _attach(name)
+            control = np.ndarray((5,), dtype='<i8', buffer=old.buf) if old.size >= CONTROL_SIZE else None
+            owner = int(control[4]) if control is not None and int(control[0]) == MAGIC else 0
+            del control
+            if owner and _alive(owner):
+                old.close()
+                raise RuntimeError(f"Shared memory '{name}' is in use by the writer in process {owner}, "
+                                   f"use another name (listener.py --shm NAME)")
+            # Left over from a receiver that did not shut down cleanly
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        control = np.ndarray((5,), dtype='<i8', buffer=self.shm.buf)
+        control[:] = (MAGIC, capacity, 0, 0, os.getpid())
+        self.control, self.capacity, self.data = _views(self.shm)
+        self.scratch = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+
+    @property
+    def index(self):
+        return int(self.control[2])
+
+    def write(self, samples):
+        # Append SAMPLE_DTYPE samples, only the newest capacity samples are kept
+        total = len(samples)
+        if total == 0:
+            return
+        cap = self.capacity
+        n = min(total, cap)
+        samples = samples[total - n:]
+        index = int(self.control[2])
+        self.control[3] = index + total  # begin: slots up to this index are being overwritten
+        start = (index + total - n) % cap
+        first = min(n, cap - start)
+        for offset in (start, start + cap):
+            self.data[offset:offset + first] = samples[:first]
+        if first < n:
+            rest = n - first
+            self.data[:rest] = samples[first:]
+            self.data[cap:cap + rest] = samples[first:]
+        self.control[2] = index + total  # publish after the data is in place
+
+    def __call__(self, batch):
+        # Receiver consumer: convert a telemetry batch to samples and append it
+        packets = batch.packets
+        n = len(packets)
+        if n > len(self.scratch):
+            self.scratch = np.zeros(n, dtype=SAMPLE_DTYPE)
+        samples = self.scratch[:n]
+        samples['recv_time'] = batch.recv_time
+        samples['device_time_us'] = packets['timestamp_us']
+        samples['seq'] = packets['seq']
+        samples['camera_id'] = packets['camera_id']
+        samples['kind'] = packets['kind']
+        samples['hooked'] = packets['hooked']
+        samples['quat'] = packets['quat']
+        for kind, first, second in _SLOT_FIELDS:
+            mine = (packets['kind'] == kind)[:, None]
+            samples[first] = np.where(mine, packets['pos'][:, 0], telemetry.NOT_DETECTED)
+            samples[second] = np.where(mine, packets['pos'][:, 1], telemetry.NOT_DETECTED)
+        self.write(samples)
+
+    def close(self):
+        del self.control, self.data
+        self.shm.close()
+        self.shm.unlink()
+
+
+class RingReader:
+    def __init__(self, name=DEFAULT_NAME):
+        self.shm = _attach(name)
+        self.control, self.capacity, self.data = _views(self.shm)
+        if int(self.control[0]) != MAGIC:
+            raise ValueError(f"Shared memory '{name}' is not a telemetry ring")
+
+    @property
+    def index(self):
+        # Total number of samples written since the writer started
+        return int(self.control[2])
+
+    def latest(self, n, copy=False):
+        # Newest n samples (oldest first) and the write index they were taken at. Without copy the
+        # result is a view into shared memory, check valid() after using it.
+        index = self.index
+        n = min(n, index, self.capacity)
+        end = index % self.capacity + self.capacity
+        samples = self.data[end - n:end]
+        return (samples.copy() if copy else samples), index
+
+    def since(self, index, copy=True):
+        # Samples written after a previous write index, for readers that want every sample
+        current = self.index
+        n = min(current - index, self.capacity)
+        end = current % self.capacity + self.capacity
+        samples = self.data[end - n:end]
+        return (samples.copy() if copy else samples), current
+
+    def valid(self, index, n):
+        # True if the n samples read at write index `index` have not been overwritten since, and
+        # are not being overwritten by a write in progress
+        return int(self.control[3]) - index <= self.capacity - n
+
+    def camera(self, camera_id, n):
+        # Copy of the newest n samples of one camera (fewer if the ring holds fewer), however many
+        # samples of other cameras came after them. Searches back in windows that double in size.
+        window = min(max(4 * n, 64), self.capacity)
+        while True:
+            samples, index = self.latest(window)
+            mine = samples[samples['camera_id'] == camera_id][-n:]
+            if self.valid(index, len(samples)) and (len(mine) == n or len(samples) < window
+                                                   or window == self.capacity):
+                return mine, index
+            if self.valid(index, len(samples)):
+                window = min(window * 2, self.capacity)
+
+    def close(self):
+        del self.control, self.data
+        self.shm.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the newest telemetry samples from shared memory")
+    parser.add_argument("--name", default=DEFAULT_NAME)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    reader = RingReader(args.name)
+    last_index = reader.index
+    while True:
+        time.sleep(args.interval)
+        samples, index = reader.since(last_index)
+        print(f"{index - last_index} new samples")
+        for camera_id in np.unique(samples['camera_id']):
+            s = samples[samples['camera_id'] == camera_id][-1]
+            print(f"  cam {camera_id} seq {s['seq']}: ball={s['ball']} claw={s['claw']} "
+                  f"payload={s['payload']} zone={s['zone']} hooked={s['hooked']} quat={s['quat']}")
+        last_index = index
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# Live latency, jitter, loss and detection staleness statistics for the telemetry receiver.
+#
+# TelemetryStats is a receiver consumer that keeps one SourceStats per port. All distributions are
+# fixed size log-spaced histograms, so memory does not grow with the session length.
+#   - inter-arrival: time between packets on the host, jitter: |inter-arrival - period|. The
+#     cameras send at the IMU rate plus one packet per new detection frame, so the period is the
+#     median inter-arrival of the last PERIOD_WINDOW packets of the port unless nominal_hz is given
+#   - gaps/reordering: from the sequence numbers in the packet header
+#   - staleness: how long a position stayed unchanged while packets kept arriving. With the
+#     detector at 15 FPS this sits around 67 ms, values well above that mean the detector (not
+#     the UDP loop) is what limits the controller.
+import numpy as np
+
+import telemetry
+
+SEQ_MOD = 1 << 32
+RESTART_WINDOW = 64  # packets; further back than this is a restarted sender, not a late packet
+PERIOD_WINDOW = 256  # inter-arrivals the median period is taken over
+
+
+class Histogram:
+    # Log-spaced histogram of durations in seconds, values outside [low, high] go to the end bins
+    def __init__(self, low=1e-5, high=10.0, bins=64):
+        self.edges = np.geomspace(low, high, bins + 1)
+        self.counts = np.zeros(bins + 2, dtype=np.int64)  # + underflow and overflow
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side="right"),
+                                   minlength=len(self.counts))
+        self.total += values.size
+        self.sum += float(values.sum())
+        self.max = max(self.max, float(values.max()))
+
+    def percentile(self, p):
+        # Upper edge of the bin holding the p-th percentile (bins are ~20% wide with the defaults)
+        if not self.total:
+            return float('nan')
+        i = int(np.searchsorted(np.cumsum(self.counts), max(1.0, p / 100.0 * self.total)))
+        if i == 0:
+            return float(self.edges[0])
+        if i == len(self.counts) - 1:
+            return self.max
+        return min(float(self.edges[i]), self.max)
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else float('nan')
+
+    def snapshot(self):
+        return {
+            'count': self.total,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max if self.total else float('nan'),
+        }
+
+    def reset(self):
+        self.counts[:] = 0
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class SourceStats:
+    def __init__(self, nominal_hz=None):
+        self.period = None if nominal_hz is None else 1.0 / nominal_hz
+        self.recent = np.empty(0)  # last PERIOD_WINDOW inter-arrivals, for the median period
+        self.inter_arrival = Histogram()
+        self.jitter = Histogram()
+        self.gap_size = Histogram(1, 1e6, 40)  # packets lost per gap
+        self.staleness = [Histogram(), Histogram()]  # per position slot
+        self.packets = 0
+        self.lost = 0
+        self.gaps = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.resets = 0
+        self.not_detected = [0, 0]
+        self.last_recv = None
+        self.last_seq = None
+        self.last_unwrapped = None
+        self.highest = None
+        self.last_pos = None
+        self.last_change = [None, None]  # device time (s) of the last position change per slot
+        self.last_time = None
+
+    def update(self, recv_time, packets):
+        n = len(packets)
+        if not n:
+            return
+        self.packets += n
+
+        # Host inter-arrival and jitter against the nominal or the median send period
+        recv_time = np.asarray(recv_time, dtype=np.float64)
+        if self.last_recv is not None:
+            dt = np.diff(recv_time, prepend=self.last_recv)
+        else:
+            dt = np.diff(recv_time)
+        self.inter_arrival.add(dt)
+        if len(dt):
+            period = self.period
+            if period is None:
+                self.recent = np.concatenate((self.recent, dt))[-PERIOD_WINDOW:]
+                period = float(np.median(self.recent))
+            self.jitter.add(np.abs(dt - period))
+        self.last_recv = recv_time[-1]
+
+        # Legacy packets (version 0, converted by the receiver) have no sequence number
+        self.update_sequence(packets['seq'][packets['version'] != 0].astype(np.int64))
+
+        # Staleness: device time between position changes, per slot
+        t = packets['timestamp_us'].astype(np.float64) * 1e-6
+        t = np.where(packets['version'] != 0, t, recv_time)  # legacy packets: host time
+        pos = packets['pos']
+        for slot in range(2):
+            p = pos[:, slot]
+            self.not_detected[slot] += int((p[:, 0] == telemetry.NOT_DETECTED).sum())
+            changed = np.empty(n, dtype=bool)
+            changed[1:] = np.any(p[1:] != p[:-1], axis=1)
+            changed[0] = self.last_pos is None or bool(np.any(p[0] != self.last_pos[slot]))
+            change_times = t[changed]
+            if len(change_times):
+                if self.last_change[slot] is not None:
+                    self.staleness[slot].add(np.diff(change_times, prepend=self.last_change[slot]))
+                else:
+                    self.staleness[slot].add(np.diff(change_times))
+                self.last_change[slot] = change_times[-1]
+        self.last_pos = pos[-1].copy()
+        self.last_time = t[-1]
+
+    def update_sequence(self, seq):
+        # Loss and reordering from the 32 bit sequence number. Sequence numbers are unwrapped and
+        # compared to the highest one seen so far: a jump forward is a gap, a packet at or below it
+        # is a duplicate or a late (reordered) packet that fills a gap counted before. A jump back by
+        # more than RESTART_WINDOW is a sender that restarted (reboot, re-flash): counting restarts
+        # from there, the packets before it are not lost.
+        while len(seq):
+            if self.last_seq is None:
+                self.last_seq = int(seq[0]) - 1
+                self.last_unwrapped = self.highest = self.last_seq
+            step = np.diff(seq, prepend=self.last_seq) % SEQ_MOD
+            step[step > SEQ_MOD // 2] -= SEQ_MOD
+            unwrapped = self.last_unwrapped + np.cumsum(step)
+            highest = np.maximum.accumulate(np.concatenate(([self.highest], unwrapped)))
+            ahead = unwrapped - highest[:-1]
+            restart = np.flatnonzero(ahead < -RESTART_WINDOW)
+            end = int(restart[0]) if len(restart) else len(seq)
+            ahead = ahead[:end]
+            gaps = ahead[ahead > 1] - 1
+            late = int((ahead < 0).sum())
+            self.gaps += len(gaps)
+            self.lost += int(gaps.sum()) - late
+            self.gap_size.add(gaps)
+            self.duplicates += int((ahead == 0).sum())
+            self.reordered += late
+            if end < len(seq):
+                self.resets += 1
+                self.last_seq = None
+            else:
+                self.last_seq = int(seq[-1])
+                self.last_unwrapped = int(unwrapped[-1])
+                self.highest = int(highest[-1])
+            seq = seq[end:]
+
+    def current_staleness(self, slot):
+        # Seconds (device time) since the position in this slot last changed
+        if self.last_change[slot] is None:
+            return float('nan')
+        return self.last_time - self.last_change[slot]
+
+    def snapshot(self):
+        return {
+            'packets': self.packets,
+            'lost': self.lost,
+            'gaps': self.gaps,
+            'reordered': self.reordered,
+            'duplicates': self.duplicates,
+            'resets': self.resets,
+            'loss_ratio': self.lost / (self.packets + self.lost) if self.packets else 0.0,
+            'inter_arrival': self.inter_arrival.snapshot(),
+            'jitter': self.jitter.snapshot(),
+            'gap_size': self.gap_size.snapshot(),
+            'staleness': [h.snapshot() for h in self.staleness],
+            'current_staleness': [self.current_staleness(0), self.current_staleness(1)],
+            'not_detected': list(self.not_detected),
+        }
+
+
+class TelemetryStats:
+    # Receiver consumer, add it with receiver.add_reporter() as well for periodic dumps
+    def __init__(self, nominal_hz=None):
+        # nominal_hz: fixed send rate for the jitter, None measures it per port
+        self.nominal_hz = nominal_hz
+        self.sources = {}
+        self.kinds = {}
+
+    def __call__(self, batch):
+        source = self.sources.get(batch.port)
+        if source is None:
+            source = self.sources[batch.port] = SourceStats(self.nominal_hz)
+        if len(batch.packets):
+            self.kinds[batch.port] = int(batch.packets['kind'][-1])
+        source.update(batch.recv_time, batch.packets)
+
+    def query(self, port=None):
+        # Snapshot dict of one port, or {port: snapshot} for all of them
+        if port is not None:
+            return self.sources[port].snapshot()
+        return {p: s.snapshot() for p, s in self.sources.items()}
+
+    def dump(self):
+        # One compact line per port, times in ms
+        lines = []
+        for port, s in sorted(self.sources.items()):
+            q = s.snapshot()
+            names = telemetry.SLOT_NAMES.get(self.kinds.get(port), ("a", "b"))
+            ia, jit = q['inter_arrival'], q['jitter']
+            stale = " ".join(
+                f"{names[i]} p50/p99/now={h['p50'] * 1e3:.0f}/{h['p99'] * 1e3:.0f}/{q['current_staleness'][i] * 1e3:.0f}"
+                for i, h in enumerate(q['staleness']))
+            lines.append(
+                f"port {port}: dt p50/p99 {ia['p50'] * 1e3:.2f}/{ia['p99'] * 1e3:.2f} "
+                f"jitter p99 {jit['p99'] * 1e3:.2f} | lost {q['lost']} ({100 * q['loss_ratio']:.2f}%) "
+                f"gaps {q['gaps']} reordered {q['reordered']} dup {q['duplicates']} resets {q['resets']} | stale {stale}")
+        return "\n".join(lines)
+
+    def report(self, elapsed):
+        return self.dump()
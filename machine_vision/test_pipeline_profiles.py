@@ -0,0 +1,86 @@
+# Builds every profile of profiles.json against mock_dai.py and checks the --mock sweep output,
+# no camera needed:  python -m pytest test_pipeline_profiles.py
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+import pytest
+
+import device_loop
+import mock_dai
+import pipeline_profiles
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def link_names(pipeline):
+    # Counter of (source node, port, destination node, port) by node type name
+    return Counter((type(src.node).__name__, src.name, type(dst.node).__name__, dst.name)
+                   for src, dst in pipeline.links)
+
+
+@pytest.mark.parametrize("name", pipeline_profiles.names())
+def test_profile_builds_against_mock_dai(name):
+    profile = pipeline_profiles.load(name)
+    pipeline = pipeline_profiles.build(profile, mock_dai)
+
+    assert Counter(type(n).__name__ for n in pipeline.nodes) == Counter(
+        ColorCamera=1, MonoCamera=2, StereoDepth=1, YoloSpatialDetectionNetwork=1, IMU=1, Script=1)
+    assert link_names(pipeline) == Counter({
+        ('MonoCamera', 'out', 'StereoDepth', 'left'): 1,
+        ('MonoCamera', 'out', 'StereoDepth', 'right'): 1,
+        ('StereoDepth', 'depth', 'YoloSpatialDetectionNetwork', 'inputDepth'): 1,
+        ('ColorCamera', 'preview', 'YoloSpatialDetectionNetwork', 'input'): 1,
+        ('YoloSpatialDetectionNetwork', 'out', 'Script', device_loop.SCRIPT_INPUT): 1,
+        ('IMU', 'out', 'Script', device_loop.SCRIPT_INPUT): 1,
+    })
+
+    camera = pipeline.find("ColorCamera")[0].settings
+    assert camera['setFps'] == profile['fps']
+    assert camera['setPreviewSize'] == tuple(profile['preview'])
+    network = pipeline.find("YoloSpatialDetectionNetwork")[0].settings
+    assert network['setNumClasses'] == profile['num_classes']
+    assert network['setBlobPath'].endswith(profile['blob'])
+    imu = pipeline.find("IMU")[0].settings
+    assert (profile['imu_sensor'], profile['imu_rate']) in imu['enableIMUSensor']
+    assert len(imu['enableIMUSensor']) == (3 if profile['raw_imu'] else 1)
+
+    script = pipeline.find("Script")[0]
+    assert script.settings['setProcessor'] == "LEON_CSS"
+    config = device_loop.host_config(pipeline_profiles.loop_config(profile))
+    assert script.settings['setScript'].endswith("run(node, " + repr(config) + ")\n")
+    assert config['port'] == profile['port'] and config['camera_id'] == profile['camera_id']
+    queue = script.inputs[device_loop.SCRIPT_INPUT].settings
+    assert queue['blocking'] is False
+    assert queue['queue_size'] == profile['detection_queue'] + profile['imu_queue']
+
+
+def test_taps_add_the_sweep_outputs():
+    pipeline = pipeline_profiles.build(pipeline_profiles.load("claw"), mock_dai, taps=True)
+    streams = sorted(n.settings['setStreamName'] for n in pipeline.find("XLinkOut"))
+    assert streams == sorted([pipeline_profiles.TAP_DETECTIONS, pipeline_profiles.TAP_IMU])
+    links = link_names(pipeline)
+    assert links[('YoloSpatialDetectionNetwork', 'out', 'XLinkOut', 'input')] == 1
+    assert links[('IMU', 'out', 'XLinkOut', 'input')] == 1
+
+
+def test_mock_sweep_is_labelled_simulated(tmp_path):
+    out = tmp_path / "sweep.json"
+    result = subprocess.run(
+        [sys.executable, "pipeline_profiles.py", "sweep", "claw", "--mock", "--duration", "2",
+         "--grid", "fps=10,15", "--json", str(out)],
+        cwd=HERE, capture_output=True, text=True, check=True)
+    lines = result.stdout.splitlines()
+    assert lines[0].startswith("SIMULATED")
+    assert sum("fps=" in line for line in lines) == 2
+    rows = json.loads(out.read_text())
+    assert len(rows) == 2 and all(row['simulated'] for row in rows)
+
+
+def test_sweep_needs_device_or_mock():
+    result = subprocess.run([sys.executable, "pipeline_profiles.py", "sweep", "claw"],
+                            cwd=HERE, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "--device" in result.stderr and "--mock" in result.stderr
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# Multi-object tracker with persistent ids for the DETECTIONS stream (device_loop.py with
+# all_detections), for when a frame holds more than one payload/ball and the one slot per label of
+# the state packet can only report the last of them.
+#
+# Every frame is one vectorized step over all tracks and detections:
+#   1. predict every track to the frame time (constant velocity from its last update)
+#   2. cost matrix of squared predicted track vs detection distances, infeasible where the labels
+#      differ or the distance is above the track's gate (gate grows with the time since the last
+#      detection)
+#   3. pairs that are alone in their row and column are matched directly, only the rows and columns
+#      left over (objects close to each other) go to the optimal assignment: scipy's
+#      linear_sum_assignment when scipy is installed, hungarian() below otherwise. In normal scenes
+#      that block stays a few rows, so the cost per frame stays flat with dozens of objects.
+#   4. matched tracks get an alpha-beta update, unmatched detections start tentative tracks,
+#      tentative tracks die on their first miss, confirmed ones after max_coast seconds unseen
+# Ids are 16 bit and count up per tracker (one tracker per camera). The result is published as
+# one TRACKS datagram per frame (telemetry.py).
+#
+#   python tracker.py live --out 127.0.0.1:5012      # tracks of every camera (DETECTIONS_PORTS)
+#   python tracker.py bench --objects 5 10 25 50 100  # synthetic scenes, cost per frame and id switches
+import argparse
+import select
+import socket
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import telemetry
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+INFEASIBLE = 1e9  # cost of pairs outside the gate inside the assignment block
+
+TrackState = namedtuple("TrackState", ["ids", "labels", "status", "positions", "velocities", "misses"])
+
+
+def hungarian(cost):
+    # Minimum cost assignment of a (n, m) cost matrix, rows and columns like linear_sum_assignment.
+    # Shortest augmenting path with potentials, one row at a time with the column scan vectorized.
+    # Warm start: every row whose cheapest column is nobody else's cheapest takes it (the row minima
+    # are feasible potentials), only the remaining rows are augmented.
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # row (1-based) assigned to each column, 0 = free
+    way = np.zeros(m + 1, dtype=np.int64)
+    u[1:] = cost.min(axis=1)
+    cheapest = cost.argmin(axis=1)
+    unique = np.bincount(cheapest, minlength=m)[cheapest] == 1
+    owner[cheapest[unique] + 1] = np.flatnonzero(unique) + 1
+    for i in (np.flatnonzero(~unique) + 1).tolist():
+        owner[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    cols = np.flatnonzero(owner[1:])
+    rows = owner[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def solver(name=None):
+    # "scipy", "numpy" or None for scipy when it is installed
+    if name == "scipy" or (name is None and linear_sum_assignment is not None):
+        if linear_sum_assignment is None:
+            raise ImportError("scipy is not installed")
+        return linear_sum_assignment
+    return hungarian
+
+
+def associate(cost, feasible, assign=None):
+    # Matched (track, detection) index pairs among the feasible ones. Unambiguous pairs are taken
+    # directly, the rest is one optimal assignment over the ambiguous rows and columns.
+    assign = assign or solver()
+    row_count = feasible.sum(axis=1)
+    col_count = feasible.sum(axis=0)
+    alone = feasible & (row_count[:, None] == 1) & (col_count[None, :] == 1)
+    rows, cols = np.nonzero(alone)
+    ambiguous_rows = np.flatnonzero(row_count > 0)
+    ambiguous_rows = ambiguous_rows[~np.isin(ambiguous_rows, rows)]
+    if len(ambiguous_rows):
+        ambiguous_cols = np.flatnonzero(feasible[ambiguous_rows].any(axis=0))
+        block = np.where(feasible[np.ix_(ambiguous_rows, ambiguous_cols)],
+                         cost[np.ix_(ambiguous_rows, ambiguous_cols)], INFEASIBLE)
+        r, c = assign(block)
+        ok = block[r, c] < INFEASIBLE
+        rows = np.concatenate([rows, ambiguous_rows[r[ok]]])
+        cols = np.concatenate([cols, ambiguous_cols[c[ok]]])
+    return rows, cols
+
+
+class Tracker:
+    def __init__(self, gate=300.0, gate_growth=1500.0, alpha=0.6, beta=0.2, min_hits=3, max_coast=0.5,
+                 assign=None):
+        # Units are mm and s: gate is the association radius right after a detection, it grows by
+        # gate_growth per second without one (max speed of an object that is not seen)
+        self.gate = gate
+        self.gate_growth = gate_growth
+        self.alpha = alpha
+        self.beta = beta
+        self.min_hits = min_hits
+        self.max_coast = max_coast
+        self.assign = assign or solver()
+        self.next_id = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.positions = np.zeros((0, 3))  # at the time of the last update
+        self.velocities = np.zeros((0, 3))
+        self.updated = np.zeros(0)  # time of the last detection
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)  # frames since the last detection
+        self.t = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predict(self, t):
+        return self.positions + self.velocities * (t - self.updated)[:, None]
+
+    def update(self, t, labels, positions):
+        # One frame of detections at time t (s): labels (D,), positions (D, 3) mm. Returns the track
+        # id of every detection.
+        labels = np.asarray(labels, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.t = t
+        predicted = self.predict(t)
+        age = t - self.updated
+        # |p - d|^2 = |p|^2 + |d|^2 - 2 p.d, one matmul instead of a (T, D, 3) difference array
+        cost = np.einsum('ti,ti->t', predicted, predicted)[:, None] + np.einsum('di,di->d', positions, positions)
+        cost = np.maximum(cost - 2.0 * predicted @ positions.T, 0.0)
+        gates = self.gate + self.gate_growth * age
+        feasible = (cost <= (gates * gates)[:, None]) & (self.labels[:, None] == labels[None, :])
+        rows, cols = associate(cost, feasible, self.assign)
+
+        # Alpha-beta update of the matched tracks, velocity from the residual over the time since
+        # their last detection
+        residual = positions[cols] - predicted[rows]
+        dt = np.maximum(age[rows], 1e-3)
+        first = self.hits[rows] == 1  # second detection: velocity straight from the two positions
+        self.velocities[rows] += np.where(first, 1.0, self.beta)[:, None] * residual / dt[:, None]
+        self.positions[rows] = predicted[rows] + self.alpha * residual
+        self.positions[rows[first]] = positions[cols[first]]
+        self.updated[rows] = t
+        self.hits[rows] += 1
+        matched = np.zeros(len(self.ids), dtype=bool)
+        matched[rows] = True
+        self.misses[matched] = 0
+        self.misses[~matched] += 1
+
+        # Unmatched tentative tracks and confirmed ones unseen for max_coast die
+        confirmed = self.hits >= self.min_hits
+        alive = matched | (confirmed & (t - self.updated <= self.max_coast))
+        detection_ids = np.full(len(labels), -1, dtype=np.int64)
+        detection_ids[cols] = self.ids[rows]
+
+        # Every unmatched detection starts a tentative track
+        born = np.ones(len(labels), dtype=bool)
+        born[cols] = False
+        n = int(born.sum())
+        new_ids = (self.next_id + np.arange(n)) & 0xFFFF
+        self.next_id = (self.next_id + n) & 0xFFFF
+        detection_ids[born] = new_ids
+        self.ids = np.concatenate([self.ids[alive], new_ids])
+        self.labels = np.concatenate([self.labels[alive], labels[born]])
+        self.positions = np.concatenate([self.positions[alive], positions[born]])
+        self.velocities = np.concatenate([self.velocities[alive], np.zeros((n, 3))])
+        self.updated = np.concatenate([self.updated[alive], np.full(n, t)])
+        self.hits = np.concatenate([self.hits[alive], np.ones(n, dtype=np.int64)])
+        self.misses = np.concatenate([self.misses[alive], np.zeros(n, dtype=np.int64)])
+        return detection_ids
+
+    def state(self, confirmed_only=True):
+        # Tracks predicted to the last frame time
+        if self.t is None:
+            keep = np.zeros(0, dtype=np.int64)
+        else:
+            keep = np.flatnonzero(self.hits >= self.min_hits) if confirmed_only else np.arange(len(self.ids))
+        status = np.where(self.hits[keep] < self.min_hits, telemetry.TRACK_TENTATIVE,
+                          np.where(self.misses[keep] > 0, telemetry.TRACK_COASTING, telemetry.TRACK_CONFIRMED))
+        positions = self.predict(self.t)[keep] if self.t is not None else self.positions[keep]
+        return TrackState(self.ids[keep], self.labels[keep], status, positions, self.velocities[keep],
+                          self.misses[keep])
+
+
+def synthetic_scene(n_objects, frames=300, fps=15.0, labels=2, noise=15.0, miss=0.1, clutter=0.5,
+                    speed=800.0, seed=0):
+    # Objects bouncing in a 3 x 2 x 3 m volume in front of the camera, detected with noise, missed
+    # with probability miss and clutter false detections per frame on average. Yields (t, labels,
+    # positions, truth) per frame, truth is the object index of every detection (-1 = clutter).
+    rng = np.random.default_rng(seed)
+    lo = np.array([-1500.0, -1000.0, 500.0])
+    hi = np.array([1500.0, 1000.0, 3500.0])
+    position = rng.uniform(lo, hi, (n_objects, 3))
+    velocity = rng.normal(0.0, speed / np.sqrt(3), (n_objects, 3))
+    label = rng.integers(0, labels, n_objects)
+    dt = 1.0 / fps
+    for frame in range(frames):
+        position += velocity * dt
+        out = (position < lo) | (position > hi)
+        velocity[out] *= -1.0
+        position = np.clip(position, lo, hi)
+        seen = np.flatnonzero(rng.random(n_objects) >= miss)
+        k = rng.poisson(clutter)
+        detections = np.concatenate([position[seen] + rng.normal(0.0, noise, (len(seen), 3)),
+                                     rng.uniform(lo, hi, (k, 3))])
+        truth = np.concatenate([seen, np.full(k, -1)])
+        order = rng.permutation(len(truth))
+        yield (frame * dt, np.concatenate([label[seen], rng.integers(0, labels, k)])[order],
+               detections[order], truth[order])
+
+
+def id_switches(history):
+    # Id switches: a detected object getting another track id than the last time it was detected
+    last = {}
+    switches = 0
+    for truth, ids in history:
+        for obj, track in zip(truth.tolist(), ids.tolist()):
+            if obj < 0:
+                continue
+            if obj in last and last[obj] != track:
+                switches += 1
+            last[obj] = track
+    return switches
+
+
+def benchmark(n_objects, frames=300, method=None, seed=0):
+    scene = list(synthetic_scene(n_objects, frames, seed=seed))
+    tracker = Tracker(assign=solver(method))
+    times = []
+    history = []
+    for t, labels, positions, truth in scene:
+        start = time.perf_counter()
+        ids = tracker.update(t, labels, positions)
+        times.append(time.perf_counter() - start)
+        history.append((truth, ids))
+    times = np.array(times[10:]) * 1e6  # after the tracks are confirmed
+    detections = sum(int((truth >= 0).sum()) for truth, _ in history)
+    return {
+        'us_per_frame': float(times.mean()),
+        'p99_us': float(np.percentile(times, 99)),
+        'id_switches': id_switches(history),
+        'detections': detections,
+        'tracks': len(tracker.state().ids),
+    }
+
+
+def live(ports, out, host="0.0.0.0", trackers=None):
+    # Tracks every camera's DETECTIONS datagrams and sends one TRACKS datagram per frame to out
+    trackers = {} if trackers is None else trackers  # camera_id -> Tracker
+    encoders = {}
+    sockets = []
+    for port in ports:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        sockets.append(sock)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    buffer = bytearray(65536)
+    while True:
+        readable, _, _ = select.select(sockets, [], [])
+        for sock in readable:
+            size = sock.recv_into(buffer)
+            try:
+                frame = telemetry.decode_detections(memoryview(buffer)[:size])
+            except ValueError:
+                continue
+            camera = frame.camera_id
+            if camera not in trackers:
+                trackers[camera] = Tracker()
+                encoders[camera] = telemetry.TracksEncoder(camera)
+            tracker = trackers[camera]
+            detections = frame.detections
+            tracker.update(frame.timestamp_us / 1e6, detections['label'], detections['pos'])
+            s = tracker.state()
+            n = min(len(s.ids), telemetry.TRACKS_MAX)
+            sender.sendto(encoders[camera].pack(s.ids[:n], s.labels[:n], s.status[:n], s.positions[:n],
+                                                s.velocities[:n], s.misses[:n], frame.timestamp_us,
+                                                frame.flags), out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-object tracker for the all_detections stream")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("live", help="track the cameras and publish TRACKS packets")
+    p.add_argument("--ports", type=int, nargs="*", default=sorted(telemetry.DETECTIONS_PORTS))
+    p.add_argument("--out", default="127.0.0.1:5012", help="host:port for the TRACKS packets")
+    p = sub.add_parser("bench", help="synthetic scenes: cost per frame and id switches")
+    p.add_argument("--objects", type=int, nargs="*", default=[2, 5, 10, 25, 50, 100])
+    p.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        methods = ["numpy"] + (["scipy"] if linear_sum_assignment is not None else [])
+        for n in args.objects:
+            line = []
+            for method in methods:
+                r = benchmark(n, args.frames, method)
+                line.append(f"{method} {r['us_per_frame']:7.1f} us (p99 {r['p99_us']:7.1f})")
+            print(f"{n:4d} objects: {', '.join(line)}, {r['id_switches']} id switches in "
+                  f"{r['detections']} detections, {r['tracks']} tracks at the end")
+    else:
+        host, port = args.out.rsplit(":", 1)
+        live(args.ports, (host, int(port)))
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# Object/zone relations for any number of objects and zones, all pairs in one vectorized pass.
+#
+# Zones are axis-aligned boxes (center and half size in mm): fixed ones from zones.json (landing
+# zones, keep-out areas) and detected ones, the slots listed under "detected" (the "zone" slot of
+# the payload camera) with a configured half size. Every other detected slot is an object, a
+# point with an optional half size of its own. For every object/zone pair relate() gives
+#   contained: the object point is inside the zone box
+#   distance:  Euclidean distance from the point to the zone box, 0 inside
+#   overlap:   the object box and the zone box intersect
+# With more than index_threshold pairs only the pairs that share a cell of a uniform grid are
+# tested (a spatial hash join done with one sort and searchsorted): zones are entered into every
+# cell their box grown by `near` touches, so pairs that are not candidates are farther than near
+# and get distance inf. Objects that are not detected (NaN) relate to nothing.
+#
+# The engine is a receiver.py consumer: it keeps the newest packet of every camera, converts the
+# positions to the base frame with frames.py and publishes one telemetry ZONES packet per batch.
+# This replaces one hand-written test per object pair, a second payload or landing zone is one
+# more entry in zones.json.
+#
+#   python zones.py live --zones zones.json --frames frames.json --out 127.0.0.1:5011
+#   python zones.py bench --objects 50 --zones 50
+# zones.json:
+#   {"zones": [{"name": "landing", "center": [0, 0, 0], "half_size": [400, 400, 200]}],
+#    "detected": {"zone": [300, 300, 150]},
+#    "object_half_size": {"payload": [150, 150, 150], "ball": [60, 60, 60]}}
+import argparse
+import json
+import socket
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import telemetry
+
+Relations = namedtuple("Relations", ["contained", "distance", "overlap"])
+
+
+def relate_dense(points, extents, centers, half_sizes):
+    # Relations of every object (N) with every zone (M) as (N, M) arrays
+    offset = np.abs(points[:, None, :] - centers[None, :, :])
+    contained = (offset < half_sizes).all(axis=-1)
+    overlap = (offset < half_sizes + extents[:, None, :]).all(axis=-1)
+    outside = np.maximum(offset - half_sizes, 0.0)
+    distance = np.sqrt(np.einsum('nmi,nmi->nm', outside, outside))
+    # Undetected objects (NaN) and undetected zones (NaN center) relate to nothing
+    missing = np.isnan(points[:, 0])
+    contained[missing] = False
+    overlap[missing] = False
+    distance[missing] = np.inf
+    unseen = np.isnan(centers[:, 0])
+    contained[:, unseen] = False
+    overlap[:, unseen] = False
+    distance[:, unseen] = np.inf
+    return Relations(contained, distance, overlap)
+
+
+def cell_keys(cells):
+    # int64 key of integer cell coordinates (..., 3), exact within +-2^20 cells per axis
+    c = cells.astype(np.int64) & 0x1FFFFF
+    return (c[..., 0] << 42) | (c[..., 1] << 21) | c[..., 2]
+
+
+class GridIndex:
+    # Uniform grid over the zone boxes grown by `near` (plus the largest object half size)
+    def __init__(self, centers, half_sizes, near, cell=None):
+        reach = half_sizes + near
+        if cell is None:
+            cell = max(float(2 * reach.max()), 1.0) if len(centers) else 1.0
+        self.cell = cell
+        lo = np.floor((centers - reach) / cell).astype(np.int64)
+        hi = np.floor((centers + reach) / cell).astype(np.int64)
+        span = hi - lo
+        # Every zone covers at most span + 1 cells per axis, enumerate them all at once
+        steps = np.arange(int(span.max()) + 1 if len(centers) else 1)
+        grid = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape(-1, 3)
+        valid = (grid[None, :, :] <= span[:, None, :]).all(axis=-1)
+        zone, which = np.nonzero(valid)
+        keys = cell_keys(lo[zone] + grid[which])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.zones = zone[order]
+
+    def candidates(self, points):
+        # (object index, zone index) of every pair that shares a cell
+        keys = cell_keys(np.floor(points / self.cell))
+        left = np.searchsorted(self.keys, keys, 'left')
+        right = np.searchsorted(self.keys, keys, 'right')
+        counts = right - left
+        objects = np.repeat(np.arange(len(points)), counts)
+        starts = np.repeat(left - (np.cumsum(counts) - counts), counts)
+        return objects, self.zones[np.arange(counts.sum()) + starts]
+
+
+class ZoneSet:
+    def __init__(self, centers, half_sizes, names=None, near=500.0, index_threshold=4096):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.half_sizes = np.asarray(half_sizes, dtype=np.float64).reshape(-1, 3)
+        self.names = list(names) if names is not None else [f"zone{i}" for i in range(len(self.centers))]
+        self.near = near
+        self.index_threshold = index_threshold
+        self.index = None
+        self.index_extent = None
+
+    def __len__(self):
+        return len(self.centers)
+
+    def relate_pairs(self, points, extents=None):
+        # Relations of the candidate pairs from the grid: (objects, zones, Relations of 1-d arrays)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        extents = np.zeros_like(points) if extents is None else np.broadcast_to(extents, points.shape)
+        extent = float(extents.max(initial=0.0))
+        if self.index is None or extent > self.index_extent:
+            # Built once per zone set, again only when an object is larger than any before
+            known = ~np.isnan(self.centers[:, 0])
+            index = GridIndex(self.centers[known], self.half_sizes[known] + extent, self.near)
+            index.zones = np.flatnonzero(known)[index.zones]
+            self.index, self.index_extent = index, extent
+        detected = np.flatnonzero(~np.isnan(points[:, 0]))
+        objects, zones = self.index.candidates(points[detected])
+        objects = detected[objects]
+        offset = np.abs(points[objects] - self.centers[zones])
+        half = self.half_sizes[zones]
+        contained = (offset < half).all(axis=-1)
+        overlap = (offset < half + extents[objects]).all(axis=-1)
+        outside = np.maximum(offset - half, 0.0)
+        distance = np.sqrt(np.einsum('pi,pi->p', outside, outside))
+        return objects, zones, Relations(contained, distance, overlap)
+
+    def relate(self, points, extents=None, centers=None, half_sizes=None):
+        # (N, M) Relations, dense below index_threshold pairs, from the grid above it. Detected
+        # zones (K centers and half sizes, NaN = not detected) are related densely and appended as
+        # K more columns, so the grid over the fixed zones is not rebuilt when they move.
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        extents = np.zeros_like(points) if extents is None else np.broadcast_to(extents, points.shape)
+        n, m = len(points), len(self)
+        if n * m <= self.index_threshold:
+            relations = relate_dense(points, extents, self.centers, self.half_sizes)
+        else:
+            objects, zones, pairs = self.relate_pairs(points, extents)
+            contained = np.zeros((n, m), dtype=bool)
+            overlap = np.zeros((n, m), dtype=bool)
+            distance = np.full((n, m), np.inf)
+            contained[objects, zones] = pairs.contained
+            overlap[objects, zones] = pairs.overlap
+            distance[objects, zones] = pairs.distance
+            relations = Relations(contained, distance, overlap)
+        if centers is None or not len(centers):
+            return relations
+        detected = relate_dense(points, extents, np.asarray(centers, dtype=np.float64).reshape(-1, 3),
+                                np.asarray(half_sizes, dtype=np.float64).reshape(-1, 3))
+        return Relations(*(np.concatenate(pair, axis=1) for pair in zip(relations, detected)))
+
+
+def nearest(relations, near=np.inf):
+    # Nearest zone per object (-1 if none within near) and the distance to it
+    if relations.distance.shape[1] == 0:
+        n = relations.distance.shape[0]
+        return np.full(n, -1), np.full(n, np.inf)
+    index = np.argmin(relations.distance, axis=1)
+    distance = relations.distance[np.arange(len(index)), index]
+    index = np.where(distance <= near, index, -1)
+    return index, np.where(index >= 0, distance, np.inf)
+
+
+class ZoneEngine:
+    def __init__(self, config, transformer=None, address=None):
+        # config: parsed zones.json, transformer: frames.FrameTransformer (identity if None)
+        fixed = config.get('zones', [])
+        self.zones = ZoneSet([z['center'] for z in fixed], [z['half_size'] for z in fixed],
+                             [z['name'] for z in fixed], near=config.get('near', 500.0))
+        self.detected = config.get('detected', {})
+        self.object_half_size = config.get('object_half_size', {})
+        self.transformer = transformer
+        self.latest = {}  # camera_id -> newest packet
+        self.encoder = telemetry.ZonesEncoder()
+        self.address = address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if address else None
+        self.state = None
+
+    def observations(self):
+        # Objects (names, positions, extents) and detected zones (names, centers, half sizes) of the
+        # newest packet of every camera, in the base frame
+        if not self.latest:
+            return [], np.zeros((0, 3)), np.zeros((0, 3)), [], np.zeros((0, 3)), np.zeros((0, 3))
+        packets = np.stack(list(self.latest.values()))
+        if self.transformer is not None:
+            positions = self.transformer.packets(packets)
+        else:
+            positions = np.where(telemetry.detected(packets['pos'])[..., None], packets['pos'], np.nan)
+        objects, zones = [], []
+        for packet, slots in zip(packets, positions):
+            names = telemetry.SLOT_NAMES.get(int(packet['kind']), ())
+            for name, position in zip(names, slots):
+                label = f"{name}@{int(packet['camera_id'])}"
+                if name in self.detected:
+                    zones.append((label, position, self.detected[name]))
+                else:
+                    objects.append((label, position, self.object_half_size.get(name, (0.0, 0.0, 0.0))))
+
+        def unzip(items):
+            return ([i[0] for i in items], np.array([i[1] for i in items], dtype=np.float64).reshape(-1, 3),
+                    np.array([i[2] for i in items], dtype=np.float64).reshape(-1, 3))
+
+        return unzip(objects) + unzip(zones)
+
+    def evaluate(self, now=None):
+        object_names, points, extents, zone_names, centers, half_sizes = self.observations()
+        relations = self.zones.relate(points, extents, centers, half_sizes)
+        index, distance = nearest(relations, self.zones.near)
+        self.state = (object_names, self.zones.names + zone_names, relations, index, distance)
+        if self.socket is not None:
+            now = time.time() if now is None else now
+            self.socket.sendto(self.encoder.pack(relations.contained, relations.overlap, index, distance,
+                                                 int(now * 1e6)), self.address)
+        return self.state
+
+    def __call__(self, batch):
+        # receiver.py consumer
+        for camera_id in np.unique(batch.packets['camera_id']):
+            last = np.flatnonzero(batch.packets['camera_id'] == camera_id)[-1]
+            self.latest[int(camera_id)] = batch.packets[last].copy()
+        self.evaluate()
+
+
+def load_config(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def benchmark(n_objects, n_zones, repeat=50, seed=0, extent=1000.0):
+    # us per relate() call, dense and grid indexed, on random boxes in a extent^3 mm volume
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, extent, (n_objects, 3))
+    centers = rng.uniform(0, extent, (n_zones, 3))
+    half = rng.uniform(20, 80, (n_zones, 3))
+    dense = ZoneSet(centers, half, index_threshold=np.inf)
+    indexed = ZoneSet(centers, half, near=100.0, index_threshold=0)
+    result = {}
+    for name, zones in (("dense", dense), ("grid", indexed)):
+        zones.relate(points)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            relations = zones.relate(points)
+        result[name] = ((time.perf_counter() - start) / repeat * 1e6, relations)
+    dense, grid = result['dense'][1], result['grid'][1]
+    # Pairs farther than near are inf on the grid, only the ones within near must agree
+    close = dense.distance <= indexed.near
+    same = (np.array_equal(dense.contained, grid.contained) and np.array_equal(dense.overlap, grid.overlap)
+            and np.allclose(dense.distance[close], grid.distance[close])
+            and np.all(grid.distance[~close] >= indexed.near))
+    return result['dense'][0], result['grid'][0], same
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Object/zone containment, overlap and distance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    live = sub.add_parser("live", help="evaluate the camera telemetry and publish ZONES packets")
+    live.add_argument("--zones", required=True, help="zones.json")
+    live.add_argument("--frames", help="frames.json, positions stay in the camera frame if not given")
+    live.add_argument("--out", default="127.0.0.1:5011", help="host:port for the ZONES packets")
+    live.add_argument("--ports", type=int, nargs="*", default=[5007, 5008])
+    bench = sub.add_parser("bench", help="time dense and grid indexed evaluation")
+    bench.add_argument("--objects", type=int, nargs="*", default=[2, 10, 50, 200, 1000])
+    bench.add_argument("--zones", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        for n in args.objects:
+            dense_us, grid_us, same = benchmark(n, args.zones)
+            print(f"{n:5d} objects x {args.zones} zones: dense {dense_us:8.1f} us, grid {grid_us:8.1f} us"
+                  f"{'' if same else '  (results differ!)'}")
+    else:
+        from receiver import TelemetryReceiver
+
+        transformer = None
+        if args.frames:
+            from frames import load_frames
+            transformer = load_frames(args.frames)
+        host, port = args.out.rsplit(":", 1)
+        engine = ZoneEngine(load_config(args.zones), transformer, (host, int(port)))
+        receiver = TelemetryReceiver(args.ports)
+        receiver.add_consumer(engine)
+        receiver.run()